@@ -85,10 +85,45 @@ DATABASES = {
     }
 }
 
+# Price endpoint responses, evicted least recently used first once RESPONSE_CACHE_ENTRIES is reached.
+# Entries are keyed on the ingest/forecast generation, so they never need explicit invalidation.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 86400,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("RESPONSE_CACHE_ENTRIES") or 1000),
+        },
+    }
+}
+# How often a worker re-reads the generation counters, i.e. how stale a cached response can be
+GENERATION_CHECK_SECONDS = float(os.getenv("GENERATION_CHECK_SECONDS") or 5)
+
+# Price endpoint responses with more entries than this are streamed
+STREAM_MIN_POINTS = int(os.getenv("STREAM_MIN_POINTS") or 5000)
+
+# Default and largest page of the price_history endpoint, also the rows read per chunk of an NDJSON export
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE") or 1000)
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE") or 10000)
+# Threads per worker process reading NDJSON exports, apart from the ones serving requests
+EXPORT_THREADS = int(os.getenv("EXPORT_THREADS") or 2)
+
+# Read-only connections each worker process keeps open per database, how long a request
+# waits for one when all are busy, and the compiled statements cached per connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 8)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT") or 10)
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE") or 256)
+
 # Fuel price database
 FUEL_DB_PATH = os.getenv("DB_PATH")
 FUEL_PREDICT_DB_PATH = os.getenv("DB_PREDICT_PATH")
 POSTCODE_DB_PATH = os.getenv("POSTCODE_DB_PATH")
+# Load the postcode gazetteer at startup instead of on the first geo request
+POSTCODE_WARMUP = os.getenv("POSTCODE_WARMUP", "False") == "True"
+COLD_STORAGE_PATH = os.getenv("COLD_STORAGE_PATH")
+# nearby_stations search radius when the request gives none, and the largest radius a request may ask for
+NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM") or 5)
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM") or 50)
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,154 @@
+"""
+Concurrency benchmark for the backend served over WSGI (gunicorn, one worker with
+--threads threads) and over ASGI (uvicorn, one worker, DB_POOL_SIZE=--threads).
+
+Builds synthetic fuel price and forecast databases, then against each server:
+  - sends --concurrency uncached /api/average_price_daily/ requests at once, each a
+    full rollup query over the synthetic history, and
+  - while those are in flight, times cached /api/average_price_predict/ requests.
+
+Under WSGI a slow request holds a worker thread until it finishes, so cached
+requests queue behind slow ones. Under ASGI the slow query only holds a database
+thread and the event loop keeps answering.
+
+Requires gunicorn and uvicorn.
+
+Usage:
+    python backend/benchmarks/bench_asgi.py --stations 1000 --days 365 --concurrency 16
+"""
+import argparse
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(ROOT)
+from database.DatabaseW import DatabaseW
+
+START = 1735689600  # 2025-01-01
+
+
+def make_databases(tmp, n_stations, n_days, seed=0):
+    rng = random.Random(seed)
+    db_path = os.path.join(tmp, "fuel_prices.db")
+    with patch("database.DatabaseW.Fetcher"):
+        database = DatabaseW(db_path, 0, None, None)
+    database.cursor.executemany("INSERT INTO stations (station_code, postcode) VALUES (?, ?)",
+                                [(str(code), "2000") for code in range(n_stations)])
+    database.cursor.executemany("""
+    INSERT INTO price_daily (fuel_type, day, station_code, price_sum, price_count, price_min, price_max)
+    VALUES ('E10', ?, ?, ?, 1, ?, ?)
+    """, (
+        (START + day * 86400, str(code), price, price, price)
+        for code in range(n_stations) for day in range(n_days)
+        for price in [round(rng.uniform(150, 230), 1)]
+    ))
+    database.conn.commit()
+    database.unload()
+
+    predict_db_path = os.path.join(tmp, "future_prices.db")
+    conn = sqlite3.connect(predict_db_path)
+    conn.execute("CREATE TABLE future_forecast (id INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL, forecast_price REAL NOT NULL, fuel_type TEXT NOT NULL)")
+    conn.executemany("INSERT INTO future_forecast (timestamp, forecast_price, fuel_type) VALUES (?, ?, 'E10')",
+                     [(START + (n_days + day) * 86400, 180.0 + day / 10) for day in range(30)])
+    conn.commit()
+    conn.close()
+    return db_path, predict_db_path
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port, threads, env):
+    if kind == "wsgi":
+        command = ["gunicorn", "--chdir", "backend", "backend.wsgi:application", "--workers", "1",
+                   "--threads", str(threads), "--bind", f"127.0.0.1:{port}", "--log-level", "warning"]
+    else:
+        command = ["uvicorn", "--app-dir", "backend", "backend.asgi:application",
+                   "--port", str(port), "--log-level", "warning"]
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/api/average_price_predict/", timeout=1)
+            return server, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def run(kind, args, env):
+    server, base_url = start_server(kind, free_port(), args.threads, env)
+    try:
+        fast_url = f"{base_url}/api/average_price_predict/?fuel_type=E10&start_date=2025-01-01&end_date=2026-12-31"
+        requests.get(fast_url).raise_for_status()
+        slow_url = f"{base_url}/api/average_price_daily/?fuel_type=E10&start_date=2025-01-01&end_date=2026-12-31&interval=D"
+
+        fast_latencies = []
+        done = threading.Event()
+        def poll_fast():
+            with requests.Session() as session:
+                while not done.is_set():
+                    start = time.perf_counter()
+                    session.get(fast_url).raise_for_status()
+                    fast_latencies.append(time.perf_counter() - start)
+
+        def slow(i):
+            start = time.perf_counter()
+            # A parameter the view ignores still makes every request a cache miss
+            requests.get(f"{slow_url}&bench={kind}-{i}").raise_for_status()
+            return time.perf_counter() - start
+
+        poller = threading.Thread(target=poll_fast)
+        start = time.perf_counter()
+        poller.start()
+        with ThreadPoolExecutor(args.concurrency) as clients:
+            slow_latencies = list(clients.map(slow, range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        poller.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{kind.upper():<5} {args.concurrency} slow requests in {elapsed:6.2f} s   "
+          f"slow p50 {statistics.median(slow_latencies) * 1000:8.0f} ms   "
+          f"cached p50 {statistics.median(fast_latencies) * 1000:7.1f} ms   max {max(fast_latencies) * 1000:7.1f} ms   "
+          f"({len(fast_latencies)} cached served)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path, predict_db_path = make_databases(tmp, args.stations, args.days)
+        env = dict(os.environ, SECRET_KEY="bench", ALLOWED_HOSTS="127.0.0.1", DB_PATH=db_path,
+                   DB_PREDICT_PATH=predict_db_path, DB_POOL_SIZE=str(args.threads), GENERATION_CHECK_SECONDS="60")
+        print(f"{args.stations:,} stations x {args.days} days, {args.threads} threads")
+        for kind in ("wsgi", "asgi"):
+            run(kind, args, env)
+
+
+if __name__ == "__main__":
+    main()
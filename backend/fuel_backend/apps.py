@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
 
 class FuelBackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fuel_backend'
+
+    def ready(self):
+        # Otherwise the gazetteer is loaded by the first request that needs it
+        if settings.POSTCODE_WARMUP and settings.POSTCODE_DB_PATH and os.path.exists(settings.POSTCODE_DB_PATH):
+            from database.spatial import postcode_index
+            postcode_index(settings.POSTCODE_DB_PATH)
@@ -0,0 +1,139 @@
+"""
+Response cache for the price endpoints, invalidated by the generation counters
+DatabaseW and predict.save_forecast_to_db bump on every write.
+
+Generations are read from SQLite at most once per GENERATION_CHECK_SECONDS and
+shared through the cache, so a repeat request answered with 304 or a cached body
+never opens a database.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from datetime import date
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+import hashlib
+import sqlite3
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.connection import connect
+from .pool import run_blocking
+
+GENERATION_SOURCES = {
+    "prices": lambda: settings.FUEL_DB_PATH,
+    "forecast": lambda: settings.FUEL_PREDICT_DB_PATH,
+}
+
+def read_generation(db_path, name):
+    # Databases not yet written by an ingester or predictor that bumps generations
+    if not db_path or not os.path.exists(db_path):
+        return 0, None
+    conn = connect(db_path, read_only=True)
+    try:
+        row = conn.execute("SELECT value, updated_at FROM generations WHERE name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return tuple(row) if row else (0, None)
+
+def cached_generations(sources):
+    # The generations still in the cache, no database is opened
+    generations = {}
+    for source in sources:
+        generation = cache.get(f"generation:{source}")
+        if generation is not None:
+            generations[source] = generation
+    return generations
+
+def current_generations(sources):
+    """
+    Returns {source: (generation, updated_at)} for the given sources.
+    """
+    generations = cached_generations(sources)
+    for source in sources:
+        if source not in generations:
+            generation = read_generation(GENERATION_SOURCES[source](), source)
+            cache.set(f"generation:{source}", generation, settings.GENERATION_CHECK_SECONDS)
+            generations[source] = generation
+    return generations
+
+def normalise_params(query):
+    # Same parameters in any order, with blanks dropped, share one entry. Defaults
+    # resolved from today's date are covered by the date in the key.
+    return sorted((name, value.strip()) for name, values in query.lists() for value in values if value.strip())
+
+def validators(view, request, generations):
+    key = repr((view.__name__, normalise_params(request.GET), date.today().isoformat(), sorted(generations.items())))
+    etag = f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+    modified = [updated_at for _, updated_at in generations.values() if updated_at]
+    return etag, int(max(modified)) if modified else None
+
+def cached_response(request, etag, last_modified):
+    # A 304 for a matching validator, else the stored body, else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        cached = cache.get(f"response:{etag}")
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+    return response
+
+def store_response(response, etag):
+    # Streamed bodies are too large to hold, they still get validators
+    if not response.streaming:
+        cache.set(f"response:{etag}", (response.content, response["Content-Type"]))
+
+def add_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    # Let browsers keep the body but revalidate it on every load
+    response["Cache-Control"] = "no-cache"
+    return response
+
+def generation_cached(*sources, store=True):
+    """
+    Caches successful responses of a GET view keyed on its normalised query
+    parameters and the current generation of each source, and answers matching
+    If-None-Match / If-Modified-Since requests with 304. Works on sync and async views.
+
+    With store=False responses only get validators. For views whose bodies are
+    large and rarely requested twice, which would push out the ones worth keeping.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                # Only a generation re-read opens a database and needs the executor, cache
+                # hits and 304s never queue behind slow queries there
+                generations = cached_generations(sources)
+                if len(generations) < len(sources):
+                    generations = await run_blocking(current_generations, sources)
+                etag, last_modified = validators(view, request, generations)
+                response = cached_response(request, etag, last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    if store:
+                        store_response(response, etag)
+                return add_validators(response, etag, last_modified)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                generations = current_generations(sources)
+                etag, last_modified = validators(view, request, generations)
+                response = cached_response(request, etag, last_modified)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    if store:
+                        store_response(response, etag)
+                return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,179 @@
+"""
+Per-process pools of read-only DatabaseR instances, one pool per database file.
+
+Views borrow a reader for the length of a request instead of opening a connection
+each time, so the SQLite page cache and compiled statements survive between
+requests. Readers are handed out most recently used first, checked with a cheap
+query before reuse, and replaced when a query on them fails.
+
+    with reader(settings.FUEL_DB_PATH, make_reader) as db:
+        df = db.fetch_data(...)
+
+Async views run their blocking database work through run_blocking, on one
+bounded thread pool per process, so a slow query holds a thread but never the
+event loop. iterate_blocking does the same for each step of an iterator, for
+responses streamed straight from the database. Exports stream on threads of
+their own, so a long one never holds a thread that requests wait for.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from django.conf import settings
+import asyncio
+import queue
+import sqlite3
+import threading
+import pandas as pd
+
+class ReaderPool:
+    def __init__(self, factory, size=8, timeout=10.0):
+        self.factory = factory
+        self.timeout = timeout
+        # Most recently returned first, its pages are the most likely to still be cached
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.readers = set()
+
+    @property
+    def open_count(self):
+        with self.lock:
+            return len(self.readers)
+
+    @property
+    def idle_count(self):
+        return self.idle.qsize()
+
+    def healthy(self, db):
+        try:
+            db.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No database reader became free in time")
+        try:
+            while True:
+                try:
+                    db = self.idle.get_nowait()
+                except queue.Empty:
+                    db = self.factory()
+                    with self.lock:
+                        self.readers.add(db)
+                    return db
+                if self.healthy(db):
+                    return db
+                self.discard(db)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, db, broken=False):
+        if broken:
+            self.discard(db)
+        else:
+            self.idle.put(db)
+        self.slots.release()
+
+    def discard(self, db):
+        with self.lock:
+            self.readers.discard(db)
+        try:
+            db.conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def reader(self):
+        db = self.acquire()
+        broken = False
+        try:
+            yield db
+        except (sqlite3.Error, pd.errors.DatabaseError):
+            # Could be a corrupt or replaced file, never hand this connection out again.
+            # pd.read_sql_query re-raises SQLite errors as its own DatabaseError
+            broken = True
+            raise
+        finally:
+            self.release(db, broken)
+
+    def close(self):
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+@contextmanager
+def reader(db_path, factory, size=8, timeout=10.0):
+    """
+    Borrows a reader for db_path from its pool, creating the pool on first use.
+    factory() opens a new reader when the pool has none idle.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ReaderPool(factory, size, timeout)
+    with pool.reader() as db:
+        yield db
+
+def get_pool(db_path):
+    with _pools_lock:
+        return _pools.get(db_path)
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # One thread per pooled reader, so a thread never waits on the pool
+            _executor = ThreadPoolExecutor(max_workers=settings.DB_POOL_SIZE, thread_name_prefix="fuel-db")
+        return _executor
+
+_export_executor = None
+
+def export_executor():
+    global _export_executor
+    with _executor_lock:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(max_workers=settings.EXPORT_THREADS, thread_name_prefix="fuel-export")
+        return _export_executor
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), partial(func, *args, **kwargs))
+
+async def iterate_blocking(iterator, pool=None):
+    """
+    Async iterator over a blocking one, each next() run on pool, by default the
+    executor. Django streams an async iterator under ASGI, where it would read a
+    sync one to the end before sending anything.
+    """
+    loop = asyncio.get_running_loop()
+    pool = pool or executor()
+    iterator = iter(iterator)
+    done = object()
+    try:
+        while (item := await loop.run_in_executor(pool, next, iterator, done)) is not done:
+            yield item
+    finally:
+        # Closing a generator early runs its cleanup, e.g. closing its connection
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await loop.run_in_executor(pool, close)
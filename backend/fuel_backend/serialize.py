@@ -0,0 +1,134 @@
+"""
+JSON encoding for the price endpoints, straight from column arrays with orjson.
+
+Every endpoint returns rows (a list of objects) by default. Requests with
+format=columns get one array per field instead, e.g. {"dates": [...], "prices": [...]},
+which is smaller and quicker to build. Responses with more than STREAM_MIN_POINTS
+entries are streamed in chunks rather than encoded into one body. Exports use
+format=ndjson, one JSON object per line, streamed as the rows are read.
+"""
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+import numpy as np
+import orjson
+
+STREAM_CHUNK_POINTS = 1000
+CONTENT_TYPE = "application/json"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+def wants_columns(request):
+    return request.GET.get("format") == "columns"
+
+def column_values(values):
+    # Numeric arrays go to orjson as numpy, anything else as Python objects
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        return np.ascontiguousarray(values)
+    return values.tolist()
+
+def encode(data):
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def encode_items(items):
+    # Array contents without the brackets, for splicing into a streamed array
+    return encode(items)[1:-1]
+
+async def aiter_chunks(chunks):
+    # Under ASGI Django streams an async iterator, but reads a sync one to the end first.
+    # Each chunk is a few milliseconds of encoding, so it runs on the event loop
+    for chunk in chunks:
+        yield chunk
+
+def iter_rows(names, columns, size):
+    for start in range(0, size, STREAM_CHUNK_POINTS):
+        chunk = [column[start:start + STREAM_CHUNK_POINTS] for column in columns]
+        rows = [dict(zip(names, values)) for values in zip(*(values.tolist() for values in chunk))]
+        yield (b"," if start else b"") + encode_items(rows)
+
+def iter_columns(names, columns, size):
+    for position, (name, values) in enumerate(zip(names, columns)):
+        yield (b"," if position else b"{") + encode(name) + b":["
+        for start in range(0, size, STREAM_CHUNK_POINTS):
+            yield (b"," if start else b"") + encode_items(column_values(values[start:start + STREAM_CHUNK_POINTS]))
+        yield b"]"
+    yield b"}" if names else b"{}"
+
+def columns_response(request, names, columns, column_names=None):
+    """
+    Encodes equal-length columns as rows of {name: value} objects, or as
+    {column_name: [values]} when the request asks for format=columns.
+
+    Args:
+        names (list of str): Keys of each row object
+        columns (list of array-like): One array per name
+        column_names (list of str): Keys used by the columnar format, defaults to names
+    """
+    columns = [np.asarray(values) for values in columns]
+    size = len(columns[0]) if columns else 0
+    columnar = wants_columns(request)
+    if columnar:
+        names = column_names or names
+
+    if size > settings.STREAM_MIN_POINTS:
+        if columnar:
+            chunks = iter_columns(names, columns, size)
+        else:
+            chunks = (chunk for part in ([b"["], iter_rows(names, columns, size), [b"]"]) for chunk in part)
+        return StreamingHttpResponse(aiter_chunks(chunks), content_type=CONTENT_TYPE)
+
+    return HttpResponse(encode(columns_data(names, columns, columnar)), content_type=CONTENT_TYPE)
+
+def columns_data(names, columns, columnar):
+    if columnar:
+        return {name: column_values(values) for name, values in zip(names, columns)}
+    return [dict(zip(names, values)) for values in zip(*(values.tolist() for values in columns))]
+
+def series_response(request, dates, prices):
+    """
+    Encodes a date series as [{date, avg_price}], or {dates: [...], prices: [...]}
+    with format=columns.
+    """
+    return columns_response(request, ["date", "avg_price"], [dates, prices], column_names=["dates", "prices"])
+
+def frame_response(request, df):
+    return columns_response(request, list(df.columns), [df[column].to_numpy() for column in df.columns])
+
+def keyed_series_response(request, series):
+    """
+    Encodes several date series at once, keyed the same way as the series mapping,
+    e.g. {"E10": {"D": [{date, avg_price}]}}. Each series follows series_response's
+    format. Keyed responses are never streamed.
+
+    Args:
+        series (dict): Nested dicts whose leaves are (dates, prices) pairs
+    """
+    columnar = wants_columns(request)
+    def build(node):
+        if isinstance(node, dict):
+            return {key: build(value) for key, value in node.items()}
+        dates, prices = node
+        names = ["dates", "prices"] if columnar else ["date", "avg_price"]
+        return columns_data(names, [np.asarray(dates), np.asarray(prices)], columnar)
+    return HttpResponse(encode(build(series)), content_type=CONTENT_TYPE)
+
+def page_response(request, df, next_cursor):
+    """
+    Encodes one page of a paginated endpoint as {"rows": ..., "next": cursor}, rows
+    in frame_response's format. next is None on the last page.
+    """
+    columns = [df[column].to_numpy() for column in df.columns]
+    data = {"rows": columns_data(list(df.columns), columns, wants_columns(request)), "next": next_cursor}
+    return HttpResponse(encode(data), content_type=CONTENT_TYPE)
+
+async def iter_ndjson(names, chunks):
+    async for rows in chunks:
+        yield b"".join(encode(dict(zip(names, row))) + b"\n" for row in rows)
+
+def ndjson_response(names, chunks):
+    """
+    Streams rows as newline delimited JSON objects keyed by names.
+
+    Args:
+        chunks (async iterable): Lists of row tuples
+    """
+    return StreamingHttpResponse(iter_ndjson(names, chunks), content_type=NDJSON_CONTENT_TYPE)
@@ -1,12 +1,50 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.core.cache import cache
 from unittest.mock import patch
 import pandas as pd
-from datetime import datetime
+import numpy as np
+import pytz
+from datetime import datetime, timezone
+import os
+import sys
+import tempfile
+import importlib.util
+import unittest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.DatabaseW import DatabaseW
+from database.Fetcher import Fetcher
+from database.connection import connect
+from database.schema import MIGRATIONS, schema_version
+from database.compact import compact_prices, enable_incremental_vacuum, incremental_vacuum
+from database.tier import tier_closed_months
+from database.DatabaseR import DatabaseR
+from database.spatial import haversine_km, postcode_index
+from database.aggregate import station_average
+from database.sequences import create_sequences, sequence_tensors
+from fuel_backend.serialize import series_response, frame_response
+from fuel_backend.pool import ReaderPool, close_pools, get_pool
+from django.conf import settings
+import sqlite3
+import asyncio
+
+from asgiref.sync import async_to_sync
+
+def streamed_content(response):
+    # Streamed responses are async iterators, read them as an ASGI server would
+    async def read():
+        return b"".join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(read)()
 
 # Create your tests here.
 class AveragePriceViewTest(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
+        # Pooled readers would outlive each test's DatabaseR mock
+        close_pools()
 
     @patch("fuel_backend.views.DatabaseR")
     def test_average_price_daily_view_get(self, MockDatabaseR):
@@ -111,9 +149,85 @@ class AveragePriceViewTest(TestCase):
             self.assertTrue(any(d["date"] == "2025-07-02" and d["avg_price"] == 171.0 for d in data))
             self.assertTrue(any(d["date"] == "2025-07-03" and d["avg_price"] == 172.0 for d in data))
 
+    @patch("fuel_backend.views.DatabaseR")
+    def test_average_price_daily_columns_format(self, MockDatabaseR):
+        instance = MockDatabaseR.return_value
+        instance.fetch_average_price.return_value = pd.DataFrame({
+            "timestamp": pd.to_datetime(["2025-07-01", "2025-07-02"]),
+            "station_code": ["123", "123"],
+            "price": [170.004, 171.0],
+        })
+        future_df = pd.DataFrame({"timestamp": pd.to_datetime(["2025-07-03", "2025-07-03"]), "forecast_price": [171.5, 172.0]})
+
+        with patch("fuel_backend.views.average_future_price", return_value=future_df):
+            response = self.client.get("/api/average_price_daily/?fuel_type=P95&start_date=2025-07-01&end_date=2025-07-31&format=columns")
+        self.assertEqual(response.status_code, 200)
+        # The latest forecast for a day wins
+        self.assertEqual(response.json(), {"dates": ["2025-07-01", "2025-07-02", "2025-07-03"], "prices": [170.0, 171.0, 172.0]})
+
+
+    @patch("fuel_backend.views.average_future_price")
+    @patch("fuel_backend.views.average_price")
+    def test_history_and_forecast_are_fetched_concurrently(self, mock_average_price, mock_average_future_price):
+        # Each side waits for the other, so fetching them one after the other breaks the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        def history(**kwargs):
+            barrier.wait()
+            return pd.DataFrame({"timestamp": pd.to_datetime(["2025-07-01"]), "station_code": ["123"], "price": [170.0]})
+        def forecast(fuel_type):
+            barrier.wait()
+            return pd.DataFrame({"timestamp": pd.to_datetime(["2025-07-02"]), "forecast_price": [171.0]})
+        mock_average_price.side_effect = history
+        mock_average_future_price.side_effect = forecast
+
+        response = self.client.get("/api/average_price_daily/?fuel_type=P95&start_date=2025-07-01&end_date=2025-07-31")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"date": "2025-07-01", "avg_price": 170.0}, {"date": "2025-07-02", "avg_price": 171.0}])
+
+class SerializationTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.dates = pd.date_range("2025-01-01", periods=7, freq="D").strftime("%Y-%m-%d")
+        self.prices = np.array([170.0, 171.5, np.nan, 173.0, 174.25, 175.0, 176.0])
+
+    def body(self, response):
+        if response.streaming:
+            return json.loads(streamed_content(response))
+        return json.loads(response.content)
+
+    def test_rows_and_columns_formats(self):
+        rows = self.body(series_response(self.factory.get("/"), self.dates, self.prices))
+        self.assertEqual(rows[0], {"date": "2025-01-01", "avg_price": 170.0})
+        # NaN is not valid JSON, it is sent as null
+        self.assertIsNone(rows[2]["avg_price"])
+
+        columns = self.body(series_response(self.factory.get("/?format=columns"), self.dates, self.prices))
+        self.assertEqual(columns["dates"], list(self.dates))
+        self.assertEqual(columns["prices"], [row["avg_price"] for row in rows])
+
+    @patch("fuel_backend.serialize.STREAM_CHUNK_POINTS", 3)
+    def test_large_responses_stream_the_same_body(self):
+        for query in ["/", "/?format=columns"]:
+            expected = self.body(series_response(self.factory.get(query), self.dates, self.prices))
+            with override_settings(STREAM_MIN_POINTS=5):
+                response = series_response(self.factory.get(query), self.dates, self.prices)
+            self.assertTrue(response.streaming and response.is_async)
+            self.assertEqual(self.body(response), expected)
+
+    def test_frame_response_keeps_column_types(self):
+        df = pd.DataFrame({"name": ["A", None], "price": [180.0, 189.9], "timestamp": [1762923963, 1729293349]})
+        self.assertEqual(self.body(frame_response(self.factory.get("/"), df)), [
+            {"name": "A", "price": 180.0, "timestamp": 1762923963},
+            {"name": None, "price": 189.9, "timestamp": 1729293349},
+        ])
+        self.assertEqual(self.body(frame_response(self.factory.get("/?format=columns"), df)), {
+            "name": ["A", None], "price": [180.0, 189.9], "timestamp": [1762923963, 1729293349],
+        })
+
 class NearbyStationsViewTest(TestCase):
     def setUp(self):
         self.client = Client()
+        close_pools()
 
     @patch("fuel_backend.views.DatabaseR")
     def test_nearby_stations_view_get_success(self, MockDatabaseR):
@@ -122,11 +236,6 @@ class NearbyStationsViewTest(TestCase):
 
         instance.suburb_to_coordinates.return_value = (-33.8833, 151.1000)
 
-        instance.get_nearby_suburbs.return_value = [
-            {"suburb": "Strathfield", "postcode": "2135"},
-            {"suburb": "Burwood", "postcode": "2134"},
-        ]
-
         mock_df = pd.DataFrame([
             {
                 "name": "7-Eleven Burwood", 
@@ -136,7 +245,9 @@ class NearbyStationsViewTest(TestCase):
                 "longitude": 151.108603,
                 "fuel_type": "P98",
                 "price": 180.0,
-                "timestamp": 1762923963
+                "timestamp": 1762923963,
+                "station_code": "1",
+                "distance_km": 1.7
             }, {
                 "name": "Coles Express Strathfield", 
                 "address": "9 Albert Rd, Strathfield NSW 2135",  
@@ -145,11 +256,13 @@ class NearbyStationsViewTest(TestCase):
                 "longitude": 151.092355,
                 "fuel_type": "P98",
                 "price": 189.9,
-                "timestamp": 1729293349
+                "timestamp": 1729293349,
+                "station_code": "2",
+                "distance_km": 1.6
             },
         ])
 
-        instance.fetch_data.return_value = mock_df
+        instance.fetch_nearby_stations.return_value = mock_df
         instance.unload.return_value = None
         
         response = self.client.get("/api/nearby_stations/?fuel_type=P98&postcode=2134")
@@ -160,6 +273,34 @@ class NearbyStationsViewTest(TestCase):
         assert data[1]["name"] == "Coles Express Strathfield"
         assert data[0]["price"] == 180.0
         assert data[1]["price"] == 189.9
+        assert data[0]["distance_km"] == 1.7
+        assert "station_code" not in data[0]
+        instance.fetch_nearby_stations.assert_called_once_with(
+            fuel_type="P98", latitude=-33.8833, longitude=151.1, radius_km=5, k=None, sort_by="price"
+        )
+
+    @patch("fuel_backend.views.DatabaseR")
+    def test_radius_limit_and_sort_are_passed_through(self, MockDatabaseR):
+        instance = MockDatabaseR.return_value
+        instance.suburb_to_coordinates.return_value = (-33.8833, 151.1)
+        instance.fetch_nearby_stations.return_value = pd.DataFrame()
+
+        self.client.get("/api/nearby_stations/?postcode=2134&radius_km=2.5&limit=3&sort=distance")
+        instance.fetch_nearby_stations.assert_called_with(
+            fuel_type="E10", latitude=-33.8833, longitude=151.1, radius_km=2.5, k=3, sort_by="distance"
+        )
+        # A limit on its own is a k-nearest search with no radius
+        self.client.get("/api/nearby_stations/?postcode=2134&limit=3")
+        instance.fetch_nearby_stations.assert_called_with(
+            fuel_type="E10", latitude=-33.8833, longitude=151.1, radius_km=None, k=3, sort_by="price"
+        )
+
+    @patch("fuel_backend.views.DatabaseR")
+    def test_invalid_search_parameters(self, MockDatabaseR):
+        for query in ["radius_km=abc", "radius_km=0", "radius_km=500", "limit=0", "limit=x", "sort=name"]:
+            response = self.client.get(f"/api/nearby_stations/?postcode=2134&{query}")
+            self.assertEqual(response.status_code, 400, query)
+        MockDatabaseR.return_value.fetch_nearby_stations.assert_not_called()
 
     @patch("fuel_backend.views.DatabaseR")
     def test_missing_postcode(self, MockDatabaseR):
@@ -169,16 +310,17 @@ class NearbyStationsViewTest(TestCase):
         self.assertIn("error", response.json())
 
     @patch("fuel_backend.views.DatabaseR")
-    def test_no_nearby_suburbs(self, MockDatabaseR):
-        # Test with postcode that yields no nearby suburbs
+    def test_unknown_postcode(self, MockDatabaseR):
+        # Test with postcode missing from the postcode DB
         instance = MockDatabaseR.return_value
 
-        instance.suburb_to_coordinates.return_value = (-33.8833, 151.1)
-        instance.get_nearby_suburbs.return_value = []
+        instance.suburb_to_coordinates.return_value = None
 
-        response = self.client.get("/api/nearby_stations/?postcode=2134")
+        response = self.client.get("/api/nearby_stations/?postcode=9999")
         self.assertEqual(response.status_code, 404)
-        self.assertEqual(response.json()["error"], "No nearby suburbs found")
+        self.assertEqual(response.json()["error"], "Postcode not found")
+        # The reader went back to the pool on the early return
+        self.assertEqual(get_pool(settings.FUEL_DB_PATH).idle_count, 1)
 
     @patch("fuel_backend.views.DatabaseR")
     def test_no_price_data(self, MockDatabaseR):
@@ -186,12 +328,1204 @@ class NearbyStationsViewTest(TestCase):
         instance = MockDatabaseR.return_value
 
         instance.suburb_to_coordinates.return_value = (-33.8833, 151.1)
-        instance.get_nearby_suburbs.return_value = [
-            {"suburb": "Burwood", "postcode": "2134"}
-        ]
-
-        instance.fetch_data.return_value = pd.DataFrame()
+        instance.fetch_nearby_stations.return_value = pd.DataFrame()
 
         resp = self.client.get("/api/nearby_stations/?postcode=2134")
         self.assertEqual(resp.status_code, 404)
-        self.assertEqual(resp.json()["error"], "No price data found")
\ No newline at end of file
+        self.assertEqual(resp.json()["error"], "No price data found")
+
+class DatabaseTestCase(TestCase):
+    """
+    A fresh DatabaseW at self.db_path in a temporary directory per test, with the
+    API fetcher mocked out.
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "fuel_prices.db")
+        self.db = self.open_writer(self.db_path)
+
+    def tearDown(self):
+        self.db.unload()
+        self.tmp.cleanup()
+
+    def open_writer(self, db_path, **options):
+        with patch("database.DatabaseW.Fetcher"):
+            return DatabaseW(db_path, 0, None, None, **options)
+
+
+class DatabaseWriterTest(DatabaseTestCase):
+    def test_save_prices_to_db_dedupes_on_primary_key(self):
+        prices = [
+            {"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"},
+            {"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"},
+            {"stationcode": "2", "fueltype": "P98", "price": 199.9, "lastupdated": "01/07/2025 11:00:00"},
+        ]
+
+        self.assertEqual(self.db.save_prices_to_db(prices), 2)
+        self.assertEqual(self.db.save_prices_to_db(prices), 0)
+
+        self.db.cursor.execute("SELECT COUNT(*) FROM prices")
+        self.assertEqual(self.db.cursor.fetchone()[0], 2)
+
+    def test_save_prices_to_db_skips_rows_before_start_timestamp(self):
+        self.db.start_timestamp = 1751364000  # 01/07/2025 10:00:00 UTC
+        prices = [
+            {"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"},
+            {"stationcode": "1", "fueltype": "E10", "price": 171.1, "lastupdated": "01/07/2025 10:00:01"},
+        ]
+
+        self.assertEqual(self.db.save_prices_to_db(prices), 1)
+
+    def test_update_db_runs_full_sync_on_startup_then_delta(self):
+        snapshot = {
+            "stations": [],
+            "prices": [{"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"}],
+        }
+        delta = {
+            "stations": [],
+            "prices": [{"stationcode": "1", "fueltype": "E10", "price": 169.9, "lastupdated": "01/07/2025 12:00:00"}],
+        }
+        self.db.full_sync_every = 3
+        self.db.fetcher.fetch_all_v1_data.return_value = snapshot
+        self.db.fetcher.fetch_new_v1_data.return_value = delta
+
+        self.db.update_db()
+        self.assertEqual(self.db.fetcher.fetch_all_v1_data.call_count, 1)
+        self.assertEqual(self.db.last_cycle_stats, {"mode": "full", "inserted": 2, "skipped": 0})
+
+        self.db.update_db()
+        self.assertEqual(self.db.fetcher.fetch_all_v1_data.call_count, 1)
+        # Unchanged delta payload is skipped without touching the database
+        self.assertEqual(self.db.last_cycle_stats, {"mode": "delta", "inserted": 0, "skipped": 1})
+
+    def test_failed_startup_full_sync_is_retried_next_cycle(self):
+        snapshot = {
+            "stations": [],
+            "prices": [{"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"}],
+        }
+        self.db.full_sync_every = 3
+        self.db.fetcher.fetch_all_v1_data.side_effect = [{"errorDetails": "Service unavailable"}, ConnectionError("reset"), snapshot]
+        self.db.fetcher.fetch_new_v1_data.return_value = {"stations": [], "prices": []}
+
+        self.assertEqual(self.db.update_db(), 1)
+        with self.assertRaises(ConnectionError):
+            self.db.update_db()
+        self.db.update_db()
+        self.assertEqual(self.db.fetcher.fetch_all_v1_data.call_count, 3)
+        self.assertEqual(self.db.last_cycle_stats["mode"], "full")
+
+        # Only now does the schedule move on to delta cycles
+        self.db.update_db()
+        self.db.update_db()
+        self.assertEqual(self.db.fetcher.fetch_all_v1_data.call_count, 3)
+        self.db.fetcher.fetch_all_v1_data.side_effect = None
+        self.db.fetcher.fetch_all_v1_data.return_value = snapshot
+        self.db.update_db()
+        self.assertEqual(self.db.fetcher.fetch_all_v1_data.call_count, 4)
+
+    def test_update_db_returns_error_on_bad_payload(self):
+        self.db.fetcher.fetch_all_v1_data.return_value = {"errorDetails": "Unauthorized"}
+        self.assertEqual(self.db.update_db(), 1)
+
+    def test_save_stations_to_db_only_updates_changed_stations(self):
+        stations = [
+            {"brandid": "1", "stationid": "10", "brand": "7-Eleven", "code": "100", "name": "7-Eleven Burwood",
+             "address": "Cnr Parramatta & Shaftsbury Rds, Burwood NSW 2134",
+             "location": {"latitude": -33.869406, "longitude": 151.108603}, "isAdBlueAvailable": False},
+            {"brandid": "2", "stationid": "20", "brand": "Coles Express", "code": "200", "name": "Coles Express Strathfield",
+             "address": "9 Albert Rd, Strathfield NSW 2135",
+             "location": {"latitude": -33.870803, "longitude": 151.092355}, "isAdBlueAvailable": True},
+        ]
+
+        self.assertEqual(self.db.save_stations_to_db(stations), 2)
+        self.assertEqual(self.db.save_stations_to_db(stations), 0)
+
+        stations[1]["name"] = "Reddy Express Strathfield"
+        self.assertEqual(self.db.save_stations_to_db(stations), 1)
+
+        df = self.db.fetch_stations(station_codes=["100", "200"]).set_index("station_code")
+        self.assertEqual(df.loc["200", "name"], "Reddy Express Strathfield")
+        self.assertEqual(df.loc["100", "postcode"], "2134")
+        self.assertEqual(df.loc["200", "postcode"], "2135")
+
+    def test_extract_postcodes_matches_extract_postcode(self):
+        addresses = ["1 Smith St, Sydney NSW 2000", "Unit 1234, 5 Long Rd, Dubbo NSW 2830", "No postcode here"]
+        vectorized = self.db.extract_postcodes(pd.Series(addresses)).tolist()
+        expected = [self.db.extract_postcode(address) for address in addresses]
+        self.assertEqual([None if pd.isna(p) else p for p in vectorized], expected)
+
+    def test_normalise_timestamps_matches_convert_to_unix_timestamp(self):
+        date_strs = ["01/07/2025 10:00:00", "31/12/2024 23:59:59", "29/02/2024 00:00:01"]
+        expected = [self.db.convert_to_unix_timestamp(d, pytz.timezone("UTC")) for d in date_strs]
+        self.assertEqual(self.db.normalise_timestamps(pd.Series(date_strs)).tolist(), expected)
+
+    def test_record_ingest_run_stores_stage_timings(self):
+        self.db.fetcher.fetch_all_v1_data.return_value = {"stations": [], "prices": [
+            {"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"},
+        ]}
+        self.db.fetcher.fetch_new_v1_data.return_value = {"stations": [], "prices": []}
+        self.db.update_db()
+        self.db.record_ingest_run(1000.0, 1090.0, "ok", interval=60, skipped_ticks=1)
+
+        runs = self.db.fetch_ingest_runs(limit=10)
+        self.assertEqual(len(runs), 1)
+        run = runs.iloc[0]
+        self.assertEqual((run["status"], run["mode"], run["inserted"]), ("ok", "full", 1))
+        self.assertEqual(run["total_seconds"], 90.0)
+        self.assertEqual(run["overran"], 1)
+        self.assertGreater(run["parse_seconds"], 0)
+        self.assertGreater(run["write_seconds"], 0)
+
+
+class ConnectionFactoryTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "fuel_prices.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writer_enables_wal_and_env_pragmas(self):
+        with patch.dict(os.environ, {"SQLITE_SYNCHRONOUS": "full", "SQLITE_BUSY_TIMEOUT": "1234"}):
+            conn = connect(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 2)
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 1234)
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2)
+        conn.close()
+
+    def test_read_only_connection_rejects_writes(self):
+        writer = connect(self.db_path)
+        writer.execute("CREATE TABLE prices (price REAL)")
+        writer.commit()
+
+        reader = connect(self.db_path, read_only=True)
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute("INSERT INTO prices VALUES (1.0)")
+        reader.close()
+        writer.close()
+
+    def test_invalid_pragma_value_is_rejected(self):
+        with patch.dict(os.environ, {"SQLITE_SYNCHRONOUS": "FAST; DROP TABLE prices"}):
+            with self.assertRaises(ValueError):
+                connect(self.db_path)
+
+
+class QueryPlanTest(DatabaseTestCase):
+    def query_plan(self, query, params):
+        rows = self.db.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        return [row[-1] for row in rows]
+
+    def test_migrations_bring_schema_to_latest_version(self):
+        self.assertEqual(schema_version(self.db.conn), len(MIGRATIONS))
+        indexes = {row[0] for row in self.db.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("idx_prices_fuel_type_timestamp", indexes)
+        self.assertIn("idx_stations_postcode", indexes)
+
+    def test_date_range_is_an_index_range_on_timestamp(self):
+        query, params = self.db.build_data_query("E10", start_date=1751328000, end_date=1751414399)
+        plan = self.query_plan(query, params)
+        self.assertFalse(any(step.startswith("SCAN prices") for step in plan), plan)
+        self.assertTrue(any("USING INDEX idx_prices_fuel_type_timestamp (fuel_type=? AND timestamp>? AND timestamp<?)" in step for step in plan), plan)
+
+    def test_average_price_reads_a_day_range_of_the_rollup(self):
+        query, params = self.db.build_average_price_query("E10", start_date=1751328000, end_date=1751414399, interval="D")
+        plan = self.query_plan(query, params)
+        self.assertFalse(any(step.startswith("SCAN price_daily") or "prices" in step.split() for step in plan), plan)
+        self.assertTrue(any("SEARCH price_daily USING PRIMARY KEY (fuel_type=? AND day>? AND day<?)" in step for step in plan), plan)
+
+    def test_batch_average_price_reads_the_rollup_once(self):
+        query, params = self.db.build_average_prices_query(["E10", "U91", "P98"], start_date=1751328000, end_date=1751414399)
+        plan = self.query_plan(query, params)
+        self.assertEqual(sum("price_daily" in step for step in plan), 1, plan)
+        self.assertTrue(any("SEARCH price_daily USING PRIMARY KEY (fuel_type=? AND day>? AND day<?)" in step for step in plan), plan)
+
+    def test_history_page_after_a_cursor_is_an_index_range(self):
+        query, params = self.db.build_history_query("E10", after=(1751328000, "123"), limit=1000)
+        plan = self.query_plan(query, params)
+        self.assertTrue(any("USING INDEX idx_prices_fuel_type_timestamp (fuel_type=? AND timestamp>?)" in step for step in plan), plan)
+        self.assertFalse(any("TEMP B-TREE FOR ORDER BY" in step for step in plan), plan)
+
+    def test_postcode_filter_uses_postcode_index(self):
+        self.db.cursor.executemany("INSERT INTO stations (station_code, postcode) VALUES (?, ?)",
+                                   [(str(code), str(2000 + code % 400)) for code in range(2000)])
+        self.db.cursor.executemany("INSERT INTO prices VALUES (?, ?, ?, ?)",
+                                   [(str(code), fuel_type, 170.0, 1751364000 + day * 86400)
+                                    for code in range(2000) for fuel_type in ("E10", "U91") for day in range(5)])
+        self.db.cursor.execute("ANALYZE")
+        query, params = self.db.build_data_query("E10", postcode=["2134", "2135"])
+        plan = self.query_plan(query, params)
+        self.assertTrue(any("idx_stations_postcode" in step for step in plan), plan)
+
+    def test_day_bounds_match_whole_utc_days(self):
+        # 2025-07-01 10:00 UTC to 2025-07-02 00:00 UTC covers both whole days
+        self.assertEqual(self.db.day_bounds(1751364000, 1751414400), (1751328000, 1751500800))
+
+    def test_date_range_matches_date_function_semantics(self):
+        self.db.save_prices_to_db([
+            {"stationcode": "1", "fueltype": "E10", "price": 170.0, "lastupdated": "30/06/2025 23:59:59"},
+            {"stationcode": "1", "fueltype": "E10", "price": 171.0, "lastupdated": "01/07/2025 00:00:00"},
+            {"stationcode": "1", "fueltype": "E10", "price": 172.0, "lastupdated": "02/07/2025 23:59:59"},
+            {"stationcode": "1", "fueltype": "E10", "price": 173.0, "lastupdated": "03/07/2025 00:00:00"},
+        ])
+        self.db.cursor.execute("INSERT INTO stations (station_code, postcode) VALUES ('1', '2134')")
+        df = self.db.fetch_data("E10", start_date=1751364000, end_date=1751414400)
+        self.assertEqual(sorted(df["price"].tolist()), [171.0, 172.0])
+
+
+class PriceRollupTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db.cursor.executemany("INSERT INTO stations (station_code, name, postcode) VALUES (?, ?, ?)",
+                                   [("1", "Station 1", "2134"), ("2", "Station 2", "2135")])
+        self.db.conn.commit()
+
+    def raw_average_price(self, fuel_type, interval):
+        # Reference aggregation straight over raw prices rows, as fetch_average_price used to run
+        date_format = {
+            "D": "date(timestamp, 'unixepoch')",
+            "W": "strftime('%Y-%W', timestamp, 'unixepoch')",
+            "M": "strftime('%Y-%m', timestamp, 'unixepoch')",
+        }[interval]
+        return pd.read_sql_query(f"""
+            SELECT {date_format} AS timestamp, station_code, AVG(price) AS price
+            FROM prices WHERE fuel_type = ? GROUP BY 1, 2 ORDER BY 1, 2
+        """, self.db.conn, params=[fuel_type])
+
+    def test_rollup_matches_raw_aggregation(self):
+        prices = []
+        for day in range(1, 29):
+            for hour in (6, 12, 18):
+                for code, base in (("1", 170.0), ("2", 180.0)):
+                    prices.append({"stationcode": code, "fueltype": "E10", "price": base + day * 0.7 + hour * 0.1,
+                                   "lastupdated": f"{day:02d}/06/2025 {hour:02d}:00:00"})
+        # Ingested in overlapping batches, so the rollup sees re-sent rows too
+        self.db.save_prices_to_db(prices[:100])
+        self.db.save_prices_to_db(prices[50:])
+        self.db.save_prices_to_db(prices)
+
+        for interval in ("D", "W", "M"):
+            rollup = self.db.fetch_average_price("E10", interval=interval)
+            rollup = rollup[["timestamp", "station_code", "price"]].sort_values(["timestamp", "station_code"]).reset_index(drop=True)
+            pd.testing.assert_frame_equal(rollup, self.raw_average_price("E10", interval))
+
+    def test_rollup_tracks_min_max_and_count(self):
+        self.db.save_prices_to_db([
+            {"stationcode": "1", "fueltype": "E10", "price": 170.0, "lastupdated": "01/07/2025 06:00:00"},
+            {"stationcode": "1", "fueltype": "E10", "price": 175.0, "lastupdated": "01/07/2025 12:00:00"},
+        ])
+        self.db.save_prices_to_db([
+            {"stationcode": "1", "fueltype": "E10", "price": 165.0, "lastupdated": "01/07/2025 18:00:00"},
+            {"stationcode": "1", "fueltype": "E10", "price": 175.0, "lastupdated": "01/07/2025 12:00:00"},
+        ])
+        row = self.db.cursor.execute("SELECT price_sum, price_count, price_min, price_max FROM price_daily").fetchone()
+        self.assertEqual(row, (510.0, 3, 165.0, 175.0))
+
+    def test_batch_matches_per_fuel_averages_across_year_end(self):
+        self.db.save_prices_to_db([
+            {"stationcode": code, "fueltype": fuel_type, "price": base + day * 0.3 + int(code),
+             "lastupdated": (datetime(2024, 12, 20, 9, tzinfo=timezone.utc) + pd.Timedelta(days=day)).strftime("%d/%m/%Y %H:%M:%S")}
+            for day in range(30) for code in ("1", "2") for fuel_type, base in (("E10", 170.0), ("U91", 180.0))
+        ])
+        batch = self.db.fetch_average_prices(["E10", "U91"], ["D", "W", "M"])
+        columns = ["timestamp", "station_code", "price"]
+        for (fuel_type, interval), group in batch.groupby(["fuel_type", "interval"]):
+            single = self.db.fetch_average_price(fuel_type, interval=interval)[columns]
+            pd.testing.assert_frame_equal(
+                group[columns].sort_values(columns[:2]).reset_index(drop=True),
+                single.sort_values(columns[:2]).reset_index(drop=True),
+            )
+        self.assertEqual(len(batch.groupby(["fuel_type", "interval"])), 6)
+
+    def test_migration_backfills_rollup_from_existing_prices(self):
+        legacy_path = os.path.join(self.tmp.name, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("CREATE TABLE prices (station_code TEXT, fuel_type TEXT, price REAL, timestamp INTEGER, PRIMARY KEY (station_code, fuel_type, timestamp))")
+        conn.executemany("INSERT INTO prices VALUES (?, ?, ?, ?)", [("1", "E10", 170.0, 1751364000), ("1", "E10", 172.0, 1751367600)])
+        conn.commit()
+        conn.close()
+
+        db = self.open_writer(legacy_path)
+        row = db.cursor.execute("SELECT day, price_sum, price_count FROM price_daily").fetchone()
+        db.unload()
+        self.assertEqual(row, (1751328000, 342.0, 2))
+
+
+class StationAverageTest(TestCase):
+    def pivot_average(self, df):
+        # The wide pivot station_average replaces
+        df_pivot = df.pivot_table(index="timestamp", columns="station_code", values="price")
+        df_pivot.bfill(inplace=True)
+        return df_pivot.mean(axis=1)
+
+    def test_matches_backfilled_pivot_mean(self):
+        df = pd.DataFrame({
+            "timestamp": pd.to_datetime(["2025-07-01", "2025-07-03", "2025-07-02", "2025-07-04", "2025-07-01", "2025-07-04", "2025-07-02", "2025-07-02"]),
+            "station_code": ["1", "1", "2", "2", "3", "3", "1", "1"],
+            "price": [170.0, 174.0, 180.0, 182.0, 190.0, None, 171.0, 173.0],
+        })
+        result = station_average(df)
+        expected = self.pivot_average(df)
+        pd.testing.assert_index_equal(result.index, expected.index)
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy())
+        # Station 2 back-fills 180 to the 1st, station 1 averages 172 on the 2nd and
+        # station 3 drops out after its last non-null price
+        self.assertAlmostEqual(result[pd.Timestamp("2025-07-01")], (170.0 + 180.0 + 190.0) / 3)
+        self.assertAlmostEqual(result[pd.Timestamp("2025-07-02")], (172.0 + 180.0) / 2)
+        self.assertAlmostEqual(result[pd.Timestamp("2025-07-04")], 182.0)
+
+    def test_random_order_and_gaps(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            "timestamp": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 60, 2000), unit="D"),
+            "station_code": rng.integers(0, 50, 2000).astype(str),
+            "price": rng.uniform(150, 230, 2000),
+        })
+        np.testing.assert_allclose(station_average(df).to_numpy(), self.pivot_average(df).to_numpy())
+        station_first = df.sort_values(["station_code", "timestamp"])
+        np.testing.assert_allclose(station_average(station_first).to_numpy(), self.pivot_average(df).to_numpy())
+
+    def test_empty(self):
+        result = station_average(pd.DataFrame({"timestamp": pd.to_datetime([]), "station_code": [], "price": []}))
+        self.assertTrue(result.empty)
+        self.assertEqual(result.name, "avg_price")
+
+
+class SequenceBuilderTest(TestCase):
+    def loop_sequences(self, scaled_df, seq_length):
+        # The per-window loop create_sequences replaces
+        X, y = [], []
+        for i in range(len(scaled_df) - seq_length):
+            X.append(scaled_df.iloc[i:i+seq_length].values)
+            y.append(scaled_df.iloc[i+seq_length].values[0])
+        return np.array(X), np.array(y)
+
+    def test_matches_loop_for_one_and_several_features(self):
+        rng = np.random.default_rng(0)
+        for features in (1, 3):
+            scaled_df = pd.DataFrame(rng.random((200, features)))
+            X, y = create_sequences(scaled_df, 14)
+            expected_X, expected_y = self.loop_sequences(scaled_df, 14)
+            self.assertEqual(X.shape, (186, 14, features))
+            np.testing.assert_allclose(X, expected_X, rtol=1e-6)
+            np.testing.assert_allclose(y, expected_y, rtol=1e-6)
+
+    def test_windows_are_views_of_one_copy(self):
+        values = np.arange(300, dtype=np.float32).reshape(100, 3)
+        X, y = create_sequences(values, 30, target_column=2)
+        self.assertTrue(np.shares_memory(X, values) and np.shares_memory(y, values))
+        # The windows overlap, so writing to one would change others
+        self.assertFalse(X.flags.writeable)
+        self.assertEqual(X[5, 0].tolist(), values[5].tolist())
+        self.assertEqual(y[5], values[35, 2])
+
+    def test_history_shorter_than_a_window(self):
+        X, y = create_sequences(np.ones(10), 10)
+        self.assertEqual((X.shape, y.shape), ((0, 10, 1), (0,)))
+
+    @unittest.skipUnless(importlib.util.find_spec("torch"), "torch is not installed")
+    def test_tensors_share_the_series_memory(self):
+        values = np.arange(300, dtype=np.float32).reshape(100, 3)
+        X, y = sequence_tensors(values, 30, target_column=2)
+        self.assertEqual((tuple(X.shape), tuple(y.shape)), ((70, 30, 3), (70,)))
+        self.assertEqual(X.data_ptr(), values.ctypes.data)
+        self.assertEqual(y.data_ptr(), values[30:, 2].ctypes.data)
+        expected_X, expected_y = create_sequences(values, 30, target_column=2)
+        np.testing.assert_array_equal(X.numpy(), expected_X)
+        np.testing.assert_array_equal(y.numpy(), expected_y)
+
+
+class ChangeOnlyHistoryTest(DatabaseTestCase):
+    def open_db(self, name, **options):
+        db = self.open_writer(os.path.join(self.tmp.name, name), **options)
+        db.cursor.executemany("INSERT INTO stations (station_code, name, postcode) VALUES (?, ?, ?)",
+                              [("1", "Station 1", "2134"), ("2", "Station 2", "2135")])
+        db.conn.commit()
+        return db
+
+    def make_cycles(self):
+        # Each cycle re-sends the latest observation per station, most of them unchanged
+        cycles = []
+        for day in range(1, 21):
+            cycles.append([
+                {"stationcode": "1", "fueltype": "E10", "price": 170.0 + (day // 5), "lastupdated": f"{day:02d}/06/2025 08:00:00"},
+                {"stationcode": "1", "fueltype": "E10", "price": 170.0 + (day // 5), "lastupdated": f"{day:02d}/06/2025 16:00:00"},
+                {"stationcode": "2", "fueltype": "E10", "price": 180.0 + (day % 3 == 0), "lastupdated": f"{day:02d}/06/2025 12:00:00"},
+            ])
+        return cycles
+
+    def average_prices(self, db):
+        frames = [db.fetch_average_price("E10", interval=interval) for interval in ("D", "W", "M")]
+        return [df.sort_values(["timestamp", "station_code"]).reset_index(drop=True) for df in frames]
+
+    def test_change_only_ingest_stores_transitions_with_same_averages(self):
+        full = self.open_db("full.db")
+        change_only = self.open_db("change_only.db", change_only=True)
+        for prices in self.make_cycles():
+            full.save_prices_to_db(prices)
+            change_only.save_prices_to_db(prices)
+            self.assertEqual(change_only.save_prices_to_db(prices), 0)
+
+        stored_full = full.cursor.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        stored_changes = change_only.cursor.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        self.assertEqual(stored_full, 60)
+        self.assertEqual(stored_changes, 5 + 13)
+        for expected, actual in zip(self.average_prices(full), self.average_prices(change_only)):
+            pd.testing.assert_frame_equal(expected, actual)
+        pd.testing.assert_frame_equal(
+            full.fetch_data("E10", is_newest=True)[["station_code", "price", "timestamp"]],
+            change_only.fetch_data("E10", is_newest=True)[["station_code", "price", "timestamp"]],
+        )
+        full.unload()
+        change_only.unload()
+
+    def test_compaction_collapses_runs_and_keeps_averages(self):
+        db = self.open_db("compacted.db")
+        for prices in self.make_cycles():
+            db.save_prices_to_db(prices)
+        before = self.average_prices(db)
+
+        enable_incremental_vacuum(db.conn)
+        removed = compact_prices(db.conn, stations_per_batch=1)
+        # Newest row per series is kept even when unchanged
+        self.assertEqual(removed, 60 - (5 + 13) - 2)
+        self.assertEqual(compact_prices(db.conn), 0)
+        self.assertGreaterEqual(incremental_vacuum(db.conn, pages_per_step=10), 0)
+        self.assertEqual(db.cursor.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+        for expected, actual in zip(before, self.average_prices(db)):
+            pd.testing.assert_frame_equal(expected, actual)
+        # Re-sending the last snapshot after compaction adds nothing
+        self.assertEqual(db.save_prices_to_db(self.make_cycles()[-1]), 0)
+        db.unload()
+
+    def test_compaction_without_incremental_vacuum_never_runs_a_full_vacuum(self):
+        db = self.open_db("compacted.db")
+        for prices in self.make_cycles():
+            db.save_prices_to_db(prices)
+        statements = []
+        db.conn.set_trace_callback(statements.append)
+        self.assertGreater(compact_prices(db.conn), 0)
+        self.assertEqual(incremental_vacuum(db.conn), 0)
+        db.conn.set_trace_callback(None)
+        self.assertFalse(any(statement.strip().upper().startswith("VACUUM") for statement in statements), statements)
+        self.assertNotEqual(db.cursor.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        db.unload()
+
+
+class ColdStorageTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cold_path = os.path.join(self.tmp.name, "cold")
+        self.db.cursor.executemany("INSERT INTO stations (station_code, name, postcode) VALUES (?, ?, ?)",
+                                   [("1", "Station 1", "2134"), ("2", "Station 2", "2135")])
+        self.db.conn.commit()
+        prices = []
+        for month in (4, 5, 6, 7):
+            for day in (1, 15, 28):
+                prices.append({"stationcode": "1", "fueltype": "E10", "price": 170.0 + month + day / 100, "lastupdated": f"{day:02d}/{month:02d}/2025 09:00:00"})
+                prices.append({"stationcode": "2", "fueltype": "E10", "price": 180.0 + month, "lastupdated": f"{day:02d}/{month:02d}/2025 10:00:00"})
+                prices.append({"stationcode": "2", "fueltype": "U91", "price": 185.0 + month, "lastupdated": f"{day:02d}/{month:02d}/2025 11:00:00"})
+        self.db.save_prices_to_db(prices)
+
+    def sorted_data(self, df):
+        return df.sort_values(["timestamp", "station_code"]).reset_index(drop=True)
+
+    def test_tiered_history_reads_back_unchanged(self):
+        ranges = [(None, None), (1746057600, 1748649600), (1749340800, 1753056000)]
+        before = [self.db.fetch_data("E10", start_date=start, end_date=end) for start, end in ranges]
+        before_avg = self.db.fetch_average_price("E10", interval="M")
+
+        moved = tier_closed_months(self.db.conn, self.cold_path, now=datetime(2025, 7, 20, tzinfo=timezone.utc))
+        # April to June for two fuel types, minus nothing since July holds every series' newest row
+        self.assertEqual(moved, 3 * 3 * 3)
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM prices").fetchone()[0], 9)
+
+        self.db.cold_storage_path = self.cold_path
+        for (start, end), expected in zip(ranges, before):
+            pd.testing.assert_frame_equal(self.sorted_data(expected), self.sorted_data(self.db.fetch_data("E10", start_date=start, end_date=end)))
+        pd.testing.assert_frame_equal(before_avg, self.db.fetch_average_price("E10", interval="M"))
+        postcode_df = self.db.fetch_data("E10", postcode=["2134"])
+        self.assertEqual(set(postcode_df["station_code"]), {"1"})
+        self.assertEqual(len(postcode_df), 12)
+
+    def test_partitions_outside_range_are_skipped(self):
+        tier_closed_months(self.db.conn, self.cold_path, now=datetime(2025, 7, 20, tzinfo=timezone.utc))
+        self.db.cold_storage_path = self.cold_path
+
+        names = [os.path.basename(path) for path in self.db.cold_partitions("E10", 1748736000, 1749340800)]
+        self.assertEqual(names, ["2025-06.parquet"])
+        self.assertEqual(len(self.db.cold_partitions("E10")), 3)
+        self.assertEqual(self.db.cold_partitions("E10", 1751328000, 1753056000), [])
+
+
+class SpatialIndexTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.postcode_db_path = os.path.join(self.tmp.name, "postcodes.db")
+        rng = np.random.default_rng(0)
+        self.points = pd.DataFrame({
+            "postcode": [str(2000 + i) for i in range(400)],
+            "suburb": [f"Suburb {i}" for i in range(400)],
+            "latitude": rng.normal(-33.87, 0.2, 400),
+            "longitude": rng.normal(151.1, 0.2, 400),
+        })
+        conn = sqlite3.connect(self.postcode_db_path)
+        self.points.to_sql("postcodes", conn, index=False)
+        # A second suburb for an existing postcode is never returned on its own
+        conn.execute("INSERT INTO postcodes VALUES ('2000', 'Second Suburb', -33.87, 151.1)")
+        conn.commit()
+        conn.close()
+        self.db = DatabaseR(self.postcode_db_path, read_only=True)
+
+    def tearDown(self):
+        self.db.unload()
+        self.tmp.cleanup()
+
+    def test_radius_query_matches_brute_force(self):
+        for latitude, longitude, radius_km in [(-33.87, 151.1, 5), (-33.7, 151.3, 12), (-34.5, 150.0, 3), (-33.87, 151.1, 500)]:
+            distances = haversine_km(latitude, longitude, self.points["latitude"].to_numpy(), self.points["longitude"].to_numpy())
+            expected = self.points.assign(distance_km=distances)
+            expected = expected[expected["distance_km"] <= radius_km].sort_values("distance_km")
+
+            suburbs = self.db.get_nearby_suburbs(latitude, longitude, radius_km, postcode_db_path=self.postcode_db_path)
+            self.assertEqual([s["postcode"] for s in suburbs], expected["postcode"].tolist())
+            for suburb, distance in zip(suburbs, expected["distance_km"]):
+                self.assertAlmostEqual(suburb["distance_km"], distance)
+        self.assertNotIn("Second Suburb", [s["suburb"] for s in suburbs])
+
+    def test_index_is_cached_until_file_changes(self):
+        index = postcode_index(self.postcode_db_path)
+        self.assertIs(postcode_index(self.postcode_db_path), index)
+
+        conn = sqlite3.connect(self.postcode_db_path)
+        conn.execute("INSERT INTO postcodes VALUES ('2999', 'New Suburb', -35.0, 149.0)")
+        conn.commit()
+        conn.close()
+        os.utime(self.postcode_db_path, (0, os.path.getmtime(self.postcode_db_path) + 1))
+
+        suburbs = self.db.get_nearby_suburbs(-35.0, 149.0, 1, postcode_db_path=self.postcode_db_path)
+        self.assertEqual([s["postcode"] for s in suburbs], ["2999"])
+        self.assertIsNot(postcode_index(self.postcode_db_path), index)
+
+    def test_gazetteer_lookups(self):
+        conn = sqlite3.connect(self.postcode_db_path)
+        conn.executemany("INSERT INTO postcodes VALUES (?, ?, ?, ?)", [
+            ("2600", "Burwood", -33.877, 151.104),
+            ("2600", "Burwood  North", -33.86, 151.1),
+            ("800", "Darwin", -12.46, 130.84),
+        ])
+        conn.commit()
+        conn.close()
+        coordinates = lambda *args: self.db.suburb_to_coordinates(*args, postcode_db_path=self.postcode_db_path)
+
+        self.assertEqual(coordinates("2000"), tuple(self.points.loc[0, ["latitude", "longitude"]]))
+        self.assertEqual(coordinates("2000", "second suburb"), (-33.87, 151.1))
+        self.assertEqual(coordinates(2600, " BURWOOD north "), (-33.86, 151.1))
+        # Unknown suburbs fall back to the postcode
+        self.assertEqual(coordinates("2600", "Nowhere"), (-33.877, 151.104))
+        self.assertEqual(coordinates("0800"), (-12.46, 130.84))
+        self.assertIsNone(coordinates("9999"))
+        self.assertIsNone(self.db.suburb_to_coordinates("2134", postcode_db_path=os.path.join(self.tmp.name, "missing.db")))
+
+    def test_warmup_loads_gazetteer_at_startup(self):
+        from django.apps import apps
+        from django.test import override_settings
+        from database import spatial
+        spatial._postcode_indexes.pop(self.postcode_db_path, None)
+
+        with override_settings(POSTCODE_DB_PATH=self.postcode_db_path, POSTCODE_WARMUP=False):
+            apps.get_app_config("fuel_backend").ready()
+        self.assertNotIn(self.postcode_db_path, spatial._postcode_indexes)
+        with override_settings(POSTCODE_DB_PATH=self.postcode_db_path, POSTCODE_WARMUP=True):
+            apps.get_app_config("fuel_backend").ready()
+        self.assertIn(self.postcode_db_path, spatial._postcode_indexes)
+
+
+class StationSearchTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Stations due east of the origin, about 1.1 km apart
+        self.db.save_stations_to_db([
+            {"code": str(i), "name": f"Station {i}", "address": f"{i} Main St, Town NSW 2134", "location": {"latitude": 0.0, "longitude": i / 100}}
+            for i in range(1, 7)
+        ])
+        self.db.save_prices_to_db([
+            {"stationcode": str(i), "fueltype": "E10", "price": 200.0 - i, "lastupdated": "01/07/2025 09:00:00"}
+            for i in (1, 2, 3, 5, 6)
+        ] + [{"stationcode": "4", "fueltype": "U91", "price": 150.0, "lastupdated": "01/07/2025 09:00:00"}])
+        self.reader = DatabaseR(self.db_path, read_only=True)
+
+    def tearDown(self):
+        self.reader.unload()
+        super().tearDown()
+
+    def test_radius_search_sorted_by_price_or_distance(self):
+        by_price = self.reader.fetch_nearby_stations("E10", 0.0, 0.0, radius_km=3.5)
+        self.assertEqual(by_price["station_code"].tolist(), ["3", "2", "1"])
+        self.assertEqual(by_price["price"].tolist(), [197.0, 198.0, 199.0])
+
+        by_distance = self.reader.fetch_nearby_stations("E10", 0.0, 0.0, radius_km=3.5, sort_by="distance")
+        self.assertEqual(by_distance["station_code"].tolist(), ["1", "2", "3"])
+        self.assertAlmostEqual(by_distance["distance_km"].iloc[0], 1.112, places=2)
+
+    def test_k_nearest_skips_stations_without_the_fuel_type(self):
+        nearest = self.reader.fetch_nearby_stations("E10", 0.0, 0.042, radius_km=None, k=3, sort_by="distance")
+        # Station 4 is the nearest but only sells U91
+        self.assertEqual(nearest["station_code"].tolist(), ["5", "3", "6"])
+        within = self.reader.fetch_nearby_stations("E10", 0.0, 0.042, radius_km=1.5, k=3, sort_by="distance")
+        self.assertEqual(within["station_code"].tolist(), ["5", "3"])
+
+    def test_index_rebuilds_when_ingest_changes_stations(self):
+        self.assertEqual(len(self.reader.fetch_nearby_stations("E10", 0.0, 1.0, radius_km=1)), 0)
+        self.db.save_stations_to_db([{"code": "7", "name": "Station 7", "address": "7 Main St, Town NSW 2134", "location": {"latitude": 0.0, "longitude": 1.0}}])
+        self.db.save_prices_to_db([{"stationcode": "7", "fueltype": "E10", "price": 190.0, "lastupdated": "01/07/2025 09:00:00"}])
+        self.assertEqual(self.reader.fetch_nearby_stations("E10", 0.0, 1.0, radius_km=1)["station_code"].tolist(), ["7"])
+
+
+class ResponseCacheTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        close_pools()
+        self.client = Client()
+        self.db.cursor.execute("INSERT INTO stations (station_code, name, postcode) VALUES ('1', 'Station 1', '2134')")
+        self.db.conn.commit()
+        self.db.save_prices_to_db([{"stationcode": "1", "fueltype": "E10", "price": 170.0, "lastupdated": "01/07/2025 09:00:00"}])
+        # A predict DB from before forecasts bumped a generation
+        predict_db_path = os.path.join(self.tmp.name, "future_prices.db")
+        conn = sqlite3.connect(predict_db_path)
+        conn.execute("CREATE TABLE future_forecast (id INTEGER PRIMARY KEY, timestamp INTEGER, forecast_price REAL, fuel_type TEXT)")
+        conn.close()
+        self.settings = override_settings(FUEL_DB_PATH=self.db_path, FUEL_PREDICT_DB_PATH=predict_db_path, GENERATION_CHECK_SECONDS=0)
+        self.settings.enable()
+        self.url = "/api/average_price_daily/?fuel_type=E10&start_date=2025-07-01&end_date=2025-07-03"
+
+    def tearDown(self):
+        self.settings.disable()
+        close_pools()
+        super().tearDown()
+        cache.clear()
+
+    def test_generation_bumped_only_when_prices_change(self):
+        generation = lambda: self.db.cursor.execute("SELECT value FROM generations WHERE name = 'prices'").fetchone()[0]
+        self.assertEqual(generation(), 1)
+        self.db.save_prices_to_db([{"stationcode": "1", "fueltype": "E10", "price": 170.0, "lastupdated": "01/07/2025 09:00:00"}])
+        self.assertEqual(generation(), 1)
+        self.db.save_prices_to_db([{"stationcode": "1", "fueltype": "E10", "price": 172.0, "lastupdated": "02/07/2025 09:00:00"}])
+        self.assertEqual(generation(), 2)
+
+    def test_repeat_requests_served_from_cache_until_ingest(self):
+        with patch.object(DatabaseR, "fetch_average_price", autospec=True, side_effect=DatabaseR.fetch_average_price) as spy_fetch:
+            first = self.client.get(self.url)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first.json(), [{"date": "2025-07-01", "avg_price": 170.0}])
+            self.assertIn("Last-Modified", first)
+            queried = spy_fetch.call_count
+
+            # Parameter order and blanks do not matter
+            second = self.client.get("/api/average_price_daily/?end_date=2025-07-03&postcodes=&start_date=2025-07-01&fuel_type=E10")
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second["ETag"], first["ETag"])
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(spy_fetch.call_count, queried)
+
+            self.db.save_prices_to_db([{"stationcode": "1", "fueltype": "E10", "price": 172.0, "lastupdated": "02/07/2025 09:00:00"}])
+            third = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(third.status_code, 200)
+            self.assertNotEqual(third["ETag"], first["ETag"])
+            self.assertEqual(len(third.json()), 2)
+            self.assertGreater(spy_fetch.call_count, queried)
+
+    def test_streamed_responses_are_validated_but_not_stored(self):
+        with override_settings(STREAM_MIN_POINTS=0):
+            first = self.client.get(self.url)
+            self.assertTrue(first.streaming)
+            self.assertEqual(json.loads(streamed_content(first)), [{"date": "2025-07-01", "avg_price": 170.0}])
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+            self.assertTrue(self.client.get(self.url).streaming)
+
+    def test_cache_hits_do_not_wait_for_the_database_executor(self):
+        with override_settings(GENERATION_CHECK_SECONDS=60):
+            first = self.client.get(self.url)
+            with patch("fuel_backend.cache.run_blocking", side_effect=AssertionError("executor used")):
+                self.assertEqual(self.client.get(self.url).content, first.content)
+                self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+    def test_generation_checks_are_cached_between_requests(self):
+        with override_settings(GENERATION_CHECK_SECONDS=60):
+            first = self.client.get(self.url)
+            self.db.save_prices_to_db([{"stationcode": "1", "fueltype": "E10", "price": 172.0, "lastupdated": "02/07/2025 09:00:00"}])
+            with patch("fuel_backend.cache.connect") as mock_connect:
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(response.status_code, 304)
+            mock_connect.assert_not_called()
+
+
+class BatchAveragePriceTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        close_pools()
+        self.client = Client()
+        self.db.cursor.executemany("INSERT INTO stations (station_code, name, postcode) VALUES (?, ?, ?)",
+                                   [("1", "Station 1", "2134"), ("2", "Station 2", "2135")])
+        self.db.conn.commit()
+        self.db.save_prices_to_db([
+            {"stationcode": code, "fueltype": fuel_type, "price": base + day * 1.5 + int(code),
+             "lastupdated": f"{day:02d}/07/2025 09:00:00"}
+            for day in range(1, 21) for code in ("1", "2") for fuel_type, base in (("E10", 170.0), ("U91", 180.0), ("P98", 200.0))
+            if (day + int(code)) % 3
+        ])
+        predict_db_path = os.path.join(self.tmp.name, "future_prices.db")
+        conn = sqlite3.connect(predict_db_path)
+        conn.execute("CREATE TABLE future_forecast (id INTEGER PRIMARY KEY, timestamp INTEGER, forecast_price REAL, fuel_type TEXT)")
+        conn.executemany("INSERT INTO future_forecast (timestamp, forecast_price, fuel_type) VALUES (?, ?, ?)",
+                         [(1753056000 + day * 86400, 190.0 + day, fuel_type) for day in range(3) for fuel_type in ("E10", "P98")])
+        conn.commit()
+        conn.close()
+        self.settings = override_settings(FUEL_DB_PATH=self.db_path, FUEL_PREDICT_DB_PATH=predict_db_path, GENERATION_CHECK_SECONDS=0)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        close_pools()
+        super().tearDown()
+        cache.clear()
+
+    def test_batch_matches_single_fuel_requests_from_one_query(self):
+        dates = "start_date=2025-07-01&end_date=2025-07-31"
+        with patch.object(DatabaseR, "fetch_average_prices", autospec=True, side_effect=DatabaseR.fetch_average_prices) as spy_batch, \
+                patch.object(DatabaseR, "fetch_average_price", autospec=True, side_effect=DatabaseR.fetch_average_price) as spy_single:
+            response = self.client.get(f"/api/average_price_batch/?fuel_types=E10,U91,P98&intervals=D,W,M&{dates}")
+            self.assertEqual(spy_batch.call_count, 1)
+            spy_single.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        batch = response.json()
+        self.assertEqual(list(batch), ["E10", "U91", "P98"])
+
+        for fuel_type in ("E10", "U91", "P98"):
+            self.assertEqual(list(batch[fuel_type]), ["D", "W", "M"])
+            for interval in ("D", "W", "M"):
+                single = self.client.get(f"/api/average_price_daily/?fuel_type={fuel_type}&interval={interval}&{dates}").json()
+                self.assertEqual(batch[fuel_type][interval], single)
+        self.assertEqual(batch["E10"]["D"][-1], {"date": "2025-07-23", "avg_price": 192.0})
+
+    def test_forecasts_only_extend_daily_series(self):
+        dates = "start_date=2025-07-01&end_date=2025-07-31"
+        batch = self.client.get(f"/api/average_price_batch/?fuel_types=E10&intervals=W,M&{dates}").json()["E10"]
+        for interval in ("W", "M"):
+            single = self.client.get(f"/api/average_price_daily/?fuel_type=E10&interval={interval}&{dates}").json()
+            self.assertEqual(single, batch[interval])
+            # History ends on 2025-07-20, so no bucket starts on a forecast day
+            self.assertFalse([row for row in single if row["date"] > "2025-07-20"])
+
+    def test_columns_format_and_weekly_interval(self):
+        response = self.client.get("/api/average_price_batch/?fuel_types=U91&intervals=W&start_date=2025-06-30&end_date=2025-07-31&format=columns")
+        self.assertEqual(response.status_code, 200)
+        weekly = response.json()["U91"]["W"]
+        self.assertEqual(weekly["dates"], ["2025-06-30", "2025-07-07", "2025-07-14"])
+        self.assertEqual(len(weekly["prices"]), 3)
+
+    def test_invalid_interval_and_no_data(self):
+        self.assertEqual(self.client.get("/api/average_price_batch/?fuel_types=E10&intervals=D,Y").status_code, 400)
+        self.assertEqual(self.client.get("/api/average_price_batch/?fuel_types=LPG&start_date=2025-07-01&end_date=2025-07-31").status_code, 404)
+
+
+class PriceHistoryTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        close_pools()
+        self.client = Client()
+        self.cold_path = os.path.join(self.tmp.name, "cold")
+        self.db.cursor.executemany("INSERT INTO stations (station_code, name, postcode) VALUES (?, ?, ?)",
+                                   [("1", "Station 1", "2134"), ("2", "Station 2", "2135"), ("3", "Station 3", "2134")])
+        self.db.conn.commit()
+        prices = [{"stationcode": "3", "fueltype": "E10", "price": 160.0, "lastupdated": "02/04/2025 09:00:00"}]
+        for month in (4, 5, 6, 7):
+            for day in (1, 15, 28):
+                # Stations 1 and 2 report at the same second, ties are ordered by station_code
+                for code, fuel_type, base in (("1", "E10", 170.0), ("2", "E10", 180.0), ("2", "U91", 185.0)):
+                    prices.append({"stationcode": code, "fueltype": fuel_type, "price": base + month + day / 100,
+                                   "lastupdated": f"{day:02d}/{month:02d}/2025 09:00:00"})
+        self.db.save_prices_to_db(prices)
+        self.expected = self.db.fetch_data("E10").sort_values(["timestamp", "station_code"])[["timestamp", "station_code", "fuel_type", "price"]]
+
+        tier_closed_months(self.db.conn, self.cold_path, now=datetime(2025, 7, 20, tzinfo=timezone.utc))
+        # Station 3's only row is its newest, so it stays hot among cold months. A row
+        # of a month part way through tiering sits in both tiers
+        self.assertEqual(self.db.cursor.execute("SELECT COUNT(*) FROM prices WHERE timestamp < 1746057600").fetchone()[0], 1)
+        self.db.cursor.execute("INSERT INTO prices VALUES ('1', 'E10', 175.15, 1747299600)")
+        self.db.conn.commit()
+        self.settings = override_settings(FUEL_DB_PATH=self.db_path, COLD_STORAGE_PATH=self.cold_path, GENERATION_CHECK_SECONDS=0, HISTORY_PAGE_SIZE=4)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        close_pools()
+        super().tearDown()
+        cache.clear()
+
+    def expected_rows(self, df=None):
+        df = self.expected if df is None else df
+        return [dict(zip(df.columns, row)) for row in df.itertuples(index=False, name=None)]
+
+    def fetch_pages(self, query):
+        rows, pages, url = [], 0, f"/api/price_history/?{query}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            rows.extend(page["rows"])
+            pages += 1
+            url = f"/api/price_history/?{query}&cursor={page['next']}" if page["next"] else None
+        return rows, pages
+
+    def test_pages_walk_both_tiers_in_key_order(self):
+        rows, pages = self.fetch_pages("fuel_type=E10&limit=5")
+        self.assertEqual(rows, self.expected_rows())
+        self.assertEqual(pages, 5)
+
+        rows, _ = self.fetch_pages("fuel_type=E10&limit=3&postcodes=2134&start_date=2025-05-01&end_date=2025-06-30")
+        expected = self.expected[(self.expected["station_code"].isin(["1", "3"])) & self.expected["timestamp"].between(1746057600, 1751327999)]
+        self.assertEqual(rows, self.expected_rows(expected))
+        rows, _ = self.fetch_pages("fuel_type=U91&station_codes=2,3&limit=100")
+        self.assertEqual(len(rows), 12)
+
+    async def test_ndjson_export_streams_chunks_outside_the_reader_pool(self):
+        response = await self.async_client.get("/api/price_history/?fuel_type=E10&format=ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 7)
+        self.assertEqual([json.loads(line) for line in b"".join(chunks).splitlines()], self.expected_rows())
+        # Exports read on their own connection and never take a pooled reader
+        self.assertIsNone(get_pool(self.db_path))
+
+        # An export can resume from a page cursor
+        page = (await self.async_client.get("/api/price_history/?fuel_type=E10&limit=20")).json()
+        response = await self.async_client.get(f"/api/price_history/?fuel_type=E10&format=ndjson&cursor={page['next']}")
+        lines = b"".join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected_rows()[20:])
+
+    def test_pages_are_revalidated_but_not_stored(self):
+        first = self.client.get("/api/price_history/?fuel_type=E10&limit=5")
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNone(cache.get(f"response:{first['ETag']}"))
+        self.assertEqual(self.client.get("/api/price_history/?fuel_type=E10&limit=5", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get("/api/price_history/?fuel_type=E10&limit=5").content, first.content)
+
+    def test_compaction_invalidates_cached_history(self):
+        self.db.cursor.executemany("INSERT INTO prices VALUES ('1', 'E10', ?, ?)",
+                                   [(199.9, 1754000000), (199.9, 1754086400), (201.9, 1754172800)])
+        self.db.conn.commit()
+        url = "/api/price_history/?fuel_type=E10&start_date=2025-07-31&end_date=2025-08-03"
+        first = self.client.get(url)
+        self.assertEqual(len(first.json()["rows"]), 3)
+
+        self.assertEqual(compact_prices(self.db.conn), 1)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual([row["timestamp"] for row in second.json()["rows"]], [1754000000, 1754172800])
+
+    def test_export_holds_no_snapshot_between_chunks(self):
+        db = DatabaseR(self.db_path, read_only=True, cold_storage_path=self.cold_path)
+        chunks = db.iter_price_history("E10", chunk_size=4)
+        self.assertEqual(len(next(chunks)), 4)
+        # A write and a full checkpoint while the export waits on its client
+        self.db.cursor.execute("INSERT INTO prices VALUES ('3', 'E10', 199.9, 1754000000)")
+        self.db.conn.commit()
+        busy, _, _ = self.db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        self.assertEqual(busy, 0)
+        rows = [row for chunk in chunks for row in chunk]
+        self.assertEqual(len(rows), len(self.expected) - 4 + 1)
+        self.assertEqual(rows[-1], (1754000000, "3", "E10", 199.9))
+        db.unload()
+
+    def test_invalid_cursor_and_limit(self):
+        for query in ("cursor=abc", "cursor=WzFd", "limit=0", "limit=100000", "limit=x"):
+            self.assertEqual(self.client.get(f"/api/price_history/?{query}").status_code, 400, query)
+
+
+class ReaderPoolTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        close_pools()
+        self.client = Client()
+        self.db.save_stations_to_db([{"code": "1", "name": "Station 1", "address": "1 Main St, Burwood NSW 2134", "location": {"latitude": -33.877, "longitude": 151.104}}])
+        self.db.save_prices_to_db([{"stationcode": "1", "fueltype": "E10", "price": 170.0, "lastupdated": "01/07/2025 09:00:00"}])
+        postcode_db_path = os.path.join(self.tmp.name, "postcodes.db")
+        conn = sqlite3.connect(postcode_db_path)
+        conn.execute("CREATE TABLE postcodes (postcode TEXT, suburb TEXT, latitude REAL, longitude REAL)")
+        conn.execute("INSERT INTO postcodes VALUES ('2134', 'Burwood', -33.877, 151.104)")
+        conn.commit()
+        conn.close()
+        self.settings = override_settings(FUEL_DB_PATH=self.db_path, POSTCODE_DB_PATH=postcode_db_path, DB_POOL_SIZE=2)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        close_pools()
+        super().tearDown()
+
+    def test_connections_are_reused_across_requests(self):
+        with patch("database.DatabaseR.connect", wraps=connect) as spy_connect:
+            for _ in range(5):
+                response = self.client.get("/api/nearby_stations/?postcode=2134")
+                self.assertEqual(response.status_code, 200)
+            self.client.get("/api/nearby_stations/?postcode=9999")
+        spy_connect.assert_called_once()
+        self.assertTrue(spy_connect.call_args.kwargs["read_only"])
+        self.assertEqual(spy_connect.call_args.kwargs["cached_statements"], settings.DB_STATEMENT_CACHE)
+        pool = get_pool(self.db_path)
+        self.assertEqual((pool.open_count, pool.idle_count), (1, 1))
+
+    def test_concurrent_requests_never_exceed_pool_size(self):
+        statuses = []
+        def request():
+            statuses.append(Client().get("/api/nearby_stations/?postcode=2134").status_code)
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [200] * 8)
+        pool = get_pool(self.db_path)
+        # Every reader that was opened is back in the pool
+        self.assertLessEqual(pool.open_count, 2)
+        self.assertEqual(pool.idle_count, pool.open_count)
+
+    def test_broken_and_unhealthy_readers_are_replaced(self):
+        opened = []
+        def factory():
+            opened.append(DatabaseR(self.db_path, read_only=True, check_same_thread=False))
+            return opened[-1]
+        pool = ReaderPool(factory, size=1)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.reader() as db:
+                db.conn.execute("SELECT * FROM missing_table")
+        with pool.reader() as db:
+            self.assertIs(db, opened[1])
+        # Queries through pandas fail with its own DatabaseError, not sqlite3's
+        with self.assertRaises(pd.errors.DatabaseError):
+            with pool.reader() as db:
+                pd.read_sql_query("SELECT * FROM missing_table", db.conn)
+        with pool.reader() as db:
+            self.assertIs(db, opened[2])
+        # Closed behind the pool's back, fails its health check on the next checkout
+        opened[2].conn.close()
+        with pool.reader() as db:
+            self.assertIs(db, opened[3])
+        self.assertEqual((pool.open_count, pool.idle_count), (1, 1))
+
+        with pool.reader():
+            pool.timeout = 0.01
+            with self.assertRaises(TimeoutError):
+                pool.acquire()
+
+
+class CurrentPricesTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db.cursor.executemany("INSERT INTO stations (station_code, name, postcode) VALUES (?, ?, ?)",
+                                   [("1", "Station 1", "2134"), ("2", "Station 2", "2135"), ("3", "Station 3", "2000")])
+        self.db.conn.commit()
+
+    def test_newest_prices_follow_ingest_in_any_order(self):
+        self.db.save_prices_to_db([
+            {"stationcode": "1", "fueltype": "E10", "price": 171.0, "lastupdated": "02/07/2025 10:00:00"},
+            {"stationcode": "2", "fueltype": "E10", "price": 180.0, "lastupdated": "01/07/2025 10:00:00"},
+        ])
+        # An older row arriving late must not replace the newer one
+        self.db.save_prices_to_db([
+            {"stationcode": "1", "fueltype": "E10", "price": 170.0, "lastupdated": "01/07/2025 10:00:00"},
+            {"stationcode": "2", "fueltype": "E10", "price": 178.0, "lastupdated": "03/07/2025 10:00:00"},
+            {"stationcode": "3", "fueltype": "U91", "price": 190.0, "lastupdated": "03/07/2025 10:00:00"},
+        ])
+
+        df = self.db.fetch_data("E10", postcode=["2134", "2135"], is_newest=True).sort_values("station_code")
+        self.assertEqual(df["price"].tolist(), [171.0, 178.0])
+        self.assertEqual(df["station_code"].tolist(), ["1", "2"])
+
+        # Same rows as the MAX(timestamp) per station lookup over the full history
+        expected = self.db.cursor.execute("""
+            SELECT station_code, price FROM prices p
+            WHERE fuel_type = 'E10' AND timestamp = (
+                SELECT MAX(timestamp) FROM prices WHERE fuel_type = 'E10' AND station_code = p.station_code
+            ) ORDER BY station_code
+        """).fetchall()
+        self.assertEqual(list(zip(df["station_code"], df["price"])), expected)
+
+    def test_newest_lookup_does_not_touch_price_history(self):
+        query, params = self.db.build_data_query("E10", postcode=["2134"], is_newest=True)
+        plan = [row[-1] for row in self.db.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+        # current_prices is joined under the prices alias; the history table would show its own indexes
+        self.assertIn("SEARCH prices USING PRIMARY KEY (station_code=? AND fuel_type=?)", plan)
+        self.assertFalse(any(step.startswith("SCAN") or "idx_prices" in step or "autoindex_prices" in step for step in plan), plan)
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?")[0]
+        server.requests.append((path, self.client_address[1], self.headers))
+        if path in getattr(server, "barrier_paths", ()):
+            # Only returns once every barrier path has a request in flight
+            server.barrier.wait(timeout=5)
+        queued = server.responses.get(path, [])
+        status, body = queued.pop(0) if len(queued) > 1 else queued[0]
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetcherTest(TestCase):
+    TOKEN_PATH = "/oauth/client_credential/accesstoken"
+    PRICES_PATH = "/FuelPriceCheck/v1/fuel/prices"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubApiHandler)
+        self.server.requests = []
+        self.server.responses = {
+            self.TOKEN_PATH: [(200, {"access_token": "token-1", "expires_in": "43199"})],
+            self.PRICES_PATH: [(200, {"stations": [], "prices": []})],
+        }
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def make_fetcher(self, **options):
+        options.setdefault("backoff_factor", 0)
+        options.setdefault("token_cache_path", os.path.join(self.tmp.name, "token.json"))
+        return Fetcher("Basic abc", "key", base_url=self.base_url, **options)
+
+    def paths(self):
+        return [path for path, _, _ in self.server.requests]
+
+    def test_requests_reuse_one_keep_alive_connection(self):
+        fetcher = self.make_fetcher()
+        fetcher.fetch_all_v1_data()
+        fetcher.fetch_all_v1_data()
+        fetcher.close()
+
+        self.assertEqual(self.paths(), [self.TOKEN_PATH, self.PRICES_PATH, self.PRICES_PATH])
+        self.assertEqual(len({port for _, port, _ in self.server.requests}), 1)
+        self.assertIn("gzip", self.server.requests[1][2]["Accept-Encoding"])
+
+    def test_cached_token_is_reused_across_instances(self):
+        self.make_fetcher().close()
+        fetcher = self.make_fetcher()
+        fetcher.fetch_all_v1_data()
+        fetcher.close()
+
+        self.assertEqual(self.paths().count(self.TOKEN_PATH), 1)
+        self.assertEqual(fetcher.token, "token-1")
+        self.assertEqual(self.server.requests[-1][2]["authorization"], "Bearer token-1")
+
+    def test_token_cache_directory_is_created(self):
+        token_cache_path = os.path.join(self.tmp.name, "cache", "token.json")
+        self.make_fetcher(token_cache_path=token_cache_path).close()
+        self.assertTrue(os.path.exists(token_cache_path))
+        self.make_fetcher(token_cache_path=token_cache_path).close()
+
+        self.assertEqual(self.paths().count(self.TOKEN_PATH), 1)
+
+    def test_cached_token_for_other_credentials_is_ignored(self):
+        self.make_fetcher().close()
+        other = Fetcher("Basic other", "key", base_url=self.base_url, token_cache_path=os.path.join(self.tmp.name, "token.json"))
+        other.close()
+
+        self.assertEqual(self.paths().count(self.TOKEN_PATH), 2)
+
+    def test_transient_errors_are_retried(self):
+        self.server.responses[self.PRICES_PATH] = [
+            (503, {"errorDetails": "busy"}),
+            (503, {"errorDetails": "busy"}),
+            (200, {"stations": [], "prices": []}),
+        ]
+        fetcher = self.make_fetcher(retries=3)
+        self.assertEqual(fetcher.fetch_all_v1_data(), {"stations": [], "prices": []})
+        fetcher.close()
+
+        self.assertEqual(self.paths().count(self.PRICES_PATH), 3)
+
+    def test_revoked_token_is_refreshed_once(self):
+        self.server.responses[self.PRICES_PATH] = [
+            (401, {"errorDetails": "Invalid token"}),
+            (200, {"stations": [], "prices": []}),
+        ]
+        fetcher = self.make_fetcher()
+        self.assertEqual(fetcher.fetch_all_v1_data(), {"stations": [], "prices": []})
+        fetcher.close()
+
+        self.assertEqual(self.paths(), [self.TOKEN_PATH, self.PRICES_PATH, self.TOKEN_PATH, self.PRICES_PATH])
+
+    def test_update_db_async_fetches_both_endpoints_concurrently(self):
+        new_path = "/FuelPriceCheck/v1/fuel/prices/new"
+        self.server.responses[self.PRICES_PATH] = [(200, {"stations": [], "prices": [
+            {"stationcode": "1", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"},
+        ]})]
+        self.server.responses[new_path] = [(200, {"stations": [], "prices": [
+            {"stationcode": "1", "fueltype": "E10", "price": 169.9, "lastupdated": "01/07/2025 12:00:00"},
+        ]})]
+        self.server.barrier = threading.Barrier(2)
+        self.server.barrier_paths = (self.PRICES_PATH, new_path)
+
+        db = DatabaseW(os.path.join(self.tmp.name, "fuel_prices.db"), 0, "Basic abc", "key",
+                       concurrent_fetch=True, base_url=self.base_url)
+        result = asyncio.run(db.update_db_async())
+        db.fetcher.close()
+        db.unload()
+
+        self.assertIsNone(result)
+        self.assertFalse(self.server.barrier.broken)
+        self.assertEqual(db.last_cycle_stats, {"mode": "full", "inserted": 2, "skipped": 0})
+
+    def test_streamed_snapshot_is_written_in_batches(self):
+        self.server.responses[self.PRICES_PATH] = [(200, {
+            "stations": [
+                {"brandid": "1", "stationid": "10", "brand": "7-Eleven", "code": "100", "name": "7-Eleven Burwood",
+                 "address": "Cnr Parramatta & Shaftsbury Rds, Burwood NSW 2134",
+                 "location": {"latitude": -33.869406, "longitude": 151.108603}, "isAdBlueAvailable": False},
+            ],
+            "prices": [
+                {"stationcode": "100", "fueltype": "E10", "price": 170.1, "lastupdated": "01/07/2025 10:00:00"},
+                {"stationcode": "100", "fueltype": "P98", "price": 199.9, "lastupdated": "01/07/2025 10:00:00"},
+                {"stationcode": "100", "fueltype": "U91", "price": 175.5, "lastupdated": "01/07/2025 10:00:00"},
+            ],
+        })]
+        fetcher = self.make_fetcher()
+        batches = list(fetcher.stream_all_v1_data(batch_size=2))
+        fetcher.close()
+
+        self.assertEqual([(key, len(batch)) for key, batch in batches], [("stations", 1), ("prices", 2), ("prices", 1)])
+        self.assertEqual(batches[0][1][0]["location"], {"latitude": -33.869406, "longitude": 151.108603})
+
+        db = DatabaseW(os.path.join(self.tmp.name, "fuel_prices.db"), 0, "Basic abc", "key",
+                       stream_batch_size=2, base_url=self.base_url)
+        stats = {"mode": "full", "inserted": 0, "skipped": 0}
+        self.assertEqual(db.ingest_source("all", stats), 0)
+        db.fetcher.close()
+        db.unload()
+        self.assertEqual(stats["inserted"], 3)
+
+    def test_streamed_error_response_is_reported(self):
+        self.server.responses[self.PRICES_PATH] = [(403, {"errorDetails": "Forbidden"})]
+        fetcher = self.make_fetcher()
+        self.assertEqual(list(fetcher.stream_all_v1_data()), [("error", {"errorDetails": "Forbidden"})])
+        fetcher.close()
@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path("average_price_daily/", views.average_price_daily_view),
+    path("average_price_batch/", views.average_price_batch_view),
     path("average_price_predict/", views.average_predict_view),
     path("nearby_stations/", views.nearby_stations),
+    path("price_history/", views.price_history_view),
 ]
\ No newline at end of file
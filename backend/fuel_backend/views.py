@@ -2,12 +2,20 @@ from django.conf import settings
 from django.views.decorators.http import require_GET
 from django.http import JsonResponse
 import time
+import asyncio
+import base64
+import binascii
+import orjson
 from datetime import datetime, timedelta
 import sys
 import os
 import pandas as pd
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
-from database.DatabaseR import DatabaseR
+from database.DatabaseR import DatabaseR, INTERVAL_FORMATS, HISTORY_COLUMNS
+from database.aggregate import station_average
+from .cache import generation_cached
+from .serialize import series_response, frame_response, keyed_series_response, page_response, ndjson_response
+from .pool import reader, run_blocking, iterate_blocking, export_executor
 # Create your views here.
 
 '''
@@ -21,16 +29,106 @@ Attributes:
     interval (str): Interval for price averaging, only used in fetch_average_price(), "D", "W", "M"
 '''
 def average_price(fuel_type=None, start_date=None, end_date=None, station_codes=None, postcodes=None, interval='D'):
-    db = DatabaseR(settings.FUEL_DB_PATH)
-    df = db.fetch_average_price(fuel_type=fuel_type, start_date=start_date, end_date=end_date, station_codes=station_codes, postcodes=postcodes, interval=interval)
-    db.unload()
-    return df
+    with fuel_db() as db:
+        return db.fetch_average_price(fuel_type=fuel_type, start_date=start_date, end_date=end_date, station_codes=station_codes, postcodes=postcodes, interval=interval)
 
 def average_future_price(fuel_type=None, start_date=None, end_date=None):
-    db = DatabaseR(settings.FUEL_PREDICT_DB_PATH)
-    df = db.fetch_future_forecast(fuel_type=fuel_type, start_date=start_date, end_date=end_date)
-    db.unload()
-    return df
+    with predict_db() as db:
+        return db.fetch_future_forecast(fuel_type=fuel_type, start_date=start_date, end_date=end_date)
+
+def average_prices(fuel_types, intervals, start_date=None, end_date=None, station_codes=None, postcodes=None):
+    with fuel_db() as db:
+        return db.fetch_average_prices(fuel_types, intervals, start_date=start_date, end_date=end_date, station_codes=station_codes, postcodes=postcodes)
+
+def average_future_prices(fuel_types, start_date=None, end_date=None):
+    with predict_db() as db:
+        return db.fetch_future_forecasts(fuel_types, start_date=start_date, end_date=end_date)
+
+def price_history_page(fuel_type, **search):
+    with fuel_db() as db:
+        return db.fetch_price_history(fuel_type, **search)
+
+def price_history_chunks(fuel_type, **search):
+    # Exports can outlast any request, so they read on a connection of their own
+    # instead of holding a pooled reader, closed when the stream ends or is dropped
+    db = DatabaseR(settings.FUEL_DB_PATH, read_only=True, check_same_thread=False, cold_storage_path=settings.COLD_STORAGE_PATH)
+    try:
+        yield from db.iter_price_history(fuel_type, chunk_size=settings.HISTORY_PAGE_SIZE, **search)
+    finally:
+        db.conn.close()
+
+def pooled_reader(db_path, **options):
+    # Pooled readers move between request threads, never at the same time
+    return reader(
+        db_path,
+        lambda: DatabaseR(db_path, read_only=True, check_same_thread=False, cached_statements=settings.DB_STATEMENT_CACHE, **options),
+        size=settings.DB_POOL_SIZE,
+        timeout=settings.DB_POOL_TIMEOUT,
+    )
+
+def fuel_db():
+    return pooled_reader(settings.FUEL_DB_PATH, cold_storage_path=settings.COLD_STORAGE_PATH)
+
+def predict_db():
+    return pooled_reader(settings.FUEL_PREDICT_DB_PATH)
+
+def nearby_prices(postcode, suburb=None, **search):
+    # Current prices around a postcode, or None when the postcode is unknown
+    with fuel_db() as db:
+        coords = db.suburb_to_coordinates(postcode, suburb, postcode_db_path=settings.POSTCODE_DB_PATH)
+        if not coords:
+            return None
+        return db.fetch_nearby_stations(latitude=coords[0], longitude=coords[1], **search)
+
+def forecast_series(df_pred):
+    # Forecast price per day, rounded, the latest forecast row winning for a repeated day
+    if df_pred is None or df_pred.empty:
+        return pd.Series(dtype=float, index=pd.Index([], dtype=object))
+    future = pd.Series(df_pred["forecast_price"].round(2).to_numpy(), index=pd.to_datetime(df_pred["timestamp"]).dt.strftime("%Y-%m-%d"))
+    return future[~future.index.duplicated(keep="last")]
+
+def interval_start(labels, interval):
+    # First day of each fetch_average_price interval label, weeks starting on Monday as %W does
+    if interval == "W":
+        return pd.to_datetime(labels + "-1", format="%Y-%W-%w")
+    return pd.to_datetime(labels, format="%Y-%m" if interval == "M" else "%Y-%m-%d")
+
+def history_with_forecast(df, future, start_date=None, end_date=None, interval="D"):
+    # Cross-station average per interval, with forecast days filling in after it
+    past = pd.Series(dtype=float, index=pd.Index([], dtype=object))
+    if df is not None and not df.empty:
+        df = df.assign(timestamp=interval_start(df["timestamp"], interval))
+        daily_avg = station_average(df).round(2)
+        past = pd.Series(daily_avg.to_numpy(), index=daily_avg.index.strftime("%Y-%m-%d"))
+
+    # Observed averages win over forecasts for the same day
+    merged = pd.concat([future[~future.index.isin(past.index)], past]).sort_index()
+
+    if start_date:
+        merged = merged[merged.index >= start_date]
+    if end_date:
+        merged = merged[merged.index <= end_date]
+    return merged
+
+def split_list(value):
+    # Comma separated query parameter, None when absent or blank
+    items = [item.strip() for item in value.split(",")] if value else []
+    return [item for item in items if item] or None
+
+def encode_cursor(after):
+    # Opaque to clients, the (timestamp, station_code) of the last row sent
+    return base64.urlsafe_b64encode(orjson.dumps(list(after))).decode() if after else None
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        timestamp, station_code = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(timestamp, int) or not isinstance(station_code, str):
+        raise ValueError("Invalid cursor")
+    return timestamp, station_code
 
 def date_to_epoch(date_str):
     if date_str is None:
@@ -46,7 +144,8 @@ def date_to_epoch_end_of_day(date_str):
     return int(time.mktime(dt.timetuple()))    
 
 @require_GET
-def average_price_daily_view(request):
+@generation_cached("prices", "forecast")
+async def average_price_daily_view(request):
     fuel_type = request.GET.get("fuel_type", "E10")
     # Restrict max historical data returned to 1 year
     start_date = request.GET.get("start_date", (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d"))
@@ -55,51 +154,74 @@ def average_price_daily_view(request):
     postcodes = request.GET.get("postcodes", None)
     interval = request.GET.get("interval", 'D')
 
-    df = average_price(
-        fuel_type=fuel_type,
-        start_date=date_to_epoch(start_date),
-        end_date=date_to_epoch_end_of_day(end_date),
-        station_codes=station_codes,
-        postcodes=postcodes,
-        interval=interval
+    # History and forecast live in different databases, query both at once
+    df, df_pred = await asyncio.gather(
+        run_blocking(
+            average_price,
+            fuel_type=fuel_type,
+            start_date=date_to_epoch(start_date),
+            end_date=date_to_epoch_end_of_day(end_date),
+            station_codes=station_codes,
+            postcodes=postcodes,
+            interval=interval
+        ),
+        run_blocking(average_future_price, fuel_type),
     )
 
-    past = {}
-    if df is not None and not df.empty:
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df_pivot = df.pivot_table(index="timestamp", columns="station_code", values="price")
-        df_pivot.bfill(inplace=True)
-        daily_avg = df_pivot.mean(axis=1).to_frame(name="avg_price")
-        daily_avg.reset_index(inplace=True)
-        for _, row in daily_avg.iterrows():
-            date_str = row["timestamp"].strftime("%Y-%m-%d")
-            past[date_str] = round(row["avg_price"], 2)
-
-    future = {}
-    df_pred = average_future_price(fuel_type)
-    if df_pred is not None and not df_pred.empty:
-        for _, row in df_pred.iterrows():
-            date_str = pd.to_datetime(row["timestamp"]).strftime("%Y-%m-%d")
-            future[date_str] = round(row["forecast_price"], 2)
-
-    merged = future.copy()
-    merged.update(past)
+    # Forecasts are daily, so they only extend the daily series
+    future = forecast_series(df_pred if interval == "D" else None)
+    merged = history_with_forecast(df, future, start_date, end_date, interval)
+    if merged.empty:
+        return JsonResponse({"error": "No data found"}, status=404)
+    return series_response(request, merged.index, merged.to_numpy())
 
-    if start_date:
-        merged = {k: v for k, v in merged.items() if k >= start_date}
-    if end_date:
-        merged = {k: v for k, v in merged.items() if k <= end_date}
+@require_GET
+@generation_cached("prices", "forecast")
+async def average_price_batch_view(request):
+    fuel_types = list(dict.fromkeys(split_list(request.GET.get("fuel_types")) or ["E10"]))
+    intervals = list(dict.fromkeys(split_list(request.GET.get("intervals")) or ["D"]))
+    start_date = request.GET.get("start_date", (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d"))
+    end_date = request.GET.get("end_date", (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d"))
+    station_codes = split_list(request.GET.get("station_codes"))
+    postcodes = split_list(request.GET.get("postcodes"))
+
+    if any(interval not in INTERVAL_FORMATS for interval in intervals):
+        return JsonResponse({"error": "intervals must be D, W or M"}, status=400)
+
+    # One grouped scan for every fuel type and interval, and one forecast query
+    df, df_pred = await asyncio.gather(
+        run_blocking(
+            average_prices,
+            fuel_types,
+            intervals,
+            start_date=date_to_epoch(start_date),
+            end_date=date_to_epoch_end_of_day(end_date),
+            station_codes=station_codes,
+            postcodes=postcodes,
+        ),
+        run_blocking(average_future_prices, fuel_types),
+    )
+
+    groups = dict(tuple(df.groupby(["fuel_type", "interval"], sort=False))) if not df.empty else {}
+    forecasts = dict(tuple(df_pred.groupby("fuel_type", sort=False))) if not df_pred.empty else {}
+    series = {}
+    found = False
+    for fuel_type in fuel_types:
+        series[fuel_type] = {}
+        for interval in intervals:
+            # Forecasts are daily, so they only extend the daily series
+            future = forecast_series(forecasts.get(fuel_type) if interval == "D" else None)
+            merged = history_with_forecast(groups.get((fuel_type, interval)), future, start_date, end_date, interval)
+            found = found or not merged.empty
+            series[fuel_type][interval] = (merged.index, merged.to_numpy())
 
-    data = [
-        {"date": date, "avg_price": avg_price}
-        for date, avg_price in sorted(merged.items())
-    ]
-    if not data:
+    if not found:
         return JsonResponse({"error": "No data found"}, status=404)
-    return JsonResponse(data, safe=False)
+    return keyed_series_response(request, series)
 
 @require_GET
-def average_predict_view(request):
+@generation_cached("forecast")
+async def average_predict_view(request):
     fuel_type = request.GET.get("fuel_type", "E10")
     start_date = request.GET.get("start_date", (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d"))
     end_date = request.GET.get("end_date", (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d"))
@@ -108,51 +230,73 @@ def average_predict_view(request):
     # postcodes = request.GET.get("postcodes", None)
     # interval = request.GET.get("interval", 'D')
 
-    future = {}
-    df_pred = average_future_price(fuel_type, start_date=date_to_epoch(start_date), end_date=date_to_epoch_end_of_day(end_date))
-    if df_pred is not None and not df_pred.empty:
-        for _, row in df_pred.iterrows():
-            date_str = pd.to_datetime(row["timestamp"]).strftime("%Y-%m-%d")
-            future[date_str] = round(row["forecast_price"], 2)
-
-    data = [
-        {"date": date, "avg_price": avg_price}
-        for date, avg_price in sorted(future.items())
-    ]
-    if not data:
+    df_pred = await run_blocking(average_future_price, fuel_type, start_date=date_to_epoch(start_date), end_date=date_to_epoch_end_of_day(end_date))
+    future = forecast_series(df_pred).sort_index()
+
+    if future.empty:
         return JsonResponse({"error": "No data found"}, status=404)
-    return JsonResponse(data, safe=False)
+    return series_response(request, future.index, future.to_numpy())
 
 @require_GET
-def nearby_stations(request):
-    db = DatabaseR(settings.FUEL_DB_PATH)
+async def nearby_stations(request):
     fuel_type = request.GET.get("fuel_type", "E10")
     suburb = request.GET.get("suburb", None)
     postcode = request.GET.get("postcode", None)
+    sort_by = request.GET.get("sort", "price")
 
     if not postcode:
         return JsonResponse({"error": "No postcode"}, status=400)
-    
-    coords = db.suburb_to_coordinates(postcode, suburb, postcode_db_path=settings.POSTCODE_DB_PATH)
-    suburbs = db.get_nearby_suburbs(latitude=coords[0], longitude=coords[1], radius_km=5, postcode_db_path=settings.POSTCODE_DB_PATH)
-
-    if not suburbs:
-        return JsonResponse({"error": "No nearby suburbs found"}, status=404)
-    
-    nearby_postcodes = [s["postcode"] for s in suburbs]
-
-    df = db.fetch_data(
-        fuel_type=fuel_type,
-        postcode=nearby_postcodes,
-        is_newest=True
-    )
+    if sort_by not in ("price", "distance"):
+        return JsonResponse({"error": "sort must be price or distance"}, status=400)
+    try:
+        limit = int(request.GET["limit"]) if request.GET.get("limit") else None
+        radius_km = float(request.GET["radius_km"]) if request.GET.get("radius_km") else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit or radius_km"}, status=400)
+    if (limit is not None and limit <= 0) or (radius_km is not None and not 0 < radius_km <= settings.NEARBY_MAX_RADIUS_KM):
+        return JsonResponse({"error": "Invalid limit or radius_km"}, status=400)
+    # A limit on its own searches outwards for the nearest stations
+    if radius_km is None and limit is None:
+        radius_km = settings.NEARBY_RADIUS_KM
 
+    df = await run_blocking(nearby_prices, postcode, suburb, fuel_type=fuel_type, radius_km=radius_km, k=limit, sort_by=sort_by)
+    if df is None:
+        return JsonResponse({"error": "Postcode not found"}, status=404)
     if df.empty:
         return JsonResponse({"error": "No price data found"}, status=404)
-    if "station_code" in df.columns:
-        df = df.drop(columns=["station_code"])
+    df = df.drop(columns=["station_code"])
+
+    return frame_response(request, df)
+
+# One entry per cursor of up to HISTORY_MAX_PAGE_SIZE rows would crowd the response
+# cache, pages are only revalidated
+@require_GET
+@generation_cached("prices", store=False)
+async def price_history_view(request):
+    fuel_type = request.GET.get("fuel_type", "E10")
+    start_date = request.GET.get("start_date", None)
+    end_date = request.GET.get("end_date", None)
+    station_codes = split_list(request.GET.get("station_codes"))
+    postcodes = split_list(request.GET.get("postcodes"))
+
+    try:
+        after = decode_cursor(request.GET.get("cursor"))
+        limit = int(request.GET["limit"]) if request.GET.get("limit") else settings.HISTORY_PAGE_SIZE
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor or limit"}, status=400)
+    if not 0 < limit <= settings.HISTORY_MAX_PAGE_SIZE:
+        return JsonResponse({"error": "Invalid cursor or limit"}, status=400)
+
+    search = dict(
+        start_date=date_to_epoch(start_date),
+        end_date=date_to_epoch_end_of_day(end_date),
+        station_codes=station_codes,
+        postcodes=postcodes,
+        after=after,
+    )
+    # Exports stream every row after the cursor, read a chunk at a time
+    if request.GET.get("format") == "ndjson":
+        return ndjson_response(HISTORY_COLUMNS, iterate_blocking(price_history_chunks(fuel_type, **search), export_executor()))
 
-    results = df.to_dict(orient="records")
-    sorted_results = sorted(results, key=lambda x: x["price"])
-    
-    return JsonResponse(sorted_results, safe=False)
\ No newline at end of file
+    df, next_after = await run_blocking(price_history_page, fuel_type, limit=limit, **search)
+    return page_response(request, df, encode_cursor(next_after))
@@ -0,0 +1,20 @@
+import asyncio
+try:
+    from .Fetcher import Fetcher
+except ImportError:
+    from Fetcher import Fetcher
+
+class AsyncFetcher(Fetcher):
+    """
+    Fetcher with awaitable endpoint calls. Each request runs on the pooled session
+    in a worker thread (including response.json()), so several endpoints can be in
+    flight at once while the event loop thread writes earlier responses to the DB.
+    """
+    async def fetch_async(self, path):
+        return await asyncio.to_thread(self.fetch, path)
+
+    async def fetch_all_v1_data_async(self):
+        return await self.fetch_async("/FuelPriceCheck/v1/fuel/prices")
+
+    async def fetch_new_v1_data_async(self):
+        return await self.fetch_async("/FuelPriceCheck/v1/fuel/prices/new")
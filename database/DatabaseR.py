@@ -1,12 +1,37 @@
-import sqlite3
 import pandas as pd
-from geopy.distance import geodesic
+import numpy as np
 import os
+import glob
+import heapq
+from itertools import chain, islice
+try:
+    from .connection import connect
+    from .tier import partition_bounds
+    from .spatial import postcode_index, station_index, EARTH_RADIUS_KM
+except ImportError:
+    from connection import connect
+    from tier import partition_bounds
+    from spatial import postcode_index, station_index, EARTH_RADIUS_KM
+
+# strftime format of the interval bucket an average is reported under, the same in
+# SQLite and Python
+INTERVAL_FORMATS = {
+    'D': '%Y-%m-%d',
+    'W': '%Y-%W',
+    'M': '%Y-%m',
+}
+
+# Raw price history rows, in keyset order by (timestamp, station_code) within a fuel type
+HISTORY_COLUMNS = ["timestamp", "station_code", "fuel_type", "price"]
 
 
 class DatabaseR:
-    def __init__(self, db_path):
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path, read_only=False, cold_storage_path=None, **connect_options):
+        self.db_path = db_path
+        # connect_options go to sqlite3.connect, e.g. check_same_thread or cached_statements
+        self.conn = connect(db_path, read_only=read_only, **connect_options)
+        # Closed months of raw prices moved out of SQLite by tier.py, if any
+        self.cold_storage_path = cold_storage_path
         self.cursor = self.conn.cursor()
 
     def fetch_stations(self, station_codes=None, brand_ids=None, station_ids=None, postcode=None):
@@ -40,10 +65,74 @@ class DatabaseR:
         df = pd.read_sql_query(query, self.conn, params=params)
         return df
 
+    def day_bounds(self, start_date, end_date):
+        """
+        Converts an inclusive range of epoch timestamps into [start, end) epoch bounds
+        covering whole UTC days, the same rows date(timestamp, 'unixepoch') BETWEEN
+        date(start) AND date(end) matches, but as a plain range an index can serve.
+        """
+        day = 24 * 60 * 60
+        return (int(start_date) // day) * day, (int(end_date) // day + 1) * day
+
     def fetch_data(self, fuel_type, start_date=None, end_date=None, station_codes=None, postcode=None, is_newest=False):
+        query, params = self.build_data_query(fuel_type, start_date, end_date, station_codes, postcode, is_newest)
+        df = pd.read_sql_query(query, self.conn, params=params)
+        if is_newest:
+            return df
+
+        cold_df = self.fetch_cold_data(fuel_type, start_date, end_date, station_codes, postcode)
+        if cold_df is None or cold_df.empty:
+            return df
+        if df.empty:
+            return cold_df
+        df = pd.concat([cold_df, df[cold_df.columns]], ignore_index=True)
+        # A month being tiered can briefly exist in both places
+        return df.drop_duplicates(subset=["station_code", "fuel_type", "timestamp"], keep="last").reset_index(drop=True)
+
+    def cold_partitions(self, fuel_type, start_date=None, end_date=None):
+        if not self.cold_storage_path:
+            return []
+        paths = sorted(glob.glob(os.path.join(glob.escape(self.cold_storage_path), f"fuel_type={glob.escape(fuel_type)}", "*.parquet")))
+        if not (start_date and end_date):
+            return paths
+        lower, upper = self.day_bounds(start_date, end_date)
+        partitions = []
+        for path in paths:
+            start, end = partition_bounds(os.path.splitext(os.path.basename(path))[0])
+            if start < upper and end > lower:
+                partitions.append(path)
+        return partitions
+
+    def fetch_cold_data(self, fuel_type, start_date=None, end_date=None, station_codes=None, postcode=None):
+        partitions = self.cold_partitions(fuel_type, start_date, end_date)
+        if not partitions:
+            return None
+
+        filters = []
+        if start_date and end_date:
+            lower, upper = self.day_bounds(start_date, end_date)
+            filters = [("timestamp", ">=", lower), ("timestamp", "<", upper)]
+        if station_codes:
+            filters.append(("station_code", "in", list(station_codes)))
+        prices = pd.concat([pd.read_parquet(path, filters=filters or None) for path in partitions], ignore_index=True)
+
+        query = "SELECT name, address, postcode, latitude, longitude, station_code FROM stations WHERE 1=1"
+        params = []
+        if postcode:
+            placeholders = ','.join('?' for _ in postcode)
+            query += f" AND postcode IN ({placeholders})"
+            params.extend(postcode)
+        stations = pd.read_sql_query(query, self.conn, params=params)
+
+        df = stations.merge(prices, on="station_code")
+        return df[["name", "address", "postcode", "latitude", "longitude", "fuel_type", "price", "timestamp", "station_code"]]
+
+    def build_data_query(self, fuel_type, start_date=None, end_date=None, station_codes=None, postcode=None, is_newest=False):
         if ((start_date and end_date) and is_newest):
                 raise ValueError("Please either specify a period or choose to fetch newest data, but not both")
-        base_query = """
+        # current_prices holds only the newest row per (station_code, fuel_type), kept up to date by DatabaseW
+        prices_table = "current_prices" if is_newest else "prices"
+        query = f"""
         SELECT 
             stations.name, 
             stations.address, 
@@ -57,7 +146,7 @@ class DatabaseR:
         FROM 
             stations
         JOIN 
-            prices ON stations.station_code = prices.station_code
+            {prices_table} AS prices ON stations.station_code = prices.station_code
         WHERE 
             prices.fuel_type = ?
         """
@@ -65,77 +154,180 @@ class DatabaseR:
         params = [fuel_type]
 
         if start_date and end_date:
-            base_query += " AND date(prices.timestamp, 'unixepoch') BETWEEN date(?, 'unixepoch') AND date(?, 'unixepoch')"
-            params.append(start_date)
-            params.append(end_date)
+            query += " AND prices.timestamp >= ? AND prices.timestamp < ?"
+            params.extend(self.day_bounds(start_date, end_date))
         
         if station_codes:
             placeholders = ','.join('?' for _ in station_codes)
-            base_query += f" AND prices.station_code IN ({placeholders})"
+            query += f" AND prices.station_code IN ({placeholders})"
             params.extend(station_codes)
 
         if postcode:
             placeholders = ','.join('?' for _ in postcode)
-            base_query += f" AND stations.postcode IN ({placeholders})"
+            query += f" AND stations.postcode IN ({placeholders})"
             params.extend(postcode)
 
-        if is_newest:
-            query = f"""
-                WITH latest_prices AS (
-                    SELECT
-                        station_code,
-                        MAX(timestamp) AS timestamp
-                    FROM
-                        prices
-                    WHERE fuel_type = ?
-                    GROUP BY
-                        station_code
-                )
-                {base_query}
-                AND prices.timestamp IN (SELECT timestamp FROM latest_prices WHERE latest_prices.station_code = prices.station_code)
-            """
-            params.insert(0, fuel_type)
-        else:
-            query = base_query
+        return query, params
+
+    def fetch_price_history(self, fuel_type, start_date=None, end_date=None, station_codes=None, postcodes=None, after=None, limit=1000):
+        """
+        One page of raw price history, ordered by (timestamp, station_code).
+
+        Args:
+            after (tuple): (timestamp, station_code) of the last row of the previous page
+            limit (int): Page size
+
+        Returns:
+            tuple: (pd.DataFrame of HISTORY_COLUMNS, the after key of the next page or None)
+        """
+        # One row past the page tells whether there is a next page
+        chunks = self.iter_price_history(fuel_type, start_date, end_date, station_codes, postcodes, after=after, chunk_size=limit + 1, limit=limit + 1)
+        rows = list(islice(chain.from_iterable(chunks), limit + 1))
+        next_after = tuple(rows[limit - 1][:2]) if len(rows) > limit else None
+        return pd.DataFrame(rows[:limit], columns=HISTORY_COLUMNS), next_after
 
+    def iter_price_history(self, fuel_type, start_date=None, end_date=None, station_codes=None, postcodes=None, after=None, chunk_size=1000, limit=None):
+        """
+        Raw price history as lists of up to chunk_size HISTORY_COLUMNS tuples, in
+        (timestamp, station_code) order and starting after the after key. Rows are
+        read from SQLite a keyset page at a time and from cold storage one partition
+        at a time, so memory does not grow with the length of the history.
+        """
+        if postcodes:
+            # Cold rows carry no postcode, so both tiers filter on the stations in them
+            query = f"SELECT station_code FROM stations WHERE postcode IN ({','.join('?' for _ in postcodes)})"
+            in_postcodes = {row[0] for row in self.conn.execute(query, list(postcodes))}
+            station_codes = [code for code in station_codes if code in in_postcodes] if station_codes else sorted(in_postcodes)
+            if not station_codes:
+                return
+
+        hot = self.iter_hot_history(fuel_type, start_date, end_date, station_codes, after, chunk_size, limit)
+        cold = self.iter_cold_history(fuel_type, start_date, end_date, station_codes, after)
+
+        # Both tiers are in key order. A month being tiered can briefly exist in
+        # both, merge yields the cold copy first and the hot one wins
+        chunk = []
+        previous = None
+        for row in heapq.merge(cold, hot, key=lambda row: (row[0], row[1])):
+            if previous is not None and (row[0], row[1]) != (previous[0], previous[1]):
+                chunk.append(previous)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+            previous = row
+        if previous is not None:
+            chunk.append(previous)
+        if chunk:
+            yield chunk
+
+    def iter_hot_history(self, fuel_type, start_date=None, end_date=None, station_codes=None, after=None, chunk_size=1000, limit=None):
+        # One query per chunk, resumed from the last key read. Each is read to the
+        # end straight away, so no statement stays open between chunks to pin the
+        # WAL snapshot while a slow client drains the export
+        while limit is None or limit > 0:
+            size = chunk_size if limit is None else min(chunk_size, limit)
+            query, params = self.build_history_query(fuel_type, start_date, end_date, station_codes, after, size)
+            rows = self.conn.execute(query, params).fetchall()
+            yield from rows
+            if len(rows) < size:
+                return
+            after = rows[-1][0], rows[-1][1]
+            if limit is not None:
+                limit -= len(rows)
+
+    def build_history_query(self, fuel_type, start_date=None, end_date=None, station_codes=None, after=None, limit=None):
+        # The (fuel_type, timestamp) index serves both the range and the order,
+        # only rows sharing a timestamp are sorted by station_code
+        query = """
+        SELECT 
+            prices.timestamp,
+            prices.station_code,
+            prices.fuel_type,
+            prices.price
+        FROM 
+            prices
+        WHERE 
+            prices.fuel_type = ?
+        """
+
+        params = [fuel_type]
+
+        if start_date and end_date:
+            query += " AND prices.timestamp >= ? AND prices.timestamp < ?"
+            params.extend(self.day_bounds(start_date, end_date))
+
+        if station_codes:
+            placeholders = ','.join('?' for _ in station_codes)
+            query += f" AND prices.station_code IN ({placeholders})"
+            params.extend(station_codes)
+
+        if after:
+            query += " AND prices.timestamp >= ? AND (prices.timestamp, prices.station_code) > (?, ?)"
+            params.extend([after[0], after[0], after[1]])
+
+        query += " ORDER BY prices.timestamp, prices.station_code"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return query, params
+
+    def iter_cold_history(self, fuel_type, start_date=None, end_date=None, station_codes=None, after=None):
+        # Partitions are whole months, in order, and each file is sorted by (timestamp, station_code)
+        for path in self.cold_partitions(fuel_type, start_date, end_date):
+            start, end = partition_bounds(os.path.splitext(os.path.basename(path))[0])
+            if after and end <= after[0]:
+                continue
+            filters = []
+            if start_date and end_date:
+                lower, upper = self.day_bounds(start_date, end_date)
+                filters = [("timestamp", ">=", lower), ("timestamp", "<", upper)]
+            if after:
+                filters.append(("timestamp", ">=", after[0]))
+            if station_codes:
+                filters.append(("station_code", "in", list(station_codes)))
+            df = pd.read_parquet(path, columns=HISTORY_COLUMNS, filters=filters or None)
+            if after:
+                df = df[(df["timestamp"] > after[0]) | ((df["timestamp"] == after[0]) & (df["station_code"] > after[1]))]
+            df = df.sort_values(["timestamp", "station_code"], kind="stable")
+            yield from df.itertuples(index=False, name=None)
+
+    def fetch_average_price(self, fuel_type=None, start_date=None, end_date=None, station_codes=None, postcodes=None, interval='M'):
+        query, params = self.build_average_price_query(fuel_type, start_date, end_date, station_codes, postcodes, interval)
         df = pd.read_sql_query(query, self.conn, params=params)
         return df
 
-    def fetch_average_price(self, fuel_type=None, start_date=None, end_date=None, station_codes=None, postcodes=None, interval='M'):
-        if interval == 'D':
-            date_format = "date(prices.timestamp, 'unixepoch')"
-        elif interval == 'W':
-            date_format = "strftime('%Y-%W', prices.timestamp, 'unixepoch')"
-        elif interval == 'M':
-            date_format = "strftime('%Y-%m', prices.timestamp, 'unixepoch')"
-        else:
+    def build_average_price_query(self, fuel_type=None, start_date=None, end_date=None, station_codes=None, postcodes=None, interval='M'):
+        # Aggregates the price_daily rollup that DatabaseW maintains on ingest instead of raw
+        # prices rows. SUM(price_sum) / SUM(price_count) is the same mean as AVG(price)
+        if interval not in INTERVAL_FORMATS:
             raise ValueError("Invalid interval. Choose 'daily', 'weekly', or 'monthly'.")
+        date_format = f"strftime('{INTERVAL_FORMATS[interval]}', price_daily.day, 'unixepoch')"
 
         query = f"""
         WITH interval_station_avg AS (
             SELECT 
                 {date_format} AS interval_date,
-                prices.station_code,
-                AVG(prices.price) AS station_avg_price,
-                prices.fuel_type
+                price_daily.station_code,
+                SUM(price_daily.price_sum) / SUM(price_daily.price_count) AS station_avg_price,
+                price_daily.fuel_type
             FROM 
-                prices
+                price_daily
             JOIN 
-                stations ON prices.station_code = stations.station_code
+                stations ON price_daily.station_code = stations.station_code
             WHERE 
-                prices.fuel_type = ?
+                price_daily.fuel_type = ?
         """
 
         params = [fuel_type]
 
         if start_date and end_date:
-            query += " AND date(prices.timestamp, 'unixepoch') BETWEEN date(?, 'unixepoch') AND date(?, 'unixepoch')"
-            params.append(start_date)
-            params.append(end_date)
+            query += " AND price_daily.day >= ? AND price_daily.day < ?"
+            params.extend(self.day_bounds(start_date, end_date))
 
         if station_codes:
             placeholders = ','.join('?' for _ in station_codes)
-            query += f" AND prices.station_code IN ({placeholders})"
+            query += f" AND price_daily.station_code IN ({placeholders})"
             params.extend(station_codes)
 
         if postcodes:
@@ -143,10 +335,11 @@ class DatabaseR:
             query += f" AND stations.postcode IN ({placeholders})"
             params.extend(postcodes)
 
+        # Grouping by station first hands station_average its rows already in order
         query += """
             GROUP BY 
-                interval_date,
-                prices.station_code
+                price_daily.station_code,
+                interval_date
         )
         """
 
@@ -165,74 +358,146 @@ class DatabaseR:
             stations ON stations.station_code = interval_station_avg.station_code
         """
 
-        df = pd.read_sql_query(query, self.conn, params=params)
-        return df
+        return query, params
 
-    def suburb_to_coordinates(self, postcode, suburb=None, postcode_db_path = None):
-        if not os.path.exists(postcode_db_path):
-            return None
-        postcode = str(postcode).zfill(4)
-        conn = sqlite3.connect(postcode_db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        print(cursor.fetchall())
-        cursor.execute("""
-            SELECT suburb, latitude, longitude
-            FROM postcodes
-            WHERE postcode = ?
-        """, (postcode,))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        if not rows:
-            return None
+    def fetch_average_prices(self, fuel_types, intervals=('D',), start_date=None, end_date=None, station_codes=None, postcodes=None):
+        """
+        fetch_average_price for several fuel types and intervals at once.
+
+        The rollup rows for every fuel type are read in one range scan and grouped by
+        (fuel_type, interval, station_code, interval_date) here, rather than grouped
+        once per interval in SQLite.
 
-        if suburb:
-            suburb = suburb.strip().lower()
-            for row in rows:
-                if row["suburb"].strip().lower() == suburb:
-                    return row["latitude"], row["longitude"]        
+        Returns:
+            pd.DataFrame: fuel_type, interval, timestamp, station_code and price columns
+        """
+        if any(interval not in INTERVAL_FORMATS for interval in intervals):
+            raise ValueError("Invalid interval. Choose 'daily', 'weekly', or 'monthly'.")
+        query, params = self.build_average_prices_query(fuel_types, start_date, end_date, station_codes, postcodes)
+        daily = pd.read_sql_query(query, self.conn, params=params)
+
+        # Label each distinct day once rather than every row
+        days, day_codes = np.unique(daily["day"].to_numpy(dtype=np.int64), return_inverse=True)
+        day_dates = pd.to_datetime(days, unit="s")
+        frames = []
+        for interval in intervals:
+            labels = np.asarray(day_dates.strftime(INTERVAL_FORMATS[interval]), dtype=object)
+            grouped = daily.groupby(["fuel_type", "station_code", labels[day_codes]], sort=False)[["price_sum", "price_count"]].sum()
+            frames.append(pd.DataFrame({
+                "fuel_type": grouped.index.get_level_values(0),
+                "interval": interval,
+                "timestamp": grouped.index.get_level_values(2),
+                "station_code": grouped.index.get_level_values(1),
+                "price": grouped["price_sum"].to_numpy() / grouped["price_count"].to_numpy(),
+            }))
+        if not frames:
+            return pd.DataFrame(columns=["fuel_type", "interval", "timestamp", "station_code", "price"])
+        return pd.concat(frames, ignore_index=True)
+
+    def build_average_prices_query(self, fuel_types, start_date=None, end_date=None, station_codes=None, postcodes=None):
+        if not fuel_types:
+            raise ValueError("At least one fuel type must be provided")
+        placeholders = ','.join('?' for _ in fuel_types)
+        query = f"""
+        SELECT 
+            price_daily.fuel_type,
+            price_daily.day,
+            price_daily.station_code,
+            price_daily.price_sum,
+            price_daily.price_count
+        FROM 
+            price_daily
+        JOIN 
+            stations ON price_daily.station_code = stations.station_code
+        WHERE 
+            price_daily.fuel_type IN ({placeholders})
+        """
+
+        params = list(fuel_types)
+
+        if start_date and end_date:
+            query += " AND price_daily.day >= ? AND price_daily.day < ?"
+            params.extend(self.day_bounds(start_date, end_date))
+
+        if station_codes:
+            placeholders = ','.join('?' for _ in station_codes)
+            query += f" AND price_daily.station_code IN ({placeholders})"
+            params.extend(station_codes)
+
+        if postcodes:
+            placeholders = ','.join('?' for _ in postcodes)
+            query += f" AND stations.postcode IN ({placeholders})"
+            params.extend(postcodes)
 
-        return rows[0]["latitude"], rows[0]["longitude"]
+        return query, params
+
+    def suburb_to_coordinates(self, postcode, suburb=None, postcode_db_path = None):
+        """
+        Returns (latitude, longitude) of a suburb, or of the postcode when the suburb
+        is not given or not found. Returns None for unknown postcodes.
+        """
+        if not postcode_db_path or not os.path.exists(postcode_db_path):
+            return None
+        return postcode_index(postcode_db_path).coordinates(postcode, suburb)
 
     def get_nearby_suburbs(self, latitude, longitude, radius_km=10, postcode_db_path = None):
         """
         Returns a list of nearby postcodes within a radius from the given coordinates.
         Each postcode appears only once, with one representative suburb.
         """
-        # Load postcode data into pandas
-        if not os.path.exists(postcode_db_path):
+        if not postcode_db_path or not os.path.exists(postcode_db_path):
             return None
-        conn = sqlite3.connect(postcode_db_path)
-        df = pd.read_sql_query(
-            "SELECT postcode, suburb, latitude, longitude FROM postcodes",
-            conn
-        )
-        conn.close()
-
-        # Ensure postcode is string with leading zeros
-        df["postcode"] = df["postcode"].astype(str).str.zfill(4)
-
-        # Keep only one suburb per postcode (first occurrence)
-        df = df.drop_duplicates(subset="postcode", keep="first")
+        # Built once per process from the postcode DB and shared by every request
+        return postcode_index(postcode_db_path).nearby(latitude, longitude, radius_km)
 
-        # Compute distance for each row
-        df["distance_km"] = df.apply(
-            lambda row: geodesic((latitude, longitude), (row["latitude"], row["longitude"])).km,
-            axis=1
-        )
-
-        # Filter by radius
-        nearby_df = df[df["distance_km"] <= radius_km].copy()
-
-        # Sort by distance
-        nearby_df.sort_values("distance_km", inplace=True)
+    def fetch_nearby_stations(self, fuel_type, latitude, longitude, radius_km=5, k=None, sort_by="price"):
+        """
+        Returns the stations with a current price for fuel_type around the given
+        coordinates, with their distance_km, sorted by price or distance.
 
-        # Convert to list of dicts
-        return nearby_df.to_dict("records")
+        Args:
+            radius_km (float): Search radius, or None to search outwards until k stations are found
+            k (int): Keep only the k nearest stations
+            sort_by (str): "price" or "distance"
+        """
+        if sort_by not in ("price", "distance"):
+            raise ValueError("sort_by must be 'price' or 'distance'")
+        if radius_km is None and not k:
+            raise ValueError("Please specify a radius, a number of stations, or both")
+        index = station_index(self.conn, self.db_path)
+
+        if radius_km is not None:
+            df = self.price_stations(index.within(latitude, longitude, radius_km), fuel_type)
+        else:
+            # Double the radius until k priced stations are found or the whole index is covered
+            search_km = 5
+            while True:
+                df = self.price_stations(index.within(latitude, longitude, search_km), fuel_type)
+                if len(df) >= k or search_km >= np.pi * EARTH_RADIUS_KM:
+                    break
+                search_km *= 2
+        if k:
+            df = df.head(k)
+
+        if sort_by == "price":
+            df = df.sort_values(["price", "distance_km"], kind="stable")
+        return df.reset_index(drop=True)
+
+    def price_stations(self, stations_df, fuel_type):
+        # Inner merge keeps the stations' nearest-first order
+        if stations_df.empty:
+            prices_df = pd.DataFrame(columns=["station_code", "fuel_type", "price", "timestamp"])
+        else:
+            station_codes = stations_df["station_code"].tolist()
+            placeholders = ','.join('?' for _ in station_codes)
+            prices_df = pd.read_sql_query(f"""
+            SELECT station_code, fuel_type, price, timestamp
+            FROM current_prices
+            WHERE fuel_type = ? AND station_code IN ({placeholders})
+            """, self.conn, params=[fuel_type, *station_codes])
+        return stations_df.merge(prices_df, on="station_code")[
+            ["name", "address", "postcode", "latitude", "longitude", "fuel_type", "price", "timestamp", "station_code", "distance_km"]
+        ]
 
     def fetch_future_forecast(self, fuel_type, start_date=None, end_date=None):
         query = f"""
@@ -256,6 +521,52 @@ class DatabaseR:
             df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
         return df
 
+    def fetch_future_forecasts(self, fuel_types, start_date=None, end_date=None):
+        # fetch_future_forecast for several fuel types, with a fuel_type column to split them by
+        placeholders = ','.join('?' for _ in fuel_types)
+        query = f"""
+        SELECT 
+            fuel_type, timestamp, forecast_price
+        FROM 
+            future_forecast 
+        WHERE 
+            fuel_type IN ({placeholders})
+        """
+        params = list(fuel_types)
+
+        if start_date and end_date:
+            query += " AND timestamp BETWEEN ? AND ?"
+            params.append(start_date)
+            params.append(end_date)
+
+        df = pd.read_sql_query(query, self.conn, params=params)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+        return df
+
+    def fetch_ingest_runs(self, start_date=None, end_date=None, limit=None):
+        query = """
+        SELECT
+            *,
+            total_seconds > interval_seconds AS overran
+        FROM
+            ingest_runs
+        WHERE 1=1
+        """
+        params = []
+
+        if start_date and end_date:
+            query += " AND started_at BETWEEN ? AND ?"
+            params.append(start_date)
+            params.append(end_date)
+
+        query += " ORDER BY started_at DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        df = pd.read_sql_query(query, self.conn, params=params)
+        return df
+
     def unload(self):
         self.conn.commit()
         self.conn.close()
\ No newline at end of file
@@ -1,66 +1,319 @@
-from Fetcher import Fetcher
-from DatabaseR import DatabaseR
+try:
+    from .Fetcher import Fetcher
+    from .AsyncFetcher import AsyncFetcher
+    from .DatabaseR import DatabaseR
+    from .schema import migrate, bump_generation
+except ImportError:
+    from Fetcher import Fetcher
+    from AsyncFetcher import AsyncFetcher
+    from DatabaseR import DatabaseR
+    from schema import migrate, bump_generation
 import pandas as pd
 from datetime import datetime
-import pytz
 import re
+import json
+import hashlib
+import asyncio
+import time
+from contextlib import contextmanager
 
 class DatabaseW(DatabaseR):
-    def __init__(self, db_name, start_timestamp, auth_header, api_key):
+    # API field order as stored in the staging table, followed by postcode and fingerprint
+    STATION_COLUMNS = ['brandid', 'stationid', 'brand', 'code', 'name', 'address',
+                       'location.latitude', 'location.longitude', 'isAdBlueAvailable']
+    # fetch: waiting on the API and decoding its JSON, parse: building table rows, write: SQL
+    STAGES = ("fetch", "parse", "write")
+
+    def __init__(self, db_name, start_timestamp, auth_header, api_key, full_sync_every=1, concurrent_fetch=False, stream_batch_size=0, change_only=False, **fetcher_options):
         super().__init__(db_name)
+        migrate(self.conn)
         self.start_timestamp = start_timestamp
-        self.fetcher = Fetcher(auth_header, api_key)
+        fetcher_class = AsyncFetcher if concurrent_fetch else Fetcher
+        self.fetcher = fetcher_class(auth_header, api_key, **fetcher_options)
+        # Run a full /prices reconciliation every N cycles (and always on the first one),
+        # otherwise only ingest the /prices/new delta. 1 keeps the full fetch on every cycle.
+        self.full_sync_every = max(int(full_sync_every), 1)
+        # Parse responses incrementally and write them in batches of this many items (0 = off)
+        self.stream_batch_size = stream_batch_size
+        # Only store price transitions in prices, see bulk_insert_prices
+        self.change_only = change_only
+        # Delta-only cycles left before the next full reconciliation, only reset once one succeeds
+        self.next_full_sync = 0
+        self.payload_hashes = {}
+        self.last_cycle_stats = None
+        self.cycle_stats = None
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+
+    def start_cycle(self):
+        is_full_sync = self.next_full_sync <= 0
+        if not is_full_sync:
+            self.next_full_sync -= 1
+        stats = {"mode": "full" if is_full_sync else "delta", "inserted": 0, "skipped": 0}
+        self.cycle_stats = stats
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+        return is_full_sync, stats
+
+    def full_sync_done(self):
+        self.next_full_sync = self.full_sync_every - 1
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[stage] += time.perf_counter() - start
+
+    def finish_cycle(self, stats):
+        self.last_cycle_stats = stats
+        print(f"{stats['mode']} cycle: inserted {stats['inserted']} price rows, skipped {stats['skipped']}")
 
     def update_db(self):
-        all_prices = self.fetcher.fetch_all_v1_data()
-        if 'stations' not in all_prices or 'prices' not in all_prices:
-            if 'errorDetails' in all_prices:
-                print("Error fetching data:", all_prices['errorDetails'])
+        is_full_sync, stats = self.start_cycle()
+
+        if is_full_sync:
+            if self.ingest_source("all", stats) == 1:
+                return 1
+            self.full_sync_done()
+
+        if self.ingest_source("new", stats) == 1:
             return 1
-        self.save_stations_to_db(all_prices['stations'])
-        self.save_prices_to_db(all_prices['prices'])
 
-        new_prices = self.fetcher.fetch_new_v1_data()
-        if 'stations' not in new_prices or 'prices' not in new_prices:
-            if 'errorDetails' in new_prices:
-                print("Error fetching data:", new_prices['errorDetails'])
+        self.finish_cycle(stats)
+
+    def ingest_source(self, source, stats):
+        if self.stream_batch_size:
+            stream = self.fetcher.stream_all_v1_data if source == "all" else self.fetcher.stream_new_v1_data
+            return self.ingest_stream(stream(self.stream_batch_size), stats)
+        fetch = self.fetcher.fetch_all_v1_data if source == "all" else self.fetcher.fetch_new_v1_data
+        with self.timed("fetch"):
+            payload = fetch()
+        return self.ingest_payload(source, payload, stats)
+
+    async def update_db_async(self):
+        """
+        Same cycle as update_db, but with an AsyncFetcher the /prices and /prices/new
+        requests are in flight together and whichever response lands first is written
+        while the other is still downloading.
+        """
+        is_full_sync, stats = self.start_cycle()
+
+        async def fetch(source, request):
+            return source, await request
+
+        requests = [fetch("new", self.fetcher.fetch_new_v1_data_async())]
+        if is_full_sync:
+            requests.append(fetch("all", self.fetcher.fetch_all_v1_data_async()))
+
+        status = 0
+        for response in asyncio.as_completed(requests):
+            with self.timed("fetch"):
+                source, payload = await response
+            # SQLite connection belongs to this thread, so writes stay on the event loop thread
+            if self.ingest_payload(source, payload, stats) == 1:
+                status = 1
+            elif source == "all":
+                self.full_sync_done()
+        if status == 1:
+            return 1
+
+        self.finish_cycle(stats)
+
+    def ingest_payload(self, source, payload, stats):
+        if 'stations' not in payload or 'prices' not in payload:
+            if 'errorDetails' in payload:
+                print("Error fetching data:", payload['errorDetails'])
             return 1
-        self.save_stations_to_db(new_prices['stations'])
-        self.save_prices_to_db(new_prices['prices'])
+
+        # An identical payload to the last one from the same endpoint has nothing new to write
+        with self.timed("parse"):
+            payload_hash = self.hash_payload(payload)
+        if self.payload_hashes.get(source) == payload_hash:
+            stats["skipped"] += len(payload['prices'])
+            return 0
+
+        self.save_stations_to_db(payload['stations'])
+        inserted = self.save_prices_to_db(payload['prices'])
+        stats["inserted"] += inserted
+        stats["skipped"] += len(payload['prices']) - inserted
+        self.payload_hashes[source] = payload_hash
+        return 0
+
+    def ingest_stream(self, batches, stats):
+        # Streamed payloads are never held in full, so there is no payload hash to skip on;
+        # the primary key still dedupes rows that were already stored
+        batches = iter(batches)
+        while True:
+            with self.timed("fetch"):
+                item = next(batches, None)
+            if item is None:
+                break
+            key, batch = item
+            if key == "error":
+                if 'errorDetails' in batch:
+                    print("Error fetching data:", batch['errorDetails'])
+                return 1
+            if key == "stations":
+                self.save_stations_to_db(batch)
+            else:
+                inserted = self.save_prices_to_db(batch)
+                stats["inserted"] += inserted
+                stats["skipped"] += len(batch) - inserted
+        return 0
+
+    def hash_payload(self, payload):
+        encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
 
     def save_prices_to_db(self, prices_data):
-        cursor = self.cursor
         prices_df = pd.DataFrame(prices_data)
-        create_prices_table_query = """
-        CREATE TABLE IF NOT EXISTS prices (
-            station_code TEXT,
-            fuel_type TEXT,
-            price REAL,
-            timestamp INTEGER,
-            PRIMARY KEY (station_code, fuel_type, timestamp),
-            FOREIGN KEY (station_code) REFERENCES stations (station_code)
-        )
+        if prices_df.empty:
+            return 0
+
+        with self.timed("parse"):
+            prices_df = self.normalise_prices(prices_df)
+        with self.timed("write"):
+            return self.bulk_insert_prices(prices_df.itertuples(index=False, name=None))
+
+    def normalise_prices(self, prices_df):
+        """
+        Maps an API prices frame (stationcode, fueltype, price, lastupdated) onto the
+        prices table columns, parsing the whole lastupdated column to epoch seconds
+        in one vectorized pass.
         """
-        cursor.execute(create_prices_table_query)
+        return pd.DataFrame({
+            'station_code': prices_df['stationcode'].astype(str),
+            'fuel_type': prices_df['fueltype'].astype(str),
+            'price': prices_df['price'].astype(float),
+            'timestamp': self.normalise_timestamps(prices_df['lastupdated']),
+        })
 
-        timezone = pytz.timezone("UTC")
+    def normalise_timestamps(self, date_strs):
+        # Same result as convert_to_unix_timestamp with a UTC timezone, for a whole column
+        parsed = pd.to_datetime(date_strs, format="%d/%m/%Y %H:%M:%S", utc=True)
+        return parsed.astype('int64') // 10**9
 
-        for _, row in prices_df.iterrows():
-            insert_query = """
-            INSERT INTO prices (station_code, fuel_type, price, timestamp) 
+    def bulk_insert_prices(self, rows):
+        """
+        Stages (station_code, fuel_type, price, timestamp) rows in a temp table, prunes
+        the ones already stored (or older than start_timestamp) with set-based deletes,
+        then copies what is left into prices and the derived tables in the same
+        transaction. Returns the number of new price observations.
+
+        With change_only, rows at or before the newest stored observation of their
+        station and fuel type are treated as already seen, and only observations whose
+        price differs from the one before them are written to prices. Every new
+        observation still counts towards price_daily and current_prices.
+        """
+        cursor = self.cursor
+        with self.conn:
+            cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS prices_staging (
+                station_code TEXT,
+                fuel_type TEXT,
+                price REAL,
+                timestamp INTEGER
+            )
+            """)
+            cursor.execute("DELETE FROM prices_staging")
+            cursor.executemany("""
+            INSERT INTO prices_staging (station_code, fuel_type, price, timestamp)
             VALUES (?, ?, ?, ?)
-            """
-            timestamp = self.convert_to_unix_timestamp(row['lastupdated'], timezone)
-            if not self.price_exists(cursor, row['stationcode'], row['fueltype'], timestamp) and timestamp > self.start_timestamp:
-                cursor.execute(insert_query, (
-                    row['stationcode'],
-                    row['fueltype'],
-                    row['price'],
-                    timestamp
-                ))
+            """, rows)
+            # Keep the first copy of each key in the batch, like INSERT OR IGNORE would
+            cursor.execute("""
+            DELETE FROM prices_staging
+            WHERE rowid NOT IN (
+                SELECT MIN(rowid) FROM prices_staging GROUP BY station_code, fuel_type, timestamp
+            )
+            """)
+            cursor.execute("""
+            DELETE FROM prices_staging
+            WHERE timestamp <= ?
+            OR EXISTS (
+                SELECT 1 FROM prices
+                WHERE prices.station_code = prices_staging.station_code
+                AND prices.fuel_type = prices_staging.fuel_type
+                AND prices.timestamp = prices_staging.timestamp
+            )
+            """, (self.start_timestamp,))
+            if self.change_only:
+                cursor.execute("""
+                DELETE FROM prices_staging
+                WHERE timestamp <= (
+                    SELECT timestamp FROM current_prices
+                    WHERE current_prices.station_code = prices_staging.station_code
+                    AND current_prices.fuel_type = prices_staging.fuel_type
+                )
+                """)
+                inserted = cursor.execute("SELECT COUNT(*) FROM prices_staging").fetchone()[0]
+                # Must run before current_prices moves on to this batch
+                cursor.execute("""
+                INSERT INTO prices (station_code, fuel_type, price, timestamp)
+                SELECT station_code, fuel_type, price, timestamp
+                FROM (
+                    SELECT
+                        prices_staging.*,
+                        COALESCE(
+                            LAG(prices_staging.price) OVER (
+                                PARTITION BY prices_staging.station_code, prices_staging.fuel_type
+                                ORDER BY prices_staging.timestamp
+                            ),
+                            current_prices.price
+                        ) AS previous_price
+                    FROM prices_staging
+                    LEFT JOIN current_prices
+                    ON current_prices.station_code = prices_staging.station_code
+                    AND current_prices.fuel_type = prices_staging.fuel_type
+                )
+                WHERE previous_price IS NULL OR price != previous_price
+                """)
             else:
-                continue
-        self.conn.commit()
+                cursor.execute("""
+                INSERT INTO prices (station_code, fuel_type, price, timestamp)
+                SELECT station_code, fuel_type, price, timestamp
+                FROM prices_staging
+                """)
+                inserted = cursor.rowcount
+            self.update_derived_prices(cursor)
+            if inserted:
+                # Tells the backend its cached price responses are stale
+                bump_generation(cursor, "prices")
+            cursor.execute("DELETE FROM prices_staging")
+        return inserted
+
+    def update_derived_prices(self, cursor):
+        # prices_staging only holds the new observations from this batch
+        cursor.execute("""
+        INSERT INTO price_daily (fuel_type, day, station_code, price_sum, price_count, price_min, price_max)
+        SELECT
+            fuel_type,
+            (timestamp / 86400) * 86400 AS day,
+            station_code,
+            SUM(price),
+            COUNT(*),
+            MIN(price),
+            MAX(price)
+        FROM prices_staging
+        WHERE true
+        GROUP BY fuel_type, day, station_code
+        ON CONFLICT (fuel_type, day, station_code) DO UPDATE SET
+            price_sum = price_sum + excluded.price_sum,
+            price_count = price_count + excluded.price_count,
+            price_min = min(price_min, excluded.price_min),
+            price_max = max(price_max, excluded.price_max)
+        """)
+        cursor.execute("""
+        INSERT INTO current_prices (station_code, fuel_type, price, timestamp)
+        SELECT station_code, fuel_type, price, MAX(timestamp)
+        FROM prices_staging
+        WHERE true
+        GROUP BY station_code, fuel_type
+        ON CONFLICT (station_code, fuel_type) DO UPDATE SET
+            price = excluded.price,
+            timestamp = excluded.timestamp
+        WHERE excluded.timestamp > current_prices.timestamp
+        """)
 
     def price_exists(self, cursor, station_code, fuel_type, timestamp):
         cursor.execute("""
@@ -70,49 +323,98 @@ class DatabaseW(DatabaseR):
         return cursor.fetchone() is not None
 
     def save_stations_to_db(self, stations_data):
-        cursor = self.cursor
         stations_df = pd.json_normalize(stations_data)
-        create_stations_table_query = """
-        CREATE TABLE IF NOT EXISTS stations (
-            brand_id TEXT,
-            station_id TEXT,
-            brand TEXT,
-            station_code TEXT PRIMARY KEY,
-            name TEXT,
-            address TEXT,
-            latitude REAL,
-            longitude REAL,
-            is_adblue_available BOOLEAN
-            postcode TEXT
-        )
+        if stations_df.empty:
+            return 0
+
+        with self.timed("parse"):
+            stations_df = stations_df.reindex(columns=self.STATION_COLUMNS)
+            stations_df['postcode'] = self.extract_postcodes(stations_df['address'])
+            # Per-row content fingerprint so unchanged stations are never rewritten
+            stations_df['fingerprint'] = pd.util.hash_pandas_object(
+                stations_df[self.STATION_COLUMNS].astype(str), index=False
+            ).values.view('int64')
+            stations_df = stations_df.astype(object).where(stations_df.notna(), None)
+        with self.timed("write"):
+            return self.bulk_upsert_stations(stations_df.itertuples(index=False, name=None))
+
+    def bulk_upsert_stations(self, rows):
         """
-        cursor.execute(create_stations_table_query)
-        cursor.execute("PRAGMA table_info(stations);")
-        columns = [info[1] for info in cursor.fetchall()]
-        if 'postcode' not in columns:
-            cursor.execute("ALTER TABLE stations ADD COLUMN postcode TEXT")
-
-        for _, row in stations_df.iterrows():
-            postcode = self.extract_postcode(row['address'])
-            insert_query = """
-            INSERT INTO stations (brand_id, station_id, brand, station_code, name, address, latitude, longitude, is_adblue_available, postcode) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            if not self.station_exists(cursor, row['code']):
-                cursor.execute(insert_query, (
-                    row['brandid'],
-                    row['stationid'],
-                    row['brand'],
-                    row['code'],
-                    row['name'],
-                    row['address'],
-                    row['location.latitude'],
-                    row['location.longitude'],
-                    row['isAdBlueAvailable'],
-                    postcode
-                ))
-            else:
-                continue
+        Upserts station rows keyed on station_code in one statement. Existing
+        stations are only updated when their fingerprint changed.
+        Returns the number of stations inserted or updated.
+        """
+        cursor = self.cursor
+        with self.conn:
+            cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS stations_staging (
+                brand_id TEXT,
+                station_id TEXT,
+                brand TEXT,
+                station_code TEXT,
+                name TEXT,
+                address TEXT,
+                latitude REAL,
+                longitude REAL,
+                is_adblue_available BOOLEAN,
+                postcode TEXT,
+                fingerprint INTEGER
+            )
+            """)
+            cursor.execute("DELETE FROM stations_staging")
+            cursor.executemany("""
+            INSERT INTO stations_staging (brand_id, station_id, brand, station_code, name, address, latitude, longitude, is_adblue_available, postcode, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            cursor.execute("""
+            INSERT INTO stations (brand_id, station_id, brand, station_code, name, address, latitude, longitude, is_adblue_available, postcode, fingerprint)
+            SELECT brand_id, station_id, brand, station_code, name, address, latitude, longitude, is_adblue_available, postcode, fingerprint
+            FROM stations_staging
+            WHERE true
+            ON CONFLICT (station_code) DO UPDATE SET
+                brand_id = excluded.brand_id,
+                station_id = excluded.station_id,
+                brand = excluded.brand,
+                name = excluded.name,
+                address = excluded.address,
+                latitude = excluded.latitude,
+                longitude = excluded.longitude,
+                is_adblue_available = excluded.is_adblue_available,
+                postcode = excluded.postcode,
+                fingerprint = excluded.fingerprint
+            WHERE stations.fingerprint IS NOT excluded.fingerprint
+            """)
+            changed = cursor.rowcount
+            cursor.execute("DELETE FROM stations_staging")
+            if changed:
+                # Tells the backend to rebuild its station spatial index
+                bump_generation(cursor, "stations")
+        return changed
+
+    def record_ingest_run(self, started_at, finished_at, status, interval=None, skipped_ticks=0):
+        """
+        Stores one scheduler cycle in ingest_runs with its per-stage durations, so
+        total_seconds can be compared with interval_seconds to spot ingest falling behind.
+        """
+        cursor = self.cursor
+        stats = self.cycle_stats or {}
+        cursor.execute("""
+        INSERT INTO ingest_runs (started_at, finished_at, status, mode, inserted, skipped, fetch_seconds, parse_seconds, write_seconds, total_seconds, interval_seconds, skipped_ticks)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            started_at,
+            finished_at,
+            status,
+            stats.get("mode"),
+            stats.get("inserted"),
+            stats.get("skipped"),
+            self.stage_times["fetch"],
+            self.stage_times["parse"],
+            self.stage_times["write"],
+            finished_at - started_at,
+            interval,
+            skipped_ticks
+        ))
         self.conn.commit()
 
     def station_exists(self, cursor, station_code):
@@ -131,3 +433,7 @@ class DatabaseW(DatabaseR):
     def extract_postcode(self, address):
         matches = re.findall(r'\b\d{4}\b', address)
         return matches[-1] if matches else None
+
+    def extract_postcodes(self, addresses):
+        # Greedy prefix makes the capture the last 4-digit group, same as extract_postcode
+        return addresses.astype("string").str.extract(r'.*\b(\d{4})\b', expand=False)
@@ -1,69 +1,201 @@
 import requests
+import ijson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 import hashlib
 import secrets
+import json
+import os
+import threading
 
 class Fetcher:
-    def __init__(self, AUTHORIZATION_HEADER, API_KEY):
+    BASE_URL = "https://api.onegov.nsw.gov.au"
+    # Used when the token response has no expires_in, matches the old refresh interval
+    TOKEN_LIFETIME = timedelta(hours=10)
+
+    def __init__(self, AUTHORIZATION_HEADER, API_KEY, timeout=30, retries=3, backoff_factor=1.0, token_cache_path=None, base_url=BASE_URL):
         self.AUTHORIZATION_HEADER = AUTHORIZATION_HEADER
-        self.token_time = None
-        self.get_credentials()
         self.API_KEY = API_KEY
-        
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token_cache_path = token_cache_path
+        self.session = self.create_session(retries, backoff_factor)
+        self.token = None
+        self.token_time = None
+        self.token_expiry = None
+        self.token_lock = threading.Lock()
+        if not self.load_cached_token():
+            self.get_credentials()
+
+    def create_session(self, retries, backoff_factor):
+        # One pooled keep-alive session for token and price calls, retrying
+        # transient failures with exponential backoff
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=4)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            'accept-encoding': "gzip, deflate",
+            'connection': "keep-alive",
+        })
+        return session
+
     def get_credentials(self):
-        url = "https://api.onegov.nsw.gov.au/oauth/client_credential/accesstoken?grant_type=client_credentials"
+        url = f"{self.base_url}/oauth/client_credential/accesstoken?grant_type=client_credentials"
 
         headers = {
             'grant_type': "client_credentials",
             'accept': "application/json",
             'Authorization': self.AUTHORIZATION_HEADER,
         }
-        response = requests.request("GET", url, headers=headers)
-        token = response.json()['access_token']
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        body = response.json()
+        self.token = body['access_token']
         self.token_time = datetime.now()
-        self.token = token
+        if body.get('expires_in'):
+            self.token_expiry = self.token_time + timedelta(seconds=int(body['expires_in']))
+        else:
+            self.token_expiry = self.token_time + self.TOKEN_LIFETIME
+        self.save_cached_token()
 
-    def fetch_all_v1_data(self):
-        url = "https://api.onegov.nsw.gov.au/FuelPriceCheck/v1/fuel/prices"
+    def credentials_key(self):
+        # Tokens cached for one set of credentials are never handed to another
+        return hashlib.sha256(str(self.AUTHORIZATION_HEADER).encode("utf-8")).hexdigest()
 
-        dt = datetime.now()
+    def load_cached_token(self):
+        if not self.token_cache_path or not os.path.exists(self.token_cache_path):
+            return False
+        try:
+            with open(self.token_cache_path, "r") as f:
+                cached = json.load(f)
+            token_expiry = datetime.fromtimestamp(cached['expiry'])
+            if cached['credentials'] != self.credentials_key():
+                return False
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if token_expiry - datetime.now() < timedelta(minutes=5):
+            return False
+        self.token = cached['access_token']
+        self.token_time = datetime.fromtimestamp(cached['issued'])
+        self.token_expiry = token_expiry
+        return True
 
-        if dt - self.token_time > timedelta(hours = 10):
-            self.get_credentials()
-
-        print("dd-mm-yyyy HH:MM:SS:", dt.strftime("%d-%m-%y %I:%M:%S %p"))
-        headers = {
-            'authorization': f'Bearer {self.token}',
-            'content-type': "application/json; charset=utf-8",
-            'apikey': self.API_KEY,
-            'transactionid': self.generate_random_hash(),
-            'requesttimestamp': dt.strftime("%d-%m-%y %I:%M:%S %p"),
+    def save_cached_token(self):
+        if not self.token_cache_path:
+            return
+        cached = {
+            'access_token': self.token,
+            'issued': self.token_time.timestamp(),
+            'expiry': self.token_expiry.timestamp(),
+            'credentials': self.credentials_key(),
         }
-        print(self.generate_random_hash())
-        response = requests.request("GET", url, headers=headers)
-        return response.json()
-    
-    def fetch_new_v1_data(self):
-        url = "https://api.onegov.nsw.gov.au/FuelPriceCheck/v1/fuel/prices/new"
+        tmp_path = f"{self.token_cache_path}.tmp"
+        try:
+            # The cache directory is not in the repository, nothing else creates it
+            os.makedirs(os.path.dirname(self.token_cache_path) or ".", exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, self.token_cache_path)
+        except OSError as e:
+            print("Could not cache access token:", e)
+
+    def token_expired(self, dt):
+        return self.token_expiry is None or dt >= self.token_expiry - timedelta(minutes=5)
 
+    def request(self, path, stream=False):
         dt = datetime.now()
 
-        if dt - self.token_time > timedelta(hours = 10):
-            self.get_credentials()
+        with self.token_lock:
+            if self.token_expired(dt):
+                self.get_credentials()
 
         print("dd-mm-yyyy HH:MM:SS:", dt.strftime("%d-%m-%y %I:%M:%S %p"))
-        headers = {
+        response = self.session.get(f"{self.base_url}{path}", headers=self.request_headers(dt), timeout=self.timeout, stream=stream)
+        if response.status_code == 401:
+            # Cached token was revoked before its expiry, get a new one and try once more
+            response.close()
+            with self.token_lock:
+                self.get_credentials()
+            response = self.session.get(f"{self.base_url}{path}", headers=self.request_headers(dt), timeout=self.timeout, stream=stream)
+        return response
+
+    def fetch(self, path):
+        return self.request(path).json()
+
+    def request_headers(self, dt):
+        return {
             'authorization': f'Bearer {self.token}',
             'content-type': "application/json; charset=utf-8",
             'apikey': self.API_KEY,
             'transactionid': self.generate_random_hash(),
             'requesttimestamp': dt.strftime("%d-%m-%y %I:%M:%S %p"),
         }
-        print(self.generate_random_hash())
-        response = requests.request("GET", url, headers=headers)
-        return response.json()
-    
+
+    def stream(self, path, batch_size=1000):
+        """
+        Streams a prices response, parsing the stations and prices arrays incrementally
+        from the body. Yields ("stations" | "prices", batch) with at most batch_size
+        items per batch, or ("error", body) when the API returns an error instead.
+        """
+        response = self.request(path, stream=True)
+        with response:
+            if response.status_code != 200:
+                yield "error", response.json()
+                return
+            response.raw.decode_content = True
+            yield from self.iter_batches(response.raw, batch_size)
+
+    def iter_batches(self, file, batch_size):
+        batches = {"stations": [], "prices": []}
+        builder = None
+        for prefix, event, value in ijson.parse(file, use_float=True):
+            if builder is None:
+                if event == "start_map" and prefix in ("stations.item", "prices.item"):
+                    key = prefix.split(".")[0]
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                elif event == "end_array" and batches.get(prefix):
+                    # Flush at the end of each array so stations land before the prices that follow
+                    yield prefix, batches[prefix]
+                    batches[prefix] = []
+                continue
+            builder.event(event, value)
+            # Nested maps (e.g. a station's location) have a longer prefix
+            if event == "end_map" and prefix == f"{key}.item":
+                batches[key].append(builder.value)
+                builder = None
+                if len(batches[key]) >= batch_size:
+                    yield key, batches[key]
+                    batches[key] = []
+        for key, batch in batches.items():
+            if batch:
+                yield key, batch
+
+    def stream_all_v1_data(self, batch_size=1000):
+        return self.stream("/FuelPriceCheck/v1/fuel/prices", batch_size)
+
+    def stream_new_v1_data(self, batch_size=1000):
+        return self.stream("/FuelPriceCheck/v1/fuel/prices/new", batch_size)
+
+    def fetch_all_v1_data(self):
+        return self.fetch("/FuelPriceCheck/v1/fuel/prices")
+
+    def fetch_new_v1_data(self):
+        return self.fetch("/FuelPriceCheck/v1/fuel/prices/new")
+
+    def close(self):
+        self.session.close()
+
     def generate_random_hash(self):
         random_bytes = secrets.token_bytes(32)
         hash_object = hashlib.sha256(random_bytes)
-        return hash_object.hexdigest()
\ No newline at end of file
+        return hash_object.hexdigest()
@@ -0,0 +1,48 @@
+"""
+Cross-station price aggregation shared by the backend views and the predictor.
+"""
+import numpy as np
+import pandas as pd
+
+def station_average(df, time_column="timestamp", station_column="station_code", value_column="price"):
+    """
+    Mean price across stations at each timestamp. A station with no price at a
+    timestamp counts with its next later price, and not at all after its last one.
+
+    This matches pivoting stations into columns, back-filling and taking the row
+    mean, without building the timestamps x stations matrix: each station price
+    is added to the run of timestamps it would have filled, using running sums.
+    Rows already ordered by station then timestamp, as fetch_average_price returns
+    them, skip the sort.
+
+    Returns:
+        pd.Series: avg_price indexed by the sorted timestamps
+    """
+    if df[value_column].isna().any():
+        df = df[df[value_column].notna()]
+    time_codes, times = pd.factorize(df[time_column], sort=True)
+    station_codes, _ = pd.factorize(df[station_column])
+    values = df[value_column].to_numpy(dtype=float)
+    n_times = len(times)
+    index = pd.Index(times, name=time_column)
+    if n_times == 0:
+        return pd.Series(index=index, name="avg_price", dtype=float)
+
+    keys = station_codes.astype(np.int64) * n_times + time_codes
+    if (keys[1:] < keys[:-1]).any():
+        order = np.argsort(keys, kind="stable")
+        keys, values = keys[order], values[order]
+    # Average repeated (station, timestamp) prices as pivot_table does
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    if len(starts) < len(keys):
+        values = np.add.reduceat(values, starts) / np.diff(np.r_[starts, len(keys)])
+        keys = keys[starts]
+    stations, positions = np.divmod(keys, n_times)
+
+    # A price fills every timestamp after the station's previous price, up to and including its own
+    first = np.r_[True, stations[1:] != stations[:-1]]
+    run_starts = np.where(first, 0, np.r_[0, positions[:-1] + 1])
+    run_ends = positions + 1
+    totals = np.bincount(run_starts, weights=values, minlength=n_times + 1) - np.bincount(run_ends, weights=values, minlength=n_times + 1)
+    counts = np.bincount(run_starts, minlength=n_times + 1) - np.bincount(run_ends, minlength=n_times + 1)
+    return pd.Series(np.cumsum(totals)[:n_times] / np.cumsum(counts)[:n_times], index=index, name="avg_price")
@@ -0,0 +1,79 @@
+"""
+Benchmark for the back-filled cross-station daily mean used by the average price
+view and predict.load_data.
+
+Compares the wide pivot_table + bfill + row mean with aggregate.station_average,
+reporting latency and peak traced memory for each.
+
+Usage:
+    python database/benchmarks/bench_aggregate.py --stations 2500 --days 365
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.aggregate import station_average
+
+
+def make_daily_averages(n_stations, n_days, report_rate, seed=0):
+    # One row per station per day it reported, in the station then day order
+    # fetch_average_price(interval="D") returns
+    rng = np.random.default_rng(seed)
+    stations = np.repeat(np.arange(n_stations), n_days)
+    days = np.tile(np.arange(n_days), n_stations)
+    reported = rng.random(len(days)) < report_rate
+    return pd.DataFrame({
+        "timestamp": pd.Timestamp("2025-01-01") + pd.to_timedelta(days[reported], unit="D"),
+        "station_code": stations[reported].astype(str),
+        "price": rng.uniform(150, 230, reported.sum()).round(1),
+    })
+
+
+def pivot_average(df):
+    df_pivot = df.pivot_table(index="timestamp", columns="station_code", values="price")
+    df_pivot.bfill(inplace=True)
+    return df_pivot.mean(axis=1)
+
+
+def measure(func, df, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(df)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=2500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--report-rate", type=float, default=0.4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_daily_averages(args.stations, args.days, args.report_rate)
+    pivot_time, pivot_peak, expected = measure(pivot_average, df, args.repeats)
+    engine_time, engine_peak, result = measure(station_average, df, args.repeats)
+    assert np.allclose(expected.to_numpy(), result.to_numpy())
+    shuffled = df.sample(frac=1, random_state=0)
+    unsorted_time, unsorted_peak, _ = measure(station_average, shuffled, args.repeats)
+
+    print(f"{len(df):,} station-days, {args.stations:,} stations x {args.days} days")
+    print(f"pivot     {pivot_time * 1000:>10.1f} ms   peak {pivot_peak / 2**20:>8.1f} MiB")
+    print(f"vectorized{engine_time * 1000:>10.1f} ms   peak {engine_peak / 2**20:>8.1f} MiB   ({pivot_time / engine_time:.1f}x faster, {pivot_peak / engine_peak:.1f}x less memory)")
+    print(f"  unsorted{unsorted_time * 1000:>10.1f} ms   peak {unsorted_peak / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Timing harness for one ingest cycle against a local fake NSW Fuel API with
+injected latency on the price endpoints.
+
+Compares the sequential DatabaseW.update_db with DatabaseW.update_db_async,
+which keeps /prices and /prices/new in flight together and writes the first
+response while the second is still pending.
+
+Usage:
+    python database/benchmarks/bench_fetch.py --latency 1.5 --stations 2500
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.DatabaseW import DatabaseW
+from bench_ingest import make_snapshot
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/oauth/"):
+            payload = b'{"access_token": "token", "expires_in": "43199"}'
+        else:
+            time.sleep(self.server.latency)
+            payload = self.server.payloads[path]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(latency, snapshot, delta):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+    server.latency = latency
+    server.payloads = {
+        "/FuelPriceCheck/v1/fuel/prices": json.dumps(snapshot).encode("utf-8"),
+        "/FuelPriceCheck/v1/fuel/prices/new": json.dumps(delta).encode("utf-8"),
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_payloads(n_stations):
+    prices = make_snapshot(n_stations, 5)
+    stations = [{
+        "brandid": "1", "stationid": str(code), "brand": "Brand", "code": str(code),
+        "name": f"Station {code}", "address": f"{code} Main St, Sydney NSW 2000",
+        "location": {"latitude": -33.8, "longitude": 151.2}, "isAdBlueAvailable": False,
+    } for code in range(1, n_stations + 1)]
+    # The delta is a slice of the snapshot with newer timestamps
+    delta = [dict(price, lastupdated=price["lastupdated"].replace("/06/", "/07/")) for price in prices[: len(prices) // 10]]
+    return {"stations": stations, "prices": prices}, {"stations": stations[: n_stations // 10], "prices": delta}
+
+
+def time_cycle(base_url, concurrent):
+    with tempfile.TemporaryDirectory() as tmp:
+        database = DatabaseW(os.path.join(tmp, "bench.db"), 0, "Basic bench", "key",
+                             concurrent_fetch=concurrent, base_url=base_url)
+        start = time.perf_counter()
+        if concurrent:
+            asyncio.run(database.update_db_async())
+        else:
+            database.update_db()
+        elapsed = time.perf_counter() - start
+        database.fetcher.close()
+        database.unload()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=1.5, help="Seconds each price endpoint waits before responding")
+    parser.add_argument("--stations", type=int, default=2500)
+    args = parser.parse_args()
+
+    snapshot, delta = make_payloads(args.stations)
+    server = start_server(args.latency, snapshot, delta)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    sequential = time_cycle(base_url, concurrent=False)
+    concurrent = time_cycle(base_url, concurrent=True)
+    server.shutdown()
+
+    print(f"{len(snapshot['prices']):,} snapshot rows, {len(delta['prices']):,} delta rows, {args.latency}s latency per endpoint")
+    print(f"sequential  {sequential:>8.2f} s")
+    print(f"concurrent  {concurrent:>8.2f} s   ({sequential / concurrent:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
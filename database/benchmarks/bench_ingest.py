@@ -0,0 +1,90 @@
+"""
+Benchmark for DatabaseW price ingest on a synthetic full-state /fuel/prices snapshot.
+
+Compares the legacy per-row path (price_exists SELECT + single-row INSERT) with
+the set-based bulk path used by save_prices_to_db.
+
+Usage:
+    python database/benchmarks/bench_ingest.py --stations 2500 --fuel-types 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import pandas as pd
+import pytz
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.DatabaseW import DatabaseW
+
+FUEL_TYPES = ["E10", "U91", "P95", "P98", "DL", "PDL", "LPG", "E85"]
+
+
+def make_snapshot(n_stations, n_fuel_types, seed=0):
+    rng = random.Random(seed)
+    prices = []
+    for code in range(1, n_stations + 1):
+        for fuel_type in FUEL_TYPES[:n_fuel_types]:
+            prices.append({
+                "stationcode": str(code),
+                "fueltype": fuel_type,
+                "price": round(rng.uniform(150, 230), 1),
+                "lastupdated": f"{rng.randint(1, 28):02d}/06/2025 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            })
+    return prices
+
+
+def legacy_save_prices_to_db(database, prices_data):
+    cursor = database.cursor
+    prices_df = pd.DataFrame(prices_data)
+    timezone = pytz.timezone("UTC")
+    for _, row in prices_df.iterrows():
+        timestamp = database.convert_to_unix_timestamp(row['lastupdated'], timezone)
+        if not database.price_exists(cursor, row['stationcode'], row['fueltype'], timestamp) and timestamp > database.start_timestamp:
+            cursor.execute("""
+            INSERT INTO prices (station_code, fuel_type, price, timestamp)
+            VALUES (?, ?, ?, ?)
+            """, (row['stationcode'], row['fueltype'], row['price'], timestamp))
+    database.conn.commit()
+
+
+def open_database(db_path):
+    with patch("database.DatabaseW.Fetcher"):
+        return DatabaseW(db_path, 0, None, None)
+
+
+def run(label, save, prices, repeats):
+    with tempfile.TemporaryDirectory() as tmp:
+        database = open_database(os.path.join(tmp, "bench.db"))
+        database.save_prices_to_db([])
+        timings = []
+        # First pass ingests into an empty table, later passes re-ingest the same
+        # snapshot and measure the dedupe cost that dominates every fetch cycle.
+        for _ in range(repeats):
+            start = time.perf_counter()
+            save(database, prices)
+            timings.append(time.perf_counter() - start)
+        database.unload()
+    cold, warm = timings[0], min(timings[1:]) if len(timings) > 1 else timings[0]
+    print(f"{label:<8} cold: {len(prices) / cold:>12,.0f} rows/s   re-ingest: {len(prices) / warm:>12,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=2500)
+    parser.add_argument("--fuel-types", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    prices = make_snapshot(args.stations, args.fuel_types)
+    print(f"Synthetic snapshot: {len(prices):,} price rows")
+    run("legacy", legacy_save_prices_to_db, prices, args.repeats)
+    run("bulk", DatabaseW.save_prices_to_db, prices, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark for DatabaseR.get_nearby_suburbs on a synthetic postcode database.
+
+Compares the legacy path (load the postcodes table into pandas and run geopy's
+geodesic row by row on every call) with the cached grid index from spatial.py.
+The index refines with haversine distance rather than the WGS84 geodesic, so
+postcodes within a few metres of the radius can differ between the two.
+
+Usage:
+    python database/benchmarks/bench_nearby.py --postcodes 5000 --radius 5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from geopy.distance import geodesic
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.DatabaseR import DatabaseR
+from database.spatial import postcode_index
+
+# Roughly the NSW bounding box
+LATITUDES = (-37.5, -28.2)
+LONGITUDES = (141.0, 153.6)
+
+
+def make_postcode_db(path, n_postcodes, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE postcodes (postcode TEXT, suburb TEXT, latitude REAL, longitude REAL)")
+    rows = []
+    for i in range(n_postcodes):
+        # Half the postcodes cluster around Sydney, like the real gazetteer
+        if i % 2:
+            latitude, longitude = rng.gauss(-33.87, 0.3), rng.gauss(151.1, 0.3)
+        else:
+            latitude, longitude = rng.uniform(*LATITUDES), rng.uniform(*LONGITUDES)
+        # A few suburbs per postcode
+        for suburb in range(rng.randint(1, 3)):
+            rows.append((str(2000 + i), f"Suburb {i}-{suburb}", latitude + rng.uniform(-0.01, 0.01), longitude + rng.uniform(-0.01, 0.01)))
+    conn.executemany("INSERT INTO postcodes VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_nearby_suburbs(latitude, longitude, radius_km, postcode_db_path):
+    conn = sqlite3.connect(postcode_db_path)
+    df = pd.read_sql_query("SELECT postcode, suburb, latitude, longitude FROM postcodes", conn)
+    conn.close()
+    df["postcode"] = df["postcode"].astype(str).str.zfill(4)
+    df = df.drop_duplicates(subset="postcode", keep="first")
+    df["distance_km"] = df.apply(lambda row: geodesic((latitude, longitude), (row["latitude"], row["longitude"])).km, axis=1)
+    nearby_df = df[df["distance_km"] <= radius_km].copy()
+    nearby_df.sort_values("distance_km", inplace=True)
+    return nearby_df.to_dict("records")
+
+
+def time_queries(func, points):
+    start = time.perf_counter()
+    results = [func(latitude, longitude) for latitude, longitude in points]
+    return (time.perf_counter() - start) / len(points), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--postcodes", type=int, default=5000)
+    parser.add_argument("--radius", type=float, default=5.0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-queries", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    points = [(rng.gauss(-33.87, 0.3), rng.gauss(151.1, 0.3)) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        postcode_db_path = os.path.join(tmp, "postcodes.db")
+        make_postcode_db(postcode_db_path, args.postcodes)
+        database = DatabaseR(postcode_db_path, read_only=True)
+
+        start = time.perf_counter()
+        postcode_index(postcode_db_path)
+        build = time.perf_counter() - start
+
+        legacy, expected = time_queries(lambda lat, lon: legacy_get_nearby_suburbs(lat, lon, args.radius, postcode_db_path), points[:args.legacy_queries])
+        indexed, results = time_queries(lambda lat, lon: database.get_nearby_suburbs(lat, lon, args.radius, postcode_db_path), points)
+        database.unload()
+
+    mismatched = sum(
+        {row["postcode"] for row in want} != {row["postcode"] for row in got}
+        for want, got in zip(expected, results)
+    )
+    print(f"{args.postcodes:,} postcodes, {args.radius} km radius")
+    print(f"index build        {build * 1000:>10.1f} ms (once per process)")
+    print(f"legacy  per query  {legacy * 1000:>10.3f} ms")
+    print(f"indexed per query  {indexed * 1000:>10.3f} ms   ({legacy / indexed:.0f}x)")
+    print(f"result sets differing at the radius boundary: {mismatched}/{len(expected)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark for building the predictor's training windows over a long daily history.
+
+Compares the per-window iloc loop that predict.create_sequences used, followed by
+torch.tensor copies in PriceDataset, with sequences.sequence_tensors, which unfolds
+one tensor over the series. Reports latency and peak memory for each. Peak memory
+is the tracemalloc high-water mark plus the bytes of any tensor that does not share
+the series' memory, since torch allocations are not traced. Without torch the
+numpy windows of sequences.create_sequences are measured instead.
+
+Usage:
+    python database/benchmarks/bench_sequences.py --days 3650 --seq-length 60 --features 4
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.sequences import as_rows, create_sequences, sequence_tensors
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def loop_sequences(scaled_df, seq_length):
+    X, y = [], []
+    for i in range(len(scaled_df) - seq_length):
+        X.append(scaled_df.iloc[i:i+seq_length].values)
+        y.append(scaled_df.iloc[i+seq_length].values[0])
+    return np.array(X), np.array(y)
+
+
+def loop_builder(scaled_df, seq_length):
+    X, y = loop_sequences(scaled_df, seq_length)
+    if torch is None:
+        return X, y
+    return X, y, torch.tensor(X, dtype=torch.float32), torch.tensor(y, dtype=torch.float32)
+
+
+def strided_builder(scaled_df, seq_length):
+    if torch is None:
+        return create_sequences(scaled_df, seq_length)
+    values = as_rows(scaled_df)
+    X_tensor, y_tensor = sequence_tensors(values, seq_length)
+    return X_tensor.numpy(), y_tensor.numpy(), X_tensor, y_tensor, values
+
+
+def copied_bytes(result):
+    if torch is None:
+        return 0
+    X_tensor, y_tensor = result[2:4]
+    series = result[4] if len(result) > 4 else None
+    # Tensors over the series share its storage, any other storage was allocated for them
+    return sum(tensor.untyped_storage().nbytes() for tensor in (X_tensor, y_tensor)
+               if series is None or tensor.untyped_storage().data_ptr() != series.ctypes.data)
+
+
+def measure(builder, scaled_df, seq_length, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        builder(scaled_df, seq_length)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = builder(scaled_df, seq_length)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak + copied_bytes(result), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--seq-length", type=int, default=60)
+    parser.add_argument("--features", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scaled_df = pd.DataFrame(rng.random((args.days, args.features)),
+                             index=pd.date_range("2015-01-01", periods=args.days, freq="D"))
+    loop_time, loop_peak, expected = measure(loop_builder, scaled_df, args.seq_length, args.repeats)
+    strided_time, strided_peak, result = measure(strided_builder, scaled_df, args.seq_length, args.repeats)
+    assert np.allclose(expected[0], result[0]) and np.allclose(expected[1], result[1])
+
+    print(f"{len(result[0]):,} windows of {args.seq_length} days x {args.features} features"
+          + ("" if torch else ", torch not installed so tensors are not built"))
+    print(f"loop   {loop_time * 1000:>10.1f} ms   peak {loop_peak / 2**20:>8.2f} MiB")
+    print(f"strided{strided_time * 1000:>10.1f} ms   peak {strided_peak / 2**20:>8.2f} MiB   ({loop_time / strided_time:.0f}x faster, {loop_peak / strided_peak:.0f}x less memory)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Peak-memory benchmark for ingesting a full /prices snapshot from a local fake
+NSW Fuel API.
+
+Compares the whole-response path (response.json() -> DataFrame) with the
+streaming path (incremental parse, fixed-size batches straight to the DB).
+Peak memory is the tracemalloc high-water mark of Python allocations.
+
+Usage:
+    python database/benchmarks/bench_stream.py --stations 20000 --batch-size 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.DatabaseW import DatabaseW
+from bench_fetch import make_payloads, start_server
+
+
+def measure(base_url, stream_batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        database = DatabaseW(os.path.join(tmp, "bench.db"), 0, "Basic bench", "key",
+                             stream_batch_size=stream_batch_size, base_url=base_url)
+        tracemalloc.start()
+        start = time.perf_counter()
+        database.update_db()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        database.fetcher.close()
+        database.unload()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    snapshot, delta = make_payloads(args.stations)
+    server = start_server(0, snapshot, delta)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    payload_mb = len(server.payloads["/FuelPriceCheck/v1/fuel/prices"]) / 2**20
+
+    whole_time, whole_peak = measure(base_url, 0)
+    stream_time, stream_peak = measure(base_url, args.batch_size)
+    server.shutdown()
+
+    print(f"{len(snapshot['prices']):,} snapshot rows, {payload_mb:.1f} MiB response")
+    print(f"whole response  {whole_time:>7.2f} s   peak {whole_peak / 2**20:>8.1f} MiB")
+    print(f"streaming       {stream_time:>7.2f} s   peak {stream_peak / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
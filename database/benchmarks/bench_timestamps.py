@@ -0,0 +1,61 @@
+"""
+Benchmark for lastupdated timestamp normalisation on a synthetic prices payload.
+
+Compares the per-row DatabaseW.convert_to_unix_timestamp converter with the
+vectorized DatabaseW.normalise_timestamps stage used by save_prices_to_db.
+
+Usage:
+    python database/benchmarks/bench_timestamps.py --rows 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+import pytz
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from database.DatabaseW import DatabaseW
+
+
+def make_lastupdated(n_rows, seed=0):
+    rng = random.Random(seed)
+    return pd.Series([
+        f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+        for _ in range(n_rows)
+    ])
+
+
+def best_of(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    # Neither converter touches the connection or the fetcher
+    database = DatabaseW.__new__(DatabaseW)
+    date_strs = make_lastupdated(args.rows)
+    timezone = pytz.timezone("UTC")
+
+    per_row, expected = best_of(lambda: [database.convert_to_unix_timestamp(d, timezone) for d in date_strs], args.repeats)
+    vectorized, result = best_of(lambda: database.normalise_timestamps(date_strs), args.repeats)
+    assert result.tolist() == expected
+
+    print(f"{args.rows:,} rows")
+    print(f"per-row     {per_row * 1000:>10.1f} ms   {args.rows / per_row:>14,.0f} rows/s")
+    print(f"vectorized  {vectorized * 1000:>10.1f} ms   {args.rows / vectorized:>14,.0f} rows/s   ({per_row / vectorized:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Online compaction of the prices history into change-only form.
+
+Deletes rows whose price equals the previous row of the same station and fuel
+type, a few stations per transaction so the ingester is never blocked for long,
+then hands the freed pages back to the filesystem with incremental VACUUM.
+
+Incremental VACUUM needs auto_vacuum=INCREMENTAL, and switching a database to it
+runs one full VACUUM that locks out the ingester for its whole length. That is
+only done when asked for with --enable-incremental-vacuum, during maintenance.
+Otherwise a database without it keeps its freed pages for reuse.
+
+price_daily keeps the sums and counts of every observation, so fetch_average_price
+returns the same results before and after compaction. The newest row of each
+series is always kept, so re-sent snapshot rows are still recognised as stored.
+Raw history does change, so every batch that deletes rows bumps the prices
+generation in the same transaction.
+
+Usage:
+    python compact.py [stations_per_batch] [vacuum_pages_per_step] [--enable-incremental-vacuum]
+"""
+import os
+import sys
+import time
+from dotenv import load_dotenv
+try:
+    from .connection import connect
+    from .schema import bump_generation
+except ImportError:
+    from connection import connect
+    from schema import bump_generation
+
+def compact_prices(conn, stations_per_batch=100, pause=0.0):
+    station_codes = [row[0] for row in conn.execute("SELECT DISTINCT station_code FROM prices ORDER BY station_code")]
+    removed = 0
+    for i in range(0, len(station_codes), stations_per_batch):
+        batch = station_codes[i:i + stations_per_batch]
+        placeholders = ','.join('?' for _ in batch)
+        with conn:
+            cursor = conn.execute(f"""
+            DELETE FROM prices
+            WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT
+                        rowid,
+                        price,
+                        LAG(price) OVER series AS previous_price,
+                        LEAD(timestamp) OVER series AS next_timestamp
+                    FROM prices
+                    WHERE station_code IN ({placeholders})
+                    WINDOW series AS (PARTITION BY station_code, fuel_type ORDER BY timestamp)
+                )
+                WHERE price = previous_price AND next_timestamp IS NOT NULL
+            )
+            """, batch)
+            if cursor.rowcount:
+                # Cached history responses hold the deleted rows, invalidate them with the delete
+                bump_generation(conn, "prices")
+            removed += cursor.rowcount
+        # Give the ingester a chance to take the write lock between batches
+        if pause:
+            time.sleep(pause)
+    return removed
+
+def incremental_vacuum_enabled(conn):
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def enable_incremental_vacuum(conn):
+    # auto_vacuum only takes effect after a full VACUUM, so this is a one-off cost per database
+    if not incremental_vacuum_enabled(conn):
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+def incremental_vacuum(conn, pages_per_step=1000, pause=0.0):
+    # Without auto_vacuum=INCREMENTAL the pragma frees nothing
+    if not incremental_vacuum_enabled(conn):
+        return 0
+    reclaimed = 0
+    while True:
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages == 0:
+            return reclaimed
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages_per_step)})").fetchall()
+        reclaimed += min(free_pages, pages_per_step)
+        if pause:
+            time.sleep(pause)
+
+def main():
+    load_dotenv()
+    args = [arg for arg in sys.argv[1:] if arg != "--enable-incremental-vacuum"]
+    stations_per_batch = int(args[0]) if len(args) > 0 else 100
+    pages_per_step = int(args[1]) if len(args) > 1 else 1000
+    conn = connect(os.getenv("DB_PATH"))
+    if len(args) < len(sys.argv) - 1:
+        print("Switching to auto_vacuum=INCREMENTAL, writers are blocked until the full VACUUM finishes...")
+        enable_incremental_vacuum(conn)
+    removed = compact_prices(conn, stations_per_batch, pause=0.05)
+    print(f"Removed {removed} redundant price rows.")
+    if not incremental_vacuum_enabled(conn):
+        print("auto_vacuum is not INCREMENTAL, freed pages are kept for reuse. Run once with --enable-incremental-vacuum during maintenance to reclaim them.")
+    else:
+        reclaimed = incremental_vacuum(conn, pages_per_step, pause=0.05)
+        print(f"Reclaimed {reclaimed} pages.")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
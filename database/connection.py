@@ -0,0 +1,58 @@
+"""
+Connection factory for every SQLite database the ingester, predictor and backend open.
+
+Writers switch the database to WAL so backend reads no longer block on ingest
+writes. Every process opening a database must see the same -wal and -shm files
+beside it, so containers mount the directory holding it rather than the file.
+Tuning PRAGMAs are read from the environment on each connect:
+
+    SQLITE_SYNCHRONOUS (str): OFF, NORMAL, FULL or EXTRA, NORMAL by default (safe with WAL)
+    SQLITE_MMAP_SIZE (int): Bytes of the database file to memory-map
+    SQLITE_CACHE_SIZE (int): Page cache size, negative values are KiB
+    SQLITE_TEMP_STORE (str): DEFAULT, FILE or MEMORY
+    SQLITE_BUSY_TIMEOUT (int): Milliseconds to wait on a locked database
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+PRAGMA_DEFAULTS = {
+    "synchronous": ("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": ("SQLITE_MMAP_SIZE", "268435456"),
+    "cache_size": ("SQLITE_CACHE_SIZE", "-65536"),
+    "temp_store": ("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": ("SQLITE_BUSY_TIMEOUT", "5000"),
+}
+
+PRAGMA_CHOICES = {
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY", "0", "1", "2"},
+}
+
+def pragma_settings():
+    settings = {}
+    for pragma, (env_name, default) in PRAGMA_DEFAULTS.items():
+        value = (os.getenv(env_name) or default).strip().upper()
+        if pragma in PRAGMA_CHOICES:
+            if value not in PRAGMA_CHOICES[pragma]:
+                raise ValueError(f"Invalid {env_name}: {value}")
+        else:
+            try:
+                value = str(int(value))
+            except ValueError:
+                raise ValueError(f"Invalid {env_name}: {value}")
+        settings[pragma] = value
+    return settings
+
+def connect(db_path, read_only=False, **kwargs):
+    if read_only:
+        # mode=ro fails instead of creating an empty database, and can never take a write lock
+        uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(db_path, **kwargs)
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    for pragma, value in pragma_settings().items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
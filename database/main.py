@@ -1,5 +1,9 @@
 import sched
 import time
+import asyncio
+import math
+import random
+import traceback
 from DatabaseW import DatabaseW
 import os
 from dotenv import load_dotenv
@@ -9,25 +13,69 @@ AUTHORIZATION_HEADER = os.getenv("AUTHORIZATION_HEADER")
 API_KEY = os.getenv("API_KEY")
 START_TIMESTAMP = int(os.getenv("START_TIMESTAMP"))
 FETCH_INTERVAL = os.getenv("FETCH_INTERVAL")
+FULL_SYNC_EVERY = int(os.getenv("FULL_SYNC_EVERY") or 1)
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT") or 30)
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES") or 3)
+FETCH_BACKOFF = float(os.getenv("FETCH_BACKOFF") or 1.0)
+TOKEN_CACHE_PATH = os.getenv("TOKEN_CACHE_PATH") or None
+CONCURRENT_FETCH = os.getenv("CONCURRENT_FETCH", "False") == "True"
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE") or 0)
+FETCH_JITTER = float(os.getenv("FETCH_JITTER") or 0)
+CHANGE_ONLY_HISTORY = os.getenv("CHANGE_ONLY_HISTORY", "False") == "True"
 
 print(AUTHORIZATION_HEADER)
 print(API_KEY)
 print(type(FETCH_INTERVAL))
 
-def scheduled_update(scheduler, interval, database):
+def next_tick(now, interval, jitter=0):
+    # Ticks sit on multiples of the interval on the wall clock, so the run time
+    # of a cycle never pushes the following ones later
+    return (math.floor(now / interval) + 1) * interval + random.uniform(0, jitter)
+
+def missed_ticks(started_at, finished_at, interval):
+    # Ticks that came due while a cycle was still running are skipped rather than
+    # queued, so cycles never overlap or pile up behind a slow one
+    return max(math.floor(finished_at / interval) - math.floor(started_at / interval), 0)
+
+def scheduled_update(scheduler, interval, database, jitter=0):
+    started_at = time.time()
+    status = "error"
     try:
-        if database.update_db() == 1:
-            pass
+        if CONCURRENT_FETCH:
+            result = asyncio.run(database.update_db_async())
         else:
+            result = database.update_db()
+        if result != 1:
+            status = "ok"
             print("Database updated.")
-    except:
-        raise Exception("An error has occured when updating database")
+    except Exception:
+        status = "failed"
+        print("An error has occured when updating database")
+        traceback.print_exc()
     finally:
-        scheduler.enter(interval, 1, scheduled_update, (scheduler, interval, database))
+        finished_at = time.time()
+        skipped = missed_ticks(started_at, finished_at, interval)
+        if skipped:
+            print(f"Update took {finished_at - started_at:.1f}s, skipped {skipped} tick(s) of {interval}s")
+        try:
+            database.record_ingest_run(started_at, finished_at, status, interval, skipped)
+        except Exception:
+            traceback.print_exc()
+        scheduler.enterabs(next_tick(finished_at, interval, jitter), 1, scheduled_update, (scheduler, interval, database, jitter))
 
 if __name__ == "__main__":
-    database = DatabaseW(DB_PATH, START_TIMESTAMP, AUTHORIZATION_HEADER, API_KEY)
+    database = DatabaseW(
+        DB_PATH, START_TIMESTAMP, AUTHORIZATION_HEADER, API_KEY,
+        full_sync_every=FULL_SYNC_EVERY,
+        concurrent_fetch=CONCURRENT_FETCH,
+        stream_batch_size=STREAM_BATCH_SIZE,
+        change_only=CHANGE_ONLY_HISTORY,
+        timeout=FETCH_TIMEOUT,
+        retries=FETCH_RETRIES,
+        backoff_factor=FETCH_BACKOFF,
+        token_cache_path=TOKEN_CACHE_PATH,
+    )
     scheduler = sched.scheduler(time.time, time.sleep)
     interval = float(FETCH_INTERVAL)
-    scheduler.enter(0, 1, scheduled_update, (scheduler, interval, database))
+    scheduler.enter(0, 1, scheduled_update, (scheduler, interval, database, FETCH_JITTER))
     scheduler.run()
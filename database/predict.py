@@ -7,7 +7,10 @@ import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 import matplotlib.pyplot as plt
 from DatabaseR import DatabaseR
-import sqlite3
+from connection import connect
+from aggregate import station_average
+from sequences import sequence_tensors
+from schema import create_generations, add_generation_timestamps, bump_generation
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -27,27 +30,17 @@ else:
     DEVICE = torch.device("cpu")
 
 def load_data(db_path, fuel_type):
-    db = DatabaseR(db_path)
+    db = DatabaseR(db_path, read_only=True)
     df = db.fetch_average_price(fuel_type=fuel_type, interval="D")
     db.unload()
     df["timestamp"] = pd.to_datetime(df["timestamp"])
-    df_pivot = df.pivot_table(index="timestamp", columns="station_code", values="price")
-
-    df_pivot.bfill(inplace=True)
-    daily_avg = df_pivot.mean(axis=1).to_frame(name="avg_price")
+    daily_avg = station_average(df).to_frame()
     return daily_avg
 
-def create_sequences(scaled_df, seq_length):
-    X, y = [], []
-    for i in range(len(scaled_df) - seq_length):
-        X.append(scaled_df.iloc[i:i+seq_length].values)
-        y.append(scaled_df.iloc[i+seq_length].values[0])
-    return np.array(X), np.array(y)
-
 class PriceDataset(Dataset):
-    def __init__(self, X, y):
-        self.X = torch.tensor(X, dtype=torch.float32)
-        self.y = torch.tensor(y, dtype=torch.float32)
+    def __init__(self, values, seq_length, target_column=0):
+        # Windows are views of one tensor over the series, batches are copied as they are collated
+        self.X, self.y = sequence_tensors(values, seq_length, target_column)
         
     def __len__(self):
         return len(self.X)
@@ -64,8 +57,8 @@ class LSTMModel(nn.Module):
         out, _ = self.lstm(x)
         return self.fc(out[:, -1, :])
 
-def train_model(train_loader, val_loader, device, model_path, epochs=EPOCHS, patience=PATIENCE):
-    model = LSTMModel().to(device)
+def train_model(train_loader, val_loader, device, model_path, epochs=EPOCHS, patience=PATIENCE, input_size=1):
+    model = LSTMModel(input_size=input_size).to(device)
     criterion = nn.MSELoss()
     optimizer = optim.Adam(model.parameters(), lr=1e-3)
 
@@ -109,7 +102,7 @@ def train_model(train_loader, val_loader, device, model_path, epochs=EPOCHS, pat
     return model
 
 def forecast_future(model, X, scaler, device, fuel_type, last_date, future_days=30):
-    last_seq = torch.tensor(X[-1], dtype=torch.float32).unsqueeze(0).to(device)
+    last_seq = torch.as_tensor(X[-1], dtype=torch.float32).unsqueeze(0).to(device)
     future_preds = []
     model.eval()
 
@@ -129,7 +122,7 @@ def forecast_future(model, X, scaler, device, fuel_type, last_date, future_days=
     return future_dates, future_preds_inverse
 
 def save_forecast_to_db(db_path, dates, prices, fuel_type):
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -141,8 +134,13 @@ def save_forecast_to_db(db_path, dates, prices, fuel_type):
         )
     """)
 
+    create_generations(cursor)
+    add_generation_timestamps(cursor)
+
     data = [(int(date.timestamp()), float(price), fuel_type) for date, price in zip(dates, prices)]
     cursor.executemany("INSERT INTO future_forecast (timestamp, forecast_price, fuel_type) VALUES (?, ?, ?)", data)
+    # Tells the backend its cached forecast responses are stale
+    bump_generation(cursor, "forecast")
     conn.commit()
     conn.close()
 
@@ -156,12 +154,11 @@ def main():
         scaled = scaler.fit_transform(daily_avg)
         scaled_df = pd.DataFrame(scaled, index=daily_avg.index, columns=["avg_price"])
 
-        X, y = create_sequences(scaled_df, SEQ_LENGTH)
-
-        print("Final X shape:", X.shape)
-        print("Final y shape:", y.shape)
+        dataset = PriceDataset(scaled_df, SEQ_LENGTH)
+        X = dataset.X
 
-        dataset = PriceDataset(X, y)
+        print("Final X shape:", tuple(X.shape))
+        print("Final y shape:", tuple(dataset.y.shape))
 
         train_size = int(0.8 * len(dataset))
         val_size = len(dataset) - train_size
@@ -170,7 +167,7 @@ def main():
         val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE)
 
         print("Training model...")
-        model = train_model(train_loader, val_loader, DEVICE, MODEL_PATH)
+        model = train_model(train_loader, val_loader, DEVICE, MODEL_PATH, input_size=X.shape[2])
         print("Forecasting future prices...")
         forecast_future(model, X, scaler, DEVICE, fuel_type, daily_avg.index[-1])
 
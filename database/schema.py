@@ -0,0 +1,164 @@
+"""
+Versioned schema migrations for the fuel prices database.
+
+The applied version is kept in PRAGMA user_version. Each migration runs once,
+in order, inside its own transaction, so a database created by any earlier
+version of the ingester is brought up to date on the next DatabaseW start.
+"""
+import time
+
+def create_base_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS stations (
+        brand_id TEXT,
+        station_id TEXT,
+        brand TEXT,
+        station_code TEXT PRIMARY KEY,
+        name TEXT,
+        address TEXT,
+        latitude REAL,
+        longitude REAL,
+        is_adblue_available BOOLEAN,
+        postcode TEXT,
+        fingerprint INTEGER
+    )
+    """)
+    # Stations tables created before postcode/fingerprint existed
+    cursor.execute("PRAGMA table_info(stations);")
+    columns = [info[1] for info in cursor.fetchall()]
+    if 'postcode' not in columns:
+        cursor.execute("ALTER TABLE stations ADD COLUMN postcode TEXT")
+    if 'fingerprint' not in columns:
+        cursor.execute("ALTER TABLE stations ADD COLUMN fingerprint INTEGER")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS prices (
+        station_code TEXT,
+        fuel_type TEXT,
+        price REAL,
+        timestamp INTEGER,
+        PRIMARY KEY (station_code, fuel_type, timestamp),
+        FOREIGN KEY (station_code) REFERENCES stations (station_code)
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_runs (
+        id INTEGER PRIMARY KEY,
+        started_at REAL NOT NULL,
+        finished_at REAL NOT NULL,
+        status TEXT NOT NULL,
+        mode TEXT,
+        inserted INTEGER,
+        skipped INTEGER,
+        fetch_seconds REAL,
+        parse_seconds REAL,
+        write_seconds REAL,
+        total_seconds REAL,
+        interval_seconds REAL,
+        skipped_ticks INTEGER
+    )
+    """)
+
+def add_range_indexes(cursor):
+    # Date-range queries filter on fuel_type then a timestamp range, which the
+    # (station_code, fuel_type, timestamp) primary key cannot serve
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_prices_fuel_type_timestamp ON prices (fuel_type, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stations_postcode ON stations (postcode)")
+
+def create_price_daily(cursor):
+    # Per-day, per-station rollup maintained by DatabaseW alongside every insert into
+    # prices. Days are UTC day starts in epoch seconds.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS price_daily (
+        fuel_type TEXT,
+        day INTEGER,
+        station_code TEXT,
+        price_sum REAL NOT NULL,
+        price_count INTEGER NOT NULL,
+        price_min REAL NOT NULL,
+        price_max REAL NOT NULL,
+        PRIMARY KEY (fuel_type, day, station_code)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    INSERT OR REPLACE INTO price_daily (fuel_type, day, station_code, price_sum, price_count, price_min, price_max)
+    SELECT
+        fuel_type,
+        (timestamp / 86400) * 86400 AS day,
+        station_code,
+        SUM(price),
+        COUNT(*),
+        MIN(price),
+        MAX(price)
+    FROM prices
+    GROUP BY fuel_type, day, station_code
+    """)
+
+def create_current_prices(cursor):
+    # Newest price per station and fuel type, maintained by DatabaseW on ingest.
+    # SQLite returns the bare price column from the row that holds MAX(timestamp).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS current_prices (
+        station_code TEXT,
+        fuel_type TEXT,
+        price REAL NOT NULL,
+        timestamp INTEGER NOT NULL,
+        PRIMARY KEY (station_code, fuel_type)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    INSERT OR REPLACE INTO current_prices (station_code, fuel_type, price, timestamp)
+    SELECT station_code, fuel_type, price, MAX(timestamp)
+    FROM prices
+    GROUP BY station_code, fuel_type
+    """)
+
+def create_generations(cursor):
+    # Counters bumped by writers when a table's contents change, so readers can
+    # tell whether anything they derived from it is stale
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS generations (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+
+def add_generation_timestamps(cursor):
+    # When each counter last moved, served as Last-Modified by the backend
+    cursor.execute("PRAGMA table_info(generations);")
+    columns = [info[1] for info in cursor.fetchall()]
+    if 'updated_at' not in columns:
+        cursor.execute("ALTER TABLE generations ADD COLUMN updated_at REAL")
+
+def bump_generation(cursor, name):
+    cursor.execute("""
+    INSERT INTO generations (name, value, updated_at) VALUES (?, 1, ?)
+    ON CONFLICT (name) DO UPDATE SET value = value + 1, updated_at = excluded.updated_at
+    """, (name, time.time()))
+
+MIGRATIONS = [
+    create_base_tables,
+    add_range_indexes,
+    create_price_daily,
+    create_current_prices,
+    create_generations,
+    add_generation_timestamps,
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    version = schema_version(conn)
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    return schema_version(conn)
@@ -0,0 +1,61 @@
+"""
+Sliding-window training sequences for the price predictor.
+"""
+import numpy as np
+
+def as_rows(values, dtype=np.float32):
+    # One contiguous (rows, features) array, copied only when values is not one already
+    values = np.asarray(values, dtype=dtype)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    return np.ascontiguousarray(values)
+
+def create_sequences(values, seq_length, target_column=0, dtype=np.float32):
+    """
+    Input windows of seq_length consecutive rows, each paired with the target
+    column of the row that follows it.
+
+    The windows are a read-only strided view over one copy of values, so X costs
+    no more memory than the series itself however many windows overlap. Use
+    sequence_tensors for the same windows as torch tensors.
+
+    Args:
+        values (array-like or pd.DataFrame): Rows in time order, one column per feature
+        seq_length (int): Rows per window
+        target_column (int): Column predicted from each window
+
+    Returns:
+        tuple: X of shape (windows, seq_length, features) and y of shape (windows,)
+    """
+    values = as_rows(values, dtype)
+    n_windows = len(values) - seq_length
+    if n_windows <= 0:
+        return np.empty((0, seq_length, values.shape[1]), dtype=dtype), np.empty(0, dtype=dtype)
+
+    # (windows, features, seq_length) over the rows before the last, then swapped to
+    # (windows, seq_length, features). Both are views, and the windows overlap
+    X = np.lib.stride_tricks.sliding_window_view(values[:-1], seq_length, axis=0).transpose(0, 2, 1)
+    y = values[seq_length:, target_column]
+    return X, y
+
+def sequence_tensors(values, seq_length, target_column=0):
+    """
+    create_sequences as float32 torch tensors, windowed with unfold over one
+    tensor sharing the series' memory, so nothing is copied per window.
+    """
+    import torch
+
+    values = as_rows(values, np.float32)
+    if not values.flags.writeable:
+        # torch.from_numpy warns on read-only arrays, one copy of the series avoids it
+        values = values.copy()
+    n_windows = len(values) - seq_length
+    if n_windows <= 0:
+        return torch.empty((0, seq_length, values.shape[1])), torch.empty(0)
+
+    series = torch.from_numpy(values)
+    # (windows, features, seq_length) over the rows before the last, then swapped to
+    # (windows, seq_length, features). Both are views, never write to them
+    X = series[:-1].unfold(0, seq_length, 1).transpose(1, 2)
+    y = series[seq_length:, target_column]
+    return X, y
@@ -0,0 +1,182 @@
+"""
+In-memory spatial index for radius queries over latitude/longitude points.
+
+Points are bucketed into a fixed grid of latitude/longitude cells. A radius query
+only visits the cells overlapping the query's bounding box, then refines those
+candidates with a vectorized haversine distance, so nothing is computed per row in
+Python. Postcode indexes, which double as the postcode/suburb gazetteer, are built
+once per process and rebuilt only when the postcode database file changes. Station
+indexes are rebuilt when DatabaseW bumps the stations generation.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+try:
+    from .connection import connect
+except ImportError:
+    from connection import connect
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GridIndex:
+    def __init__(self, latitudes, longitudes, cell_degrees=0.1):
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.cell_degrees = cell_degrees
+        rows = np.floor(self.latitudes / cell_degrees).astype(np.int64)
+        cols = np.floor(self.longitudes / cell_degrees).astype(np.int64)
+        # Sort once so every cell is a contiguous slice of self.order
+        self.order = np.lexsort((cols, rows))
+        keys = list(zip(rows[self.order].tolist(), cols[self.order].tolist()))
+        self.cells = {}
+        for position, key in enumerate(keys):
+            start, _ = self.cells.get(key, (position, position))
+            self.cells[key] = (start, position + 1)
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def candidates(self, latitude, longitude, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles, size the box for its widest latitude
+        widest = min(abs(latitude) + lat_span, 89.9)
+        lon_span = min(radius_km / (KM_PER_DEGREE * np.cos(np.radians(widest))), 180)
+        row_range = range(int(np.floor((latitude - lat_span) / self.cell_degrees)), int(np.floor((latitude + lat_span) / self.cell_degrees)) + 1)
+        col_range = range(int(np.floor((longitude - lon_span) / self.cell_degrees)), int(np.floor((longitude + lon_span) / self.cell_degrees)) + 1)
+        if len(row_range) * len(col_range) > len(self.cells):
+            # Query box covers more cells than exist, scan the occupied cells instead
+            slices = [slice(*bounds) for (row, col), bounds in self.cells.items() if row in row_range and col in col_range]
+        else:
+            slices = [slice(*self.cells[(row, col)]) for row in row_range for col in col_range if (row, col) in self.cells]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.order[s] for s in slices])
+
+    def query_radius(self, latitude, longitude, radius_km):
+        """
+        Returns (indices, distances_km) of the points within radius_km of the given
+        coordinates, nearest first.
+        """
+        indices = self.candidates(latitude, longitude, radius_km)
+        distances = haversine_km(latitude, longitude, self.latitudes[indices], self.longitudes[indices])
+        within = distances <= radius_km
+        indices, distances = indices[within], distances[within]
+        order = np.argsort(distances, kind="stable")
+        return indices[order], distances[order]
+
+
+def normalise_suburb(suburb):
+    return " ".join(str(suburb).split()).casefold()
+
+
+class PostcodeIndex:
+    def __init__(self, postcodes):
+        postcodes = postcodes.dropna(subset=["latitude", "longitude"]).copy()
+        postcodes["postcode"] = postcodes["postcode"].astype(str).str.zfill(4)
+        # Gazetteer lookups, the first row of a postcode stands in when no suburb matches
+        self.by_postcode = {}
+        self.by_suburb = {}
+        for postcode, suburb, latitude, longitude in postcodes[["postcode", "suburb", "latitude", "longitude"]].itertuples(index=False, name=None):
+            self.by_postcode.setdefault(postcode, (latitude, longitude))
+            if suburb is not None:
+                self.by_suburb.setdefault((postcode, normalise_suburb(suburb)), (latitude, longitude))
+        # One representative suburb per postcode, as the postcode lookups always returned
+        self.postcodes = postcodes.drop_duplicates(subset="postcode", keep="first").reset_index(drop=True)
+        self.grid = GridIndex(self.postcodes["latitude"], self.postcodes["longitude"])
+        # Plain records, so a query never goes back through pandas
+        self.records = self.postcodes.to_dict("records")
+
+    @classmethod
+    def from_db(cls, postcode_db_path):
+        conn = connect(postcode_db_path, read_only=True)
+        try:
+            postcodes = pd.read_sql_query("SELECT postcode, suburb, latitude, longitude FROM postcodes", conn)
+        finally:
+            conn.close()
+        return cls(postcodes)
+
+    def coordinates(self, postcode, suburb=None):
+        postcode = str(postcode).strip().zfill(4)
+        if suburb:
+            coordinates = self.by_suburb.get((postcode, normalise_suburb(suburb)))
+            if coordinates:
+                return coordinates
+        return self.by_postcode.get(postcode)
+
+    def nearby(self, latitude, longitude, radius_km):
+        indices, distances = self.grid.query_radius(latitude, longitude, radius_km)
+        return [
+            {**self.records[index], "distance_km": distance}
+            for index, distance in zip(indices.tolist(), distances.tolist())
+        ]
+
+
+_postcode_indexes = {}
+_postcode_indexes_lock = threading.Lock()
+
+def postcode_index(postcode_db_path):
+    """
+    Returns the process-wide PostcodeIndex for a postcode database, rebuilding it
+    when the file has been modified since it was loaded.
+    """
+    mtime = os.path.getmtime(postcode_db_path)
+    with _postcode_indexes_lock:
+        cached = _postcode_indexes.get(postcode_db_path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, PostcodeIndex.from_db(postcode_db_path))
+            _postcode_indexes[postcode_db_path] = cached
+        return cached[1]
+
+
+class StationIndex:
+    def __init__(self, stations):
+        self.stations = stations.dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+        self.grid = GridIndex(self.stations["latitude"], self.stations["longitude"])
+
+    @classmethod
+    def from_conn(cls, conn):
+        stations = pd.read_sql_query("""
+        SELECT station_code, name, address, postcode, latitude, longitude
+        FROM stations
+        """, conn)
+        return cls(stations)
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Returns the stations within radius_km of the given coordinates as a
+        DataFrame with a distance_km column, nearest first.
+        """
+        indices, distances = self.grid.query_radius(latitude, longitude, radius_km)
+        nearby_df = self.stations.iloc[indices].reset_index(drop=True)
+        nearby_df["distance_km"] = distances
+        return nearby_df
+
+
+_station_indexes = {}
+_station_indexes_lock = threading.Lock()
+
+def stations_generation(conn):
+    row = conn.execute("SELECT value FROM generations WHERE name = 'stations'").fetchone()
+    return row[0] if row else 0
+
+def station_index(conn, db_path):
+    """
+    Returns the process-wide StationIndex for a fuel prices database, rebuilding it
+    when ingest has changed the stations table since it was loaded.
+    """
+    generation = stations_generation(conn)
+    with _station_indexes_lock:
+        cached = _station_indexes.get(db_path)
+        if cached is None or cached[0] != generation:
+            cached = (generation, StationIndex.from_conn(conn))
+            _station_indexes[db_path] = cached
+        return cached[1]
@@ -0,0 +1,98 @@
+"""
+Moves closed months of raw price history out of SQLite into columnar cold storage.
+
+Each (fuel type, month) lands in its own Parquet file:
+
+    {cold_storage_path}/fuel_type={fuel_type}/{YYYY-MM}.parquet
+
+DatabaseR reads these files alongside the hot prices table and skips any file
+outside the requested date range. price_daily and current_prices stay in SQLite,
+so averages and newest-price lookups never touch the cold tier. The newest row of
+each series is never moved, so a re-sent snapshot row is still recognised as stored.
+
+Usage:
+    python tier.py [months_to_keep_hot]
+"""
+import os
+import sys
+from datetime import datetime, timezone
+import pandas as pd
+from dotenv import load_dotenv
+try:
+    from .connection import connect
+except ImportError:
+    from connection import connect
+
+PRICE_COLUMNS = ["station_code", "fuel_type", "price", "timestamp"]
+
+def month_start(year, month):
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+def add_months(year, month, count):
+    index = year * 12 + (month - 1) + count
+    return index // 12, index % 12 + 1
+
+def partition_path(cold_storage_path, fuel_type, month):
+    return os.path.join(cold_storage_path, f"fuel_type={fuel_type}", f"{month}.parquet")
+
+def partition_bounds(month):
+    # [start, end) epoch bounds of a YYYY-MM partition
+    year, month = (int(part) for part in month.split("-"))
+    return month_start(year, month), month_start(*add_months(year, month, 1))
+
+def closed_months(conn, before):
+    rows = conn.execute("""
+    SELECT DISTINCT fuel_type, strftime('%Y-%m', timestamp, 'unixepoch') AS month
+    FROM prices
+    WHERE timestamp < ?
+    ORDER BY month, fuel_type
+    """, (before,)).fetchall()
+    return rows
+
+def write_partition(path, df):
+    # Merging with an existing file keeps re-runs after a crash idempotent
+    if os.path.exists(path):
+        df = pd.concat([pd.read_parquet(path), df], ignore_index=True)
+        df = df.drop_duplicates(subset=["station_code", "fuel_type", "timestamp"], keep="last")
+    df = df.sort_values(["timestamp", "station_code"]).reset_index(drop=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def tier_closed_months(conn, cold_storage_path, months_to_keep_hot=1, now=None):
+    now = now or datetime.now(timezone.utc)
+    before = month_start(*add_months(now.year, now.month, 1 - months_to_keep_hot))
+    moved = 0
+    for fuel_type, month in closed_months(conn, before):
+        start, end = partition_bounds(month)
+        selection = """
+        FROM prices
+        WHERE fuel_type = ? AND timestamp >= ? AND timestamp < ?
+        AND NOT EXISTS (
+            SELECT 1 FROM current_prices
+            WHERE current_prices.station_code = prices.station_code
+            AND current_prices.fuel_type = prices.fuel_type
+            AND current_prices.timestamp = prices.timestamp
+        )
+        """
+        params = (fuel_type, start, end)
+        df = pd.read_sql_query(f"SELECT {', '.join(PRICE_COLUMNS)} {selection}", conn, params=params)
+        if df.empty:
+            continue
+        # The file is complete before the rows leave SQLite, readers dedupe any overlap
+        write_partition(partition_path(cold_storage_path, fuel_type, month), df)
+        with conn:
+            moved += conn.execute(f"DELETE {selection}", params).rowcount
+    return moved
+
+def main():
+    load_dotenv()
+    months_to_keep_hot = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    conn = connect(os.getenv("DB_PATH"))
+    moved = tier_closed_months(conn, os.getenv("COLD_STORAGE_PATH"), months_to_keep_hot)
+    print(f"Moved {moved} price rows to cold storage.")
+    conn.close()
+
+if __name__ == "__main__":
+    main()